@@ -1,13 +1,15 @@
 # api/admin.py
 
-import json
+import orjson
 from pathlib import Path
+from typing import Optional, Tuple
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 from .auth.utils import get_current_user  # je bestaande auth
 
-router = APIRouter(prefix="/admin", tags=["admin"])
+router = APIRouter(prefix="/admin", tags=["admin"], default_response_class=ORJSONResponse)
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 ADMIN_SETTINGS_PATH = BASE_DIR / "data" / "memory" / "admin_settings.json"
@@ -19,19 +21,33 @@ class AdminSettings(BaseModel):
   websearch_enabled: bool = True
 
 
+# (st_mtime_ns, settings) van de laatst gelezen/geschreven versie
+_cache: Optional[Tuple[int, AdminSettings]] = None
+
+
 def _load_settings() -> AdminSettings:
-  if not ADMIN_SETTINGS_PATH.exists():
+  global _cache
+  try:
+    st = ADMIN_SETTINGS_PATH.stat()
+  except FileNotFoundError:
     return AdminSettings()
-  data = json.loads(ADMIN_SETTINGS_PATH.read_text(encoding="utf-8"))
-  return AdminSettings(**data)
+
+  if _cache is not None and _cache[0] == st.st_mtime_ns:
+    return _cache[1]
+
+  data = orjson.loads(ADMIN_SETTINGS_PATH.read_bytes())
+  settings = AdminSettings(**data)
+  _cache = (st.st_mtime_ns, settings)
+  return settings
 
 
 def _save_settings(settings: AdminSettings) -> None:
+  global _cache
   ADMIN_SETTINGS_PATH.parent.mkdir(parents=True, exist_ok=True)
-  ADMIN_SETTINGS_PATH.write_text(
-    settings.model_dump_json(indent=2, ensure_ascii=False),
-    encoding="utf-8",
+  ADMIN_SETTINGS_PATH.write_bytes(
+    orjson.dumps(settings.model_dump(), option=orjson.OPT_INDENT_2)
   )
+  _cache = (ADMIN_SETTINGS_PATH.stat().st_mtime_ns, settings)
 
 
 @router.get("/settings", response_model=AdminSettings)
@@ -1,11 +1,18 @@
 # api/auth/routes.py
-from fastapi import APIRouter, HTTPException, status, Header, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Request
 from pydantic import BaseModel, EmailStr, ValidationError
 from typing import Optional, Dict
-from datetime import datetime, timedelta
-from jose import jwt, JWTError
+import jwt  # PyJWT
+from jwt import InvalidTokenError as JWTError
+from cachetools import TTLCache
+from passlib.context import CryptContext
+import asyncio
+import hashlib
 import os
-from types import SimpleNamespace
+import sys
+import time
+from dataclasses import dataclass
+from functools import lru_cache
 from urllib.parse import parse_qs
 
 router = APIRouter()
@@ -18,25 +25,73 @@ AUTH_SECRET = os.getenv(
 ALGO = "HS256"
 ACCESS_MIN = 60 * 24  # 24 uur
 
+
+# Gedecodeerde tokens kort bewaren: zelfde client -> geen nieuwe jwt.decode
+# Key = sha256(token)[:16], alleen geldige tokens komen erin.
+_TOKEN_CACHE: TTLCache = TTLCache(maxsize=4096, ttl=30)
+
+# Vaste 401-excepties voor de token-checks (geen allocatie per mislukte
+# request); raise via .with_traceback(None) zodat er geen traceback-keten aangroeit.
+_MISSING_TOKEN = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing token")
+_INVALID_TOKEN = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+_INVALID_PAYLOAD = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+_NO_USER = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
+pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=12)
+
+def _email_key(email: str) -> str:
+    """Emails case-insensitive + geïnterned als dict-key voor _users."""
+    return sys.intern(email.strip().lower())
+
+
+# DEMO-wachtwoord van de seed-users – NIET voor productie
+_DEMO_PASSWORD = "Test1234!"
+
+
+@lru_cache(maxsize=1)
+def _demo_pwd_hash() -> str:
+    # lazy: bcrypt (12 rounds) pas bij de eerste login, niet bij import
+    return pwd_ctx.hash(_DEMO_PASSWORD)
+
+
 # === In-memory storage (demo users) ===
+# Wachtwoorden alleen als bcrypt-hash; pwd_hash None = demo-wachtwoord (lazy gehasht)
 _users: Dict[str, Dict] = {
-    "richard@test.com": {
+    _email_key("richard@test.com"): {
         "id": 1,
         "name": "Richard",
         "email": "richard@test.com",
-        # DEMO: plaintext password – NIET voor productie
-        "password": "Test1234!",
+        "pwd_hash": None,
     },
-    "richard@example.com": {
+    _email_key("richard@example.com"): {
         "id": 2,
         "name": "Richard",
         "email": "richard@example.com",
         # zelfde wachtwoord voor het gemak
-        "password": "Test1234!",
+        "pwd_hash": None,
     },
 }
 
+
+def _check_password(user: Optional[Dict], password: str) -> bool:
+    """
+    bcrypt-check (CPU-bound, ~250 ms): alleen via asyncio.to_thread aanroepen.
+    Onbekende user -> dummy_verify: zelfde kosten, geen timing-verschil.
+    """
+    if user is None:
+        pwd_ctx.dummy_verify()
+        return False
+    return pwd_ctx.verify(password, user["pwd_hash"] or _demo_pwd_hash())
+
 # === Schemas ===
+@dataclass(slots=True, frozen=True)
+class CurrentUser:
+    """Ingelogde gebruiker zoals endpoints hem via get_current_user krijgen."""
+    id: int
+    name: str
+    email: str
+
+
 class RegisterIn(BaseModel):
     name: str
     email: EmailStr
@@ -56,22 +111,34 @@ class TokenOut(BaseModel):
 # === Helpers ===
 def create_token(payload: dict, minutes: int = ACCESS_MIN) -> str:
     to_encode = payload.copy()
-    to_encode["exp"] = datetime.utcnow() + timedelta(minutes=minutes)
+    to_encode["exp"] = int(time.time()) + minutes * 60
     return jwt.encode(to_encode, AUTH_SECRET, algorithm=ALGO)
 
 
 def decode_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()[:16]
+    cached = _TOKEN_CACHE.get(key)
+    if cached is not None and cached.get("exp", 0) > time.time():
+        return cached
+
     try:
-        return jwt.decode(token, AUTH_SECRET, algorithms=[ALGO])
+        payload = jwt.decode(
+            token,
+            AUTH_SECRET,
+            algorithms=[ALGO],
+            # email bewust niet in "require": ontbrekende email blijft
+            # "Invalid token payload" (zie _user_from_claims)
+            options={"require": ["exp"]},
+        )
     except JWTError:
         # ❌ Geen demo-fallback meer: gewoon 401
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token",
-        )
+        raise _INVALID_TOKEN.with_traceback(None) from None
 
+    _TOKEN_CACHE[key] = payload
+    return payload
 
-def get_user_from_bearer(authorization: Optional[str]) -> Dict:
+
+def _token_from_header(authorization: Optional[str]) -> str:
     """
     Ondersteunt:
     - 'Bearer <token>'
@@ -79,48 +146,53 @@ def get_user_from_bearer(authorization: Optional[str]) -> Dict:
     """
 
     if not authorization:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing token",
-        )
+        raise _MISSING_TOKEN.with_traceback(None)
 
+    # strip() geeft hetzelfde object terug als er niets te strippen valt;
+    # alleen de 7-char prefix lowercasen i.p.v. de hele token
     auth = authorization.strip()
-    if auth.lower().startswith("bearer "):
-        token = auth.split(" ", 1)[1].strip()
+    if len(auth) > 7 and auth[:7].lower() == "bearer ":
+        token = auth[7:].lstrip()
     else:
         token = auth
 
     if not token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing token",
-        )
+        raise _MISSING_TOKEN.with_traceback(None)
+
+    return token
+
 
-    data = decode_token(token)
+def _user_from_claims(data: dict) -> Dict:
     email = data.get("email")
 
     if not email:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload",
-        )
+        raise _INVALID_PAYLOAD.with_traceback(None)
 
-    user = _users.get(email)
+    user = _users.get(_email_key(email))
     if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-        )
+        raise _NO_USER.with_traceback(None)
 
     return user
 
 
+def get_user_from_bearer(authorization: Optional[str]) -> Dict:
+    return _user_from_claims(decode_token(_token_from_header(authorization)))
+
+
+# Sub-dependency: FastAPI cachet het resultaat per request,
+# dus alle deps in dezelfde request delen één decode.
+async def _decoded_claims(
+    authorization: Optional[str] = Header(None),
+) -> dict:
+    return decode_token(_token_from_header(authorization))
+
+
 # Dependency – voor /dashboard, /me, etc.
 async def get_current_user(
-    authorization: Optional[str] = Header(None),
-) -> SimpleNamespace:
-    user = get_user_from_bearer(authorization)
-    return SimpleNamespace(
+    claims: dict = Depends(_decoded_claims),
+) -> CurrentUser:
+    user = _user_from_claims(claims)
+    return CurrentUser(
         id=int(user["id"]), name=str(user["name"]), email=user["email"]
     )
 
@@ -128,14 +200,15 @@ async def get_current_user(
 # === Routes ===
 @router.post("/register", summary="Register")
 def register(inp: RegisterIn):
-    if inp.email in _users:
+    key = _email_key(inp.email)
+    if key in _users:
         raise HTTPException(status_code=409, detail="User exists")
 
-    _users[inp.email] = {
+    _users[key] = {
         "id": len(_users) + 1,
         "name": inp.name,
         "email": inp.email,
-        "password": inp.password,
+        "pwd_hash": pwd_ctx.hash(inp.password),
     }
     return {"ok": True}
 
@@ -145,30 +218,30 @@ async def _login_core(request: Request) -> TokenOut:
     Gedeelde login-logica voor /login en /auth/login
     """
     content_type = (request.headers.get("content-type") or "").lower()
-    raw = (await request.body()).decode(errors="ignore")
-
-    data: Dict[str, str] = {}
 
-    if "application/json" in content_type:
+    # Eén parse per request: JSON of urlencoded form
+    data: Dict[str, str]
+    if content_type.startswith("application/json"):
         data = await request.json()
     else:
-        parsed = parse_qs(raw)
-        data = {k: v[0] for k, v in parsed.items()}
+        raw = await request.body()
+        data = {k: v[0] for k, v in parse_qs(raw.decode("utf-8", errors="ignore")).items()}
 
     # username -> email fallback
     if "email" not in data and "username" in data:
         data["email"] = data["username"]
 
     try:
-        inp = LoginIn(**data)
+        inp = LoginIn.model_validate(data)
     except ValidationError:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail="Invalid login fields",
         )
 
-    user = _users.get(inp.email)
-    if not user or user["password"] != inp.password:
+    user = _users.get(_email_key(inp.email))
+    # bcrypt in een thread: de event loop blijft vrij tijdens de hash
+    if not await asyncio.to_thread(_check_password, user, inp.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -196,6 +269,6 @@ async def login_compat(request: Request):
 
 
 @router.get("/me")
-def me(authorization: Optional[str] = Header(None)):
-    u = get_user_from_bearer(authorization)
+def me(claims: dict = Depends(_decoded_claims)):
+    u = _user_from_claims(claims)
     return {"id": u["id"], "name": u["name"], "email": u["email"]}
@@ -2,16 +2,19 @@
 
 from __future__ import annotations
 
+import orjson
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, List, Any
-from datetime import datetime
+
+from api.timeutil import now_iso
 
 # ✅ Auth – zelfde als dashboard/memory
 try:
-    from api.auth.routes import get_current_user
+    from api.auth.routes import CurrentUser, get_current_user
 except ImportError:  # fallback
-    from auth.routes import get_current_user  # type: ignore
+    from auth.routes import CurrentUser, get_current_user  # type: ignore
 
 # ✅ Model-router: Loesoe’s GPT-antwoord
 try:
@@ -33,11 +36,20 @@ except Exception:
 
 # ✅ NIEUW: behavior scoring engine (20C)
 try:
-    from modules.zelflerend.scoring import score_message
+    from modules.zelflerend.scoring import score_message, message_features as _features
 except Exception:
     # Fallback zodat chat niet crasht als scoring ontbreekt
-    def score_message(message: str, history: Optional[List[str]] = None) -> Dict[str, Any]:
+    def _features(message: str) -> Dict[str, Any]:
         text = message or ""
+        lower = text.lower()
+        return {"length": len(text), "lower": lower, "words": lower.split()}
+
+    def score_message(
+        message: str,
+        history: Optional[List[str]] = None,
+        features: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        features = features or _features(message)
         return {
             "version": 0,
             "emotion": {
@@ -58,42 +70,18 @@ except Exception:
                 "risk": 0.0,
             },
             "raw": {
-                "length": len(text),
-                "word_count": len(text.split()),
-                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "length": features["length"],
+                "word_count": len(features["words"]),
+                "timestamp": now_iso(),
             },
         }
 
-# ✅ Helpers uit api.memory – zodat we hetzelfde pad/format gebruiken
+# ✅ Eén write-behind voor zelfleren.json (api.memory.behavior), gedeeld met
+# /memory/selflearning/update
 try:
-    from api.memory import (
-        ZELFLEREN_PATH,
-        _default_selflearn,
-        _load_json,
-        _save_json,
-        _get_or_create_selflearn_user,
-        _apply_scores_to_user_block,
-    )
+    from api.memory.behavior import record_behavior_scores
 except ImportError:
-    ZELFLEREN_PATH = None
-
-    def _default_selflearn() -> Dict[str, Any]:
-        return {"version": 1, "users": {}}
-
-    def _load_json(path, default=None) -> Dict[str, Any]:
-        return default or {"version": 1, "users": {}}
-
-    def _save_json(path, data: Dict[str, Any]) -> None:
-        return None
-
-    def _get_or_create_selflearn_user(data: Dict[str, Any], user_id: int) -> Dict[str, Any]:
-        users = data.setdefault("users", {})
-        uid = str(user_id)
-        users.setdefault(uid, {})
-        return users[uid]
-
-    def _apply_scores_to_user_block(user_block: Dict[str, Any], scores: Dict[str, Any]) -> None:
-        return None
+    record_behavior_scores = None
 
 
 # ✅ NIEUW: last_session-helper voor Slimheidsmeter V2 usage-score
@@ -123,9 +111,11 @@ except Exception:
         return None
 
 
+# ChatResponse (met geneste scores/analysis) in één orjson.dumps
 router = APIRouter(
     prefix="/chat",
     tags=["chat"],
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -140,32 +130,26 @@ class ChatResponse(BaseModel):
 
 
 def _run_analysis(message: str, user_id: Optional[int]) -> Optional[Dict[str, Any]]:
-    """Oude analyse-module (20A/20B)."""
+    """
+    Oude analyse-module (20A/20B).
+    Geeft een eigen (vers) dict terug: de caller mag het aanpassen.
+    """
     if _analyse_bericht is None:
         return None
     try:
-        return _analyse_bericht(message=message, user_id=user_id)
+        result = _analyse_bericht(message=message, user_id=user_id)
     except Exception:
         return None
+    return result if isinstance(result, dict) else None
 
 
 def _update_behavior_memory(user_id: Optional[int], scores: Dict[str, Any]) -> None:
-    """Schrijf behavior-scores weg naar zelfleren.json voor deze user."""
-    if ZELFLEREN_PATH is None or user_id is None:
+    """Behavior-scores via de write-behind van api.memory.behavior naar zelfleren.json."""
+    if record_behavior_scores is None or user_id is None:
         return
 
     try:
-        data = _load_json(ZELFLEREN_PATH, _default_selflearn())
-        user_block = _get_or_create_selflearn_user(data, user_id)
-
-        # bestaande helper uit api.memory doet al:
-        # - behavior_log append
-        # - emotion/intent counters
-        # - behavior_summary updaten
-        _apply_scores_to_user_block(user_block, scores)
-
-        user_block["last_updated"] = datetime.utcnow().isoformat() + "Z"
-        _save_json(ZELFLEREN_PATH, data)
+        record_behavior_scores(user_id, scores)
     except Exception:
         # Geen harde crash als geheugen stuk is
         pass
@@ -175,7 +159,7 @@ def _update_behavior_memory(user_id: Optional[int], scores: Dict[str, Any]) -> N
 @router.post("/send", response_model=ChatResponse)
 async def chat_endpoint(
     req: ChatRequest,
-    current_user=Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     """
     Centrale chat-endpoint.
@@ -194,7 +178,7 @@ async def chat_endpoint(
     if not current_user:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    user_id = getattr(current_user, "id", None)
+    user_id = current_user.id
 
     user_message = (req.message or "").strip()
     if not user_message:
@@ -203,18 +187,20 @@ async def chat_endpoint(
     # 1️⃣ Oude analyse-laag (mag ook None zijn)
     analysis = _run_analysis(user_message, user_id)
 
-    # 2️⃣ NIEUW: behavior scoring op dit bericht
-    scores = score_message(user_message, history=None)
+    # 2️⃣ NIEUW: behavior scoring op dit bericht (features één keer berekend)
+    features = _features(user_message)
+    scores = score_message(user_message, history=None, features=features)
 
     # 3️⃣ Wegschrijven naar zelflerend geheugen
     _update_behavior_memory(user_id, scores)
 
     # 4️⃣ Analysis verrijken met behavior_scores
+    #    (analysis is van ons, dus in-place i.p.v. kopie)
     if analysis is None:
         combined_analysis: Optional[Dict[str, Any]] = {"behavior_scores": scores}
     else:
-        combined_analysis = dict(analysis)
-        combined_analysis["behavior_scores"] = scores
+        analysis["behavior_scores"] = scores
+        combined_analysis = analysis
 
     # 5️⃣ GPT-antwoord via model_router
     history: List[Dict[str, str]] = []  # later kun je hier echte chatgeschiedenis doorgeven
@@ -1,10 +1,12 @@
 # api/chat_logger.py
 
-import json
+import asyncio
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
+
+import orjson
 
 # Standaard pad binnen de container
 DEFAULT_LOG_DIR = "/app/logboek/chat_history"
@@ -12,23 +14,107 @@ DEFAULT_LOG_DIR = "/app/logboek/chat_history"
 LOG_DIR = Path(os.getenv("LOESOE_CHAT_LOG_DIR", DEFAULT_LOG_DIR))
 LOG_FILE = LOG_DIR / "chat_history.jsonl"
 
+# Write-behind: requests zetten alleen bytes in de queue,
+# één writer-task houdt het bestand open en schrijft (in een thread).
+# Queue vol -> regel droppen en tellen (nooit naast de writer schrijven).
+_QUEUE_MAX = 10000
+_queue: Optional[asyncio.Queue] = None
+_writer_task: Optional[asyncio.Task] = None
+_dropped = 0
+
+
+def _encode(entry: Dict[str, Any]) -> bytes:
+    # orjson: UTF-8 bytes + newline in één keer, datetime als ...Z
+    return orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_UTC_Z)
+
+
+def _write_direct(line: bytes) -> None:
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    with LOG_FILE.open("ab") as f:
+        f.write(line)
+
+
+async def _writer(queue: asyncio.Queue) -> None:
+    global _dropped
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    # ongebufferd: elke batch is één write() in een thread, er blijft niets in
+    # een buffer hangen (een directe write zonder loop kan er dus niet tussen vallen)
+    with LOG_FILE.open("ab", buffering=0) as f:
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await asyncio.to_thread(f.write, b"".join(batch))
+            except Exception as e:
+                print(f"[chat_logger] Failed to write chat log: {e}")
+            finally:
+                for _ in batch:
+                    queue.task_done()
+            if _dropped:
+                print(f"[chat_logger] {_dropped} chat log line(s) dropped (queue full)")
+                _dropped = 0
+
+
+def _ensure_writer() -> Optional[asyncio.Queue]:
+    """
+    Start de writer-task op de draaiende event loop (eenmalig).
+    Zonder event loop (scripts/tests) -> None, dan schrijven we direct.
+    """
+    global _queue, _writer_task
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+    if _writer_task is None or _writer_task.done() or _writer_task.get_loop() is not loop:
+        _queue = asyncio.Queue(maxsize=_QUEUE_MAX)
+        _writer_task = loop.create_task(_writer(_queue))
+    return _queue
+
+
+async def close_chat_log() -> None:
+    """
+    Bij shutdown: wachtende regels wegschrijven en writer stoppen.
+    """
+    global _queue, _writer_task
+    if _writer_task is None:
+        return
+    if _queue is not None and not _writer_task.done():
+        await _queue.join()
+    _writer_task.cancel()
+    try:
+        await _writer_task
+    except asyncio.CancelledError:
+        pass
+    _queue = None
+    _writer_task = None
+
 
 def log_chat(message: str, reply: str, meta: Dict[str, Any] | None = None) -> None:
     """
     Log één chat-bericht als JSON-regel in chat_history.jsonl
+    (via de writer-queue; direct schrijven als er geen loop is, droppen als de queue vol zit)
     """
+    global _dropped
     try:
-        LOG_DIR.mkdir(parents=True, exist_ok=True)
-
         entry = {
-            "ts": datetime.utcnow().isoformat() + "Z",
+            "ts": datetime.now(timezone.utc),
             "message": message,
             "reply": reply,
             "meta": meta or {},
         }
+        line = _encode(entry)
+
+        queue = _ensure_writer()
+        if queue is None:
+            _write_direct(line)
+            return
 
-        with LOG_FILE.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        try:
+            queue.put_nowait(line)
+        except asyncio.QueueFull:
+            _dropped += 1
 
     except Exception as e:
         # Fout bij loggen mag de API nooit laten crashen
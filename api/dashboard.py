@@ -1,20 +1,32 @@
 # api/dashboard.py
 
-from datetime import datetime
 from pathlib import Path
-import json
+import asyncio
 import os
+import time
+
+import orjson
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy import text
 
+from api.timeutil import now_iso
+
 # ✅ JWT: altijd via get_current_user (géén demo-user in dit bestand)
 try:
-    from api.auth.routes import get_current_user
+    from api.auth.routes import CurrentUser, get_current_user
 except ImportError:
-    from auth.routes import get_current_user  # fallback voor lokale runs
+    from auth.routes import CurrentUser, get_current_user  # fallback voor lokale runs
+
+# ✅ DB: hergebruik de gedeelde async engine (geen engine per request)
+try:
+    from api.database import engine as _engine
+except Exception as e:
+    # api.database gooit bij import als DATABASE_URL ontbreekt / geen +asyncpg
+    print(f"[warn] api.database engine niet geladen: {e.__class__.__name__}: {e}")
+    _engine = None
 
 # 🔁 Fase 20 – Zelflerend geheugen / Slimheidsmeter v2
 try:
@@ -40,7 +52,10 @@ except Exception as e:
     calculate_slimheidsmeter = None
 
 # ➜ /dashboard
-router = APIRouter(prefix="/dashboard", tags=["dashboard"])
+# responses via orjson i.p.v. json.dumps
+router = APIRouter(
+    prefix="/dashboard", tags=["dashboard"], default_response_class=ORJSONResponse
+)
 
 DATA_DIR = Path("data") / "memory"
 ZELFLEREN_PATH = DATA_DIR / "zelfleren.json"
@@ -63,18 +78,13 @@ class DashboardPayload(BaseModel):
     self_learning: dict | None = None  # Fase 20 blok
 
 
-def file_exists(p: Path) -> bool:
-    try:
-        return p.exists()
-    except Exception:
-        return False
-
-
 def load_json(p: Path) -> dict | None:
-    if not file_exists(p):
-        return None
+    # direct openen: geen aparte exists()-check (scheelt een stat per read)
     try:
-        return json.loads(p.read_text(encoding="utf-8"))
+        with p.open("rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
     except Exception:
         return None
 
@@ -95,7 +105,7 @@ def calculate_slimheid(modules: list[ModuleStatus]) -> float:
     return round((score / max_score) * 100.0, 1)
 
 
-def _build_self_learning_block(current_user) -> dict | None:
+def _build_self_learning_block(user_id: int) -> dict | None:
     """
     Bouwt het zelflerend-blok voor het dashboard, op basis van:
     - modules/zelflerend/analyse.py (globale scores)
@@ -124,7 +134,6 @@ def _build_self_learning_block(current_user) -> dict | None:
             "patterns": {},
         }
 
-    user_id = getattr(current_user, "id", 1)
     uid = str(user_id)
 
     user_scores = summary.get("user_scores", {}) or {}
@@ -149,20 +158,17 @@ def _build_self_learning_block(current_user) -> dict | None:
     }
 
 
-@router.get("", response_model=DashboardPayload)
-async def get_dashboard(current_user=Depends(get_current_user)):
+def _probe_static_modules() -> tuple[list[ModuleStatus], list[ModuleStatus]]:
     """
-    Dashboard is ALLEEN bereikbaar met geldige JWT.
-    Geen demo-fallback meer in dit bestand.
+    Module-checks die tijdens de levensduur van het proces niet veranderen
+    (bestanden in api/, uploads-map). Eenmalig bij import uitgevoerd.
+    Return: (modules vóór database_conn, modules erna) – volgorde blijft gelijk.
     """
-    if not current_user:
-        # zou eigenlijk nooit gebeuren: get_current_user hoort al 401 te gooien
-        raise HTTPException(status_code=401, detail="Unauthorized")
-
-    modules: list[ModuleStatus] = []
+    head: list[ModuleStatus] = []
+    tail: list[ModuleStatus] = []
 
     # --- AUTH ---
-    modules.append(
+    head.append(
         ModuleStatus(
             key="auth",
             status="ok",
@@ -172,48 +178,17 @@ async def get_dashboard(current_user=Depends(get_current_user)):
 
     # --- DATABASE FILE ---
     db_file = Path("api/database.py")
-    modules.append(
+    head.append(
         ModuleStatus(
             key="database",
-            status="ok" if file_exists(db_file) else "warn",
+            status="ok" if os.path.exists(db_file) else "warn",
             note="Async engine aanwezig in api/database.py",
         )
     )
 
-    # --- DATABASE CONNECTION ---
-    try:
-        db_url = os.getenv("DATABASE_URL")
-        if db_url:
-            engine = create_async_engine(db_url, echo=False, future=True)
-            async with engine.connect() as conn:
-                await conn.execute(text("SELECT 1"))
-            modules.append(
-                ModuleStatus(
-                    key="database_conn",
-                    status="ok",
-                    note="DB connectie OK",
-                )
-            )
-        else:
-            modules.append(
-                ModuleStatus(
-                    key="database_conn",
-                    status="warn",
-                    note="Geen DATABASE_URL gevonden",
-                )
-            )
-    except Exception as e:
-        modules.append(
-            ModuleStatus(
-                key="database_conn",
-                status="warn",
-                note=f"DB probe error: {e.__class__.__name__}",
-            )
-        )
-
     # --- STREAMING ---
     sse_exists = any("stream" in p.name.lower() for p in Path("api").glob("*.py"))
-    modules.append(
+    tail.append(
         ModuleStatus(
             key="streaming",
             status="ok" if sse_exists else "warn",
@@ -223,8 +198,8 @@ async def get_dashboard(current_user=Depends(get_current_user)):
 
     # --- UPLOADS ---
     uploads_file = Path("api/uploads.py")
-    if not file_exists(uploads_file):
-        modules.append(
+    if not os.path.exists(uploads_file):
+        tail.append(
             ModuleStatus(
                 key="uploads",
                 status="off",
@@ -233,7 +208,7 @@ async def get_dashboard(current_user=Depends(get_current_user)):
         )
     else:
         if UPLOADS_DIR.exists():
-            modules.append(
+            tail.append(
                 ModuleStatus(
                     key="uploads",
                     status="ok",
@@ -241,7 +216,7 @@ async def get_dashboard(current_user=Depends(get_current_user)):
                 )
             )
         else:
-            modules.append(
+            tail.append(
                 ModuleStatus(
                     key="uploads",
                     status="warn",
@@ -250,7 +225,7 @@ async def get_dashboard(current_user=Depends(get_current_user)):
             )
 
     # --- DASHBOARD API ---
-    modules.append(
+    tail.append(
         ModuleStatus(
             key="dashboard_api",
             status="ok",
@@ -258,8 +233,159 @@ async def get_dashboard(current_user=Depends(get_current_user)):
         )
     )
 
+    return head, tail
+
+
+_STATIC_MODULES_HEAD, _STATIC_MODULES_TAIL = _probe_static_modules()
+
+# Resultaat van de laatste DB-ping: (monotonic ts, status). Bursts delen één ping.
+DB_PROBE_TTL_SECONDS = 5.0
+_db_probe_cache: tuple[float, ModuleStatus] | None = None
+
+
+async def _probe_database_conn() -> ModuleStatus:
+    global _db_probe_cache
+
+    now = time.monotonic()
+    if _db_probe_cache is not None and now - _db_probe_cache[0] < DB_PROBE_TTL_SECONDS:
+        return _db_probe_cache[1]
+
+    if _engine is None:
+        result = ModuleStatus(
+            key="database_conn",
+            status="warn",
+            note="Geen (postgresql+asyncpg) DATABASE_URL gevonden",
+        )
+    else:
+        try:
+            async with _engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            result = ModuleStatus(
+                key="database_conn",
+                status="ok",
+                note="DB connectie OK",
+            )
+        except Exception as e:
+            result = ModuleStatus(
+                key="database_conn",
+                status="warn",
+                note=f"DB probe error: {e.__class__.__name__}",
+            )
+
+    _db_probe_cache = (now, result)
+    return result
+
+
+# =========================
+# last_session.json (write-behind)
+# =========================
+# De state leeft in geheugen; schrijven gebeurt hooguit 1x per
+# LAST_SESSION_FLUSH_SECONDS. Schrijft iemand anders het bestand
+# (modules/last_session_helper.mark_action), dan herladen we op mtime
+# en zetten onze nog niet weggeschreven last_action-waarden er opnieuw op.
+LAST_SESSION_FLUSH_SECONDS = 5.0
+
+_last_session_state: dict | None = None
+_last_session_mtime_ns: int | None = None
+_pending_actions: dict[str, str] = {}
+_last_flush_ts: float = 0.0
+_flush_task: asyncio.Task | None = None
+
+
+def _apply_last_action(state: dict, uid: str, ts: str) -> None:
+    users = state.setdefault("users", {})
+    user_state = users.get(uid) or {}
+    user_state.setdefault("last_login", None)
+    user_state.setdefault("last_logout", None)
+    user_state["last_action"] = ts
+    users[uid] = user_state
+
+
+def _current_last_session() -> dict:
+    global _last_session_state, _last_session_mtime_ns
+
+    try:
+        mtime_ns = LAST_SESSION_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = None
+
+    if _last_session_state is None or mtime_ns != _last_session_mtime_ns:
+        state = load_json(LAST_SESSION_PATH) or {"version": 1, "users": {}}
+        for uid, ts in _pending_actions.items():
+            _apply_last_action(state, uid, ts)
+        _last_session_state = state
+        _last_session_mtime_ns = mtime_ns
+
+    return _last_session_state
+
+
+def _mark_last_action(uid: str, ts: str) -> dict:
+    state = _current_last_session()
+    _apply_last_action(state, uid, ts)
+    _pending_actions[uid] = ts
+    return state
+
+
+def flush_last_session() -> None:
+    global _last_session_mtime_ns, _last_flush_ts
+
+    if not _pending_actions:
+        return
+
+    state = _current_last_session()
+    try:
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        LAST_SESSION_PATH.write_bytes(orjson.dumps(state))
+        _last_session_mtime_ns = LAST_SESSION_PATH.stat().st_mtime_ns
+        _pending_actions.clear()
+    except Exception as e:
+        print(
+            f"[dashboard] kon last_session niet opslaan: "
+            f"{e.__class__.__name__}: {e}"
+        )
+    _last_flush_ts = time.monotonic()
+
+
+async def _flush_later() -> None:
+    global _flush_task
+    try:
+        delay = _last_flush_ts + LAST_SESSION_FLUSH_SECONDS - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        flush_last_session()
+    finally:
+        _flush_task = None
+
+
+def _schedule_last_session_flush() -> None:
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_later())
+
+
+@router.get("", response_model=DashboardPayload)
+async def get_dashboard(current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Dashboard is ALLEEN bereikbaar met geldige JWT.
+    Geen demo-fallback meer in dit bestand.
+    """
+    if not current_user:
+        # zou eigenlijk nooit gebeuren: get_current_user hoort al 401 te gooien
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    user_id = current_user.id
+    uid = str(user_id)
+
+    # Statische probes (1x bij import) + dynamische DB-probe
+    modules: list[ModuleStatus] = list(_STATIC_MODULES_HEAD)
+
+    # --- DATABASE CONNECTION ---
+    modules.append(await _probe_database_conn())
+
+    modules.extend(_STATIC_MODULES_TAIL)
+
     # --- ZELFLEREND GEHEUGEN BESTAND ---
-    if file_exists(ZELFLEREN_PATH):
+    if os.path.exists(ZELFLEREN_PATH):
         modules.append(
             ModuleStatus(
                 key="zelflerend_geheugen",
@@ -277,35 +403,11 @@ async def get_dashboard(current_user=Depends(get_current_user)):
         )
 
     # --- LAST SESSION ---
-    last_session = load_json(LAST_SESSION_PATH)
-
-    # Minimaal current_user markeren als actief
+    # Minimaal current_user markeren als actief (in-memory, write-behind)
+    last_session = None
     try:
-        state = last_session or {"version": 1, "users": {}}
-        users = state.setdefault("users", {})
-        uid = str(getattr(current_user, "id", 1))
-
-        user_state = users.get(uid) or {}
-        now_iso = datetime.utcnow().isoformat() + "Z"
-
-        user_state.setdefault("last_login", None)
-        user_state.setdefault("last_logout", None)
-        user_state["last_action"] = now_iso
-
-        users[uid] = user_state
-        last_session = state
-
-        try:
-            DATA_DIR.mkdir(parents=True, exist_ok=True)
-            LAST_SESSION_PATH.write_text(
-                json.dumps(state, indent=2, ensure_ascii=False),
-                encoding="utf-8",
-            )
-        except Exception as e:
-            print(
-                f"[dashboard] kon last_session niet opslaan: "
-                f"{e.__class__.__name__}: {e}"
-            )
+        last_session = _mark_last_action(uid, now_iso())
+        _schedule_last_session_flush()
     except Exception as e:
         print(
             f"[dashboard] last_session update failed: "
@@ -313,7 +415,7 @@ async def get_dashboard(current_user=Depends(get_current_user)):
         )
 
     # --- ZELFLEREND BLOK (FASE 20) ---
-    self_learning = _build_self_learning_block(current_user)
+    self_learning = _build_self_learning_block(user_id)
 
     # --- SLIMHEIDSMETER V2 (met fallback naar V1) ---
     if calculate_slimheidsmeter is not None and self_learning is not None:
@@ -336,12 +438,12 @@ async def get_dashboard(current_user=Depends(get_current_user)):
 
     return DashboardPayload(
         user={
-            "id": getattr(current_user, "id", 1),
-            "name": getattr(current_user, "name", "Richard"),
+            "id": user_id,
+            "name": current_user.name,
         },
         slimheidsmeter=slimheidsmeter,
         modules=modules,
         last_session=last_session,
-        updated_at=datetime.utcnow().isoformat() + "Z",
+        updated_at=now_iso(),
         self_learning=self_learning,
     )
@@ -6,6 +6,7 @@ import os
 from typing import Optional
 
 import asyncpg
+import orjson
 
 logger = logging.getLogger("loesoe.db")
 
@@ -20,6 +21,9 @@ except Exception:
     _PGVECTOR_OK = False
 
 
+_SQLA_PREFIX = "postgresql+asyncpg://"
+
+
 def _normalize_dsn(dsn: str) -> str:
     """
     asyncpg accepteert alleen:
@@ -32,29 +36,109 @@ def _normalize_dsn(dsn: str) -> str:
     Deterministisch normalizen (geen magic fallback).
     """
     dsn = (dsn or "").strip()
-    if dsn.startswith("postgresql+asyncpg://"):
-        dsn = "postgresql://" + dsn.split("postgresql+asyncpg://", 1)[1]
+    if dsn.startswith(_SQLA_PREFIX):
+        return "postgresql://" + dsn[len(_SQLA_PREFIX):]
     return dsn
 
 
+# Pool-sizing: een klein vast aantal warme connections (geen connect() bij
+# de eerste requests, maar ook niet cpu_count per uvicorn-worker open tegen
+# max_connections), max = 2*cores+1. DB_POOL_MIN / DB_POOL_MAX in .env gaan voor;
+# min wordt altijd op max geclampt.
+_CPUS = os.cpu_count() or 2
+DEFAULT_POOL_MIN = 2
+DEFAULT_POOL_MAX = max(10, _CPUS * 2 + 1)
+
+
+# asyncpg prepared-statement cache per connection (asyncpg-default 100).
+# Achter pgbouncer in transaction/statement-mode: DB_STATEMENT_CACHE_SIZE=0,
+# anders botsen de named prepared statements tussen server-connections.
+DEFAULT_STATEMENT_CACHE_SIZE = 100
+
+# HNSW recall vs latency voor vector-zoekopdrachten (zie
+# migrations/*_memory_embeddings_hnsw.sql); sessie-default via _server_settings.
+MEMORY_HNSW_EF_SEARCH = int(os.getenv("MEMORY_HNSW_EF_SEARCH", "40"))
+# ivfflat recall vs snelheid voor api/memory/retrieval.py
+# (zie migrations/*_memory_embeddings_ivfflat.sql).
+MEMORY_IVFFLAT_PROBES = int(os.getenv("MEMORY_IVFFLAT_PROBES", "10"))
+
+
+def _server_settings() -> dict[str, str]:
+    """
+    Sessie-GUCs als startup-parameters (server_settings van create_pool).
+    Een SET in _init_conn overleeft de RESET ALL niet die asyncpg doet bij
+    elke release naar de pool; startup-parameters zijn de sessie-default
+    en blijven dus staan. Achter pgbouncer: deze namen in
+    ignore_startup_parameters zetten of via ALTER ROLE ... SET regelen.
+    """
+    return {
+        "hnsw.ef_search": str(MEMORY_HNSW_EF_SEARCH),
+        "ivfflat.probes": str(MEMORY_IVFFLAT_PROBES),
+    }
+
+# False zodra één connection de pgvector-codec niet kon registreren;
+# callers sturen dan de tekst-literal i.p.v. een binaire vector.
+_vector_codec = _PGVECTOR_OK
+
+
+def vector_codec_ready() -> bool:
+    """True als vectors als list/array (binair) meegegeven kunnen worden."""
+    return _vector_codec
+
+
+# jsonb binair formaat = versie-byte 0x01 + JSON-tekst. Binair (i.p.v. text)
+# zodat de codec ook werkt voor COPY (copy_records_to_table).
+# Alleen het schrijfpad verandert: dicts/lists gaan via orjson, een str wordt
+# als al-geserialiseerde JSON doorgegeven (oude json.dumps-callers werken nog).
+def _jsonb_encode(value) -> bytes:
+    if isinstance(value, str):
+        return b"\x01" + value.encode("utf-8")
+    return b"\x01" + orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Lezen blijft zoals asyncpg standaard doet: jsonb komt terug als JSON-tekst
+# (str), dus API-responses (bijv. payload in /events/recent) houden hun vorm.
+def _jsonb_decode(data: bytes) -> str:
+    return data[1:].decode("utf-8")
+
+
 async def _init_conn(conn: asyncpg.Connection) -> None:
     """
     Wordt aangeroepen voor ELKE nieuwe connection in de pool.
-    Hier registreren we pgvector, maar alleen als het beschikbaar is.
+    - jsonb schrijven via orjson (callers geven dicts mee, geen json.dumps);
+      lezen geeft de JSON-tekst terug, net als zonder codec
+    - pgvector registreren, maar alleen als het beschikbaar is.
     """
+    global _vector_codec
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=_jsonb_encode,
+        decoder=_jsonb_decode,
+        schema="pg_catalog",
+        format="binary",
+    )
+
     if _PGVECTOR_OK and register_vector is not None:
         try:
             await register_vector(conn)  # type: ignore[misc]
             logger.info("[db] pgvector registered")
         except Exception as e:
+            _vector_codec = False
             logger.warning("[db] pgvector register failed (continuing): %s", e)
 
 
 class Database:
-    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = DEFAULT_POOL_MIN,
+        max_size: int = DEFAULT_POOL_MAX,
+        statement_cache_size: int = DEFAULT_STATEMENT_CACHE_SIZE,
+    ):
         self.dsn = _normalize_dsn(dsn)
         self.min_size = min_size
         self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
         self.pool: Optional[asyncpg.pool.Pool] = None
 
     async def connect(self) -> None:
@@ -80,9 +164,18 @@ class Database:
             min_size=self.min_size,
             max_size=self.max_size,
             command_timeout=60,
+            max_inactive_connection_lifetime=600,
+            max_queries=50000,
+            statement_cache_size=self.statement_cache_size,
+            server_settings=_server_settings(),
             init=_init_conn,
         )
-        logger.info("[db] pool ready (min=%s max=%s)", self.min_size, self.max_size)
+        logger.info(
+            "[db] pool ready (min=%s max=%s statement_cache=%s)",
+            self.min_size,
+            self.max_size,
+            self.statement_cache_size,
+        )
 
     async def close(self) -> None:
         """
@@ -116,29 +209,44 @@ async def init_database(
     dsn: Optional[str] = None,
     min_size: Optional[int] = None,
     max_size: Optional[int] = None,
+    statement_cache_size: Optional[int] = None,
 ) -> Database:
     """
     Initialiseer (eenmalig) het globale Database-object + bouw de pool.
-    .env blijft leidend.
+    .env blijft leidend (bij elke call gelezen; expliciete argumenten gaan voor).
     """
     global _db
 
-    if dsn is None:
-        dsn = os.getenv("DATABASE_URL", "").strip()
-    dsn = _normalize_dsn(dsn)
+    dsn = _normalize_dsn(os.getenv("DATABASE_URL", "") if dsn is None else dsn)
 
     if min_size is None:
-        min_size = int(os.getenv("DB_POOL_MIN", "1"))
+        min_size = int(os.getenv("DB_POOL_MIN", str(DEFAULT_POOL_MIN)))
     if max_size is None:
-        max_size = int(os.getenv("DB_POOL_MAX", "10"))
+        max_size = int(os.getenv("DB_POOL_MAX", str(DEFAULT_POOL_MAX)))
+    if statement_cache_size is None:
+        statement_cache_size = int(os.getenv("DB_STATEMENT_CACHE_SIZE", str(DEFAULT_STATEMENT_CACHE_SIZE)))
+
+    # asyncpg weigert min > max (ValueError bij startup), bijv. DB_POOL_MAX=4
+    # met alleen een DB_POOL_MIN uit een andere omgeving
+    max_size = max(1, max_size)
+    if min_size > max_size:
+        logger.warning("[db] pool min (%s) > max (%s): min teruggezet naar max", min_size, max_size)
+        min_size = max_size
+    min_size = max(0, min_size)
 
     if _db is None:
-        _db = Database(dsn=dsn, min_size=min_size, max_size=max_size)
+        _db = Database(
+            dsn=dsn,
+            min_size=min_size,
+            max_size=max_size,
+            statement_cache_size=statement_cache_size,
+        )
     else:
-        # update DSN deterministisch (bij env changes)
+        # update DSN deterministisch (expliciete dsn/sizes gaan voor)
         _db.dsn = dsn
         _db.min_size = min_size
         _db.max_size = max_size
+        _db.statement_cache_size = statement_cache_size
 
     await _db.connect()
     return _db
@@ -0,0 +1,6 @@
+-- learning_events: tijdvenster + sortering op created_at, met de kolommen
+-- die /learning/summary telt erbij (index-only scan voor aggregate_summary_sql).
+-- CONCURRENTLY: geen write-lock op de tabel; niet binnen een transactie draaien.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_learning_events_created_at
+  ON learning_events (created_at DESC)
+  INCLUDE (event_type, tags);
@@ -0,0 +1,14 @@
+-- memory_embedding_cache: berekende query-embeddings hergebruiken
+-- (over restarts en workers heen) i.p.v. opnieuw de OpenAI API aan te roepen.
+-- text_hash = blake2b(text, digest_size=16); model in de key zodat een
+-- EMBEDDING_MODEL-wissel geen vectoren van een ander model teruggeeft.
+-- Geen vaste dimensie: andere modellen dan text-embedding-3-small blijven werken.
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS memory_embedding_cache (
+  text_hash BYTEA NOT NULL,
+  model TEXT NOT NULL,
+  embedding vector NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (text_hash, model)
+);
@@ -0,0 +1,5 @@
+-- memory_embedding_cache retentie: api/memory/embeddings.py verwijdert rows
+-- ouder dan EMBED_CACHE_TTL_DAYS (default 30, 0 = nooit) hooguit 1x per uur.
+-- Index zodat die DELETE geen seq scan over de hele cache doet.
+CREATE INDEX IF NOT EXISTS memory_embedding_cache_created_at_idx
+  ON memory_embedding_cache (created_at);
@@ -0,0 +1,14 @@
+-- memory_embeddings: fp16-kopie van embedding (halfvec, pgvector >= 0.7) voor
+-- de chat-retrieval: 3 KB i.p.v. 6 KB per vector -> kleinere index, minder
+-- geheugenbandbreedte per scan. Generated column: writers hoeven niets te doen.
+-- Dimensie vast op 1536 (text-embedding-3-small); ander model -> aanpassen.
+-- Aanzetten in de app met MEMORY_HALFVEC=1 (zie api/model_router.py).
+ALTER TABLE memory_embeddings
+  ADD COLUMN IF NOT EXISTS embedding_h halfvec(1536)
+  GENERATED ALWAYS AS (embedding::halfvec(1536)) STORED;
+
+-- CONCURRENTLY: geen write-lock op de tabel; niet binnen een transactie draaien.
+-- MEMORY_DISTANCE_METRIC=cosine: halfvec_cosine_ops i.p.v. halfvec_l2_ops.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memory_embeddings_hnsw_h_l2
+  ON memory_embeddings USING hnsw (embedding_h halfvec_l2_ops)
+  WITH (m = 16, ef_construction = 64);
@@ -0,0 +1,11 @@
+-- memory_embeddings: HNSW-index voor de chat-retrieval (model_router / routes.chat),
+-- die standaard op L2 sorteert: ORDER BY embedding <-> $vec LIMIT k.
+-- HNSW (pgvector >= 0.5): geen trainingsstap zoals ivfflat, betere recall/latency.
+-- m=16, ef_construction=64 = pgvector defaults; recall op query-tijd via
+-- hnsw.ef_search (MEMORY_HNSW_EF_SEARCH, zie api/db/database.py).
+-- MEMORY_DISTANCE_METRIC=cosine: gebruik vector_cosine_ops i.p.v. vector_l2_ops
+-- (de ivfflat cosine-index voor api/memory/retrieval.py staat in een eigen migratie).
+-- CONCURRENTLY: geen write-lock op de tabel; niet binnen een transactie draaien.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memory_embeddings_hnsw_l2
+  ON memory_embeddings USING hnsw (embedding vector_l2_ops)
+  WITH (m = 16, ef_construction = 64);
@@ -0,0 +1,19 @@
+-- memory_embeddings: ANN-index voor retrieve_memories (ORDER BY embedding <=> $2).
+-- ivfflat + vector_cosine_ops hoort bij de <=> (cosine) operator; lists=100 past
+-- bij ~10k-1M rijen (vuistregel rows/1000). Maak de index pas als er data staat:
+-- ivfflat bepaalt zijn clusters bij het bouwen.
+-- Recall/snelheid per connection via ivfflat.probes (zie api/memory/retrieval.py).
+-- CONCURRENTLY: geen write-lock op de tabel; niet binnen een transactie draaien.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memory_embeddings_ivfflat
+  ON memory_embeddings USING ivfflat (embedding vector_cosine_ops)
+  WITH (lists = 100)
+  WHERE embedding IS NOT NULL;
+
+-- user-filter zonder seq scan (zelfde partial predicate als de query)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memory_embeddings_user
+  ON memory_embeddings (user_id)
+  WHERE embedding IS NOT NULL;
+
+-- is_test-filter sargable maken (zelfde expressie als in RETRIEVE_SQL)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memory_embeddings_is_test
+  ON memory_embeddings ((COALESCE((metadata->>'is_test')::boolean, false)));
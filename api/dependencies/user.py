@@ -1,26 +1,85 @@
 # api/dependencies/user.py
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import event, select
 from api.database import get_db
 from core.security import decode_token
 from api.auth.models import User
 
 bearer = HTTPBearer(auto_error=True)
 
+# Vaste 401-excepties (geen allocatie per mislukte request);
+# raise via .with_traceback(None) zodat er geen traceback-keten aangroeit.
+_UNAUTHORIZED = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+_NO_USER = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
+
+@dataclass(slots=True, frozen=True)
+class CurrentUser:
+    """Ingelogde gebruiker: vaste kopie van de User-rij, los van de DB-sessie."""
+    id: int
+    email: str
+    role: Optional[str] = None
+
+    @property
+    def safe(self) -> Dict[str, Any]:
+        return {"id": self.id, "email": self.email, "role": self.role}
+
+
+# sha256(token) -> (CurrentUser, exp): 1 decode + 1 DB-lookup per token per 30s.
+# Alleen geverifieerde tokens komen erin; een hit slaat decode_token over.
+# Geen lock: bij een gelijktijdige miss doen we hooguit een dubbele SELECT.
+_USER_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+
+
+def invalidate_user_cache(sub: Optional[str] = None) -> None:
+    """Na logout / wijziging van een user: cache voor één user (of alles) leeg."""
+    if sub is None:
+        _USER_CACHE.clear()
+        return
+    sub = str(sub)
+    for key in [k for k, (user, _) in list(_USER_CACHE.items()) if str(user.id) == sub]:
+        _USER_CACHE.pop(key, None)
+
+
+# Elke UPDATE/DELETE van een User via de ORM (welke route ook) leegt zijn cache
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_change(mapper, connection, target: User) -> None:
+    invalidate_user_cache(target.id)
+
+
 async def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(bearer),
     db: AsyncSession = Depends(get_db),
-) -> User:
+) -> CurrentUser:
     token = creds.credentials
+    key = hashlib.sha256(token.encode()).digest()
+    cached: Optional[Tuple[CurrentUser, Optional[float]]] = _USER_CACHE.get(key)
+    if cached is not None:
+        user, exp = cached
+        if exp is None or exp > time.time():
+            return user
+        _USER_CACHE.pop(key, None)
+
     data, err = decode_token(token)
     if err or not data or data.get("type") != "access":
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+        raise _UNAUTHORIZED.with_traceback(None)
 
     sub = data.get("sub")
     q = await db.execute(select(User).where(User.id == sub))
-    user = q.scalar_one_or_none()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    row = q.scalar_one_or_none()
+    if not row:
+        raise _NO_USER.with_traceback(None)
+
+    # User heeft (nog) geen role-kolom
+    user = CurrentUser(id=row.id, email=row.email, role=getattr(row, "role", None))
+    _USER_CACHE[key] = (user, data.get("exp"))
     return user
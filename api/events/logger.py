@@ -1,9 +1,37 @@
 from __future__ import annotations
-import json
-from typing import Any, Optional
+from itertools import islice
+from typing import Any, Iterable, Mapping, Optional
 
 from api.db.database import get_pool
 
+# Vaste querytekst: asyncpg cachet het prepared statement per connection
+# (statement cache op querytekst), dus alleen de eerste call doet Parse/Describe.
+INSERT_EVENT_SQL = """
+    INSERT INTO learning_events (user_id, session_id, event_type, source, confidence, tags, payload)
+    VALUES ($1, $2, $3, $4, $5, $6::text[], $7)
+"""
+
+# Kolomvolgorde van de records voor log_events (binary COPY)
+_COLUMNS = ("user_id", "session_id", "event_type", "source", "confidence", "tags", "payload")
+
+
+def _clean_tags(tags: Optional[Iterable[str]]) -> list[str]:
+    # max 50 tags: stopt na de 50e geldige tag i.p.v. eerst alles te strippen
+    return list(islice((s for t in (tags or ()) if t and (s := t.strip())), 50))
+
+
+def _event_record(
+    event_type: str,
+    source: str = "api",
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    confidence: Optional[float] = None,
+    tags: Optional[list[str]] = None,
+    payload: Optional[dict[str, Any]] = None,
+) -> tuple:
+    return (user_id, session_id, event_type, source, confidence, _clean_tags(tags), payload or {})
+
+
 async def log_event(
     event_type: str,
     source: str = "api",
@@ -13,27 +41,31 @@ async def log_event(
     tags: Optional[list[str]] = None,
     payload: Optional[dict[str, Any]] = None,
 ) -> None:
+    """Eén event, direct geschreven: na de await staat de rij in de DB."""
     pool = get_pool()
     if pool is None:
         return
 
-    _tags = [t.strip() for t in (tags or []) if t and t.strip()]
-    if len(_tags) > 50:
-        _tags = _tags[:50]
+    row = _event_record(event_type, source, user_id, session_id, confidence, tags, payload)
+    async with pool.acquire() as conn:
+        await conn.execute(INSERT_EVENT_SQL, *row)  # jsonb-codec van de pool encodeert payload
+
+
+async def log_events(events: Iterable[Mapping[str, Any]]) -> int:
+    """
+    Bulk-variant voor bursts: alle events in één binary COPY.
+    Elk item heeft dezelfde velden als de keyword-argumenten van log_event.
+    Synchroon net als log_event (fouten gaan naar de caller); geeft het
+    aantal geschreven rijen terug.
+    """
+    pool = get_pool()
+    if pool is None:
+        return 0
 
-    payload_json = json.dumps(payload or {}, ensure_ascii=False)
+    records = [_event_record(**e) for e in events]
+    if not records:
+        return 0
 
     async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO learning_events (user_id, session_id, event_type, source, confidence, tags, payload)
-            VALUES ($1, $2, $3, $4, $5, $6::text[], $7::jsonb)
-            """,
-            user_id,
-            session_id,
-            event_type,
-            source,
-            confidence,
-            _tags,
-            payload_json,
-        )
+        await conn.copy_records_to_table("learning_events", records=records, columns=_COLUMNS)
+    return len(records)
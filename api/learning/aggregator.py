@@ -1,9 +1,10 @@
 from __future__ import annotations
 
-import json
+import orjson
+from collections import Counter
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any, Optional
+from typing import Any, Mapping, Optional, Sequence
 
 @dataclass
 class Pattern:
@@ -18,15 +19,13 @@ class Pattern:
 def utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
-async def fetch_events(
-    conn,
-    limit: int = 500,
-    window_minutes: int = 1440,
+def events_where(
+    window_minutes: int,
     user_id: Optional[str] = None,
     session_id: Optional[str] = None,
     event_type: Optional[str] = None,
     tag: Optional[str] = None,
-) -> list[dict[str, Any]]:
+) -> tuple[str, list[Any]]:
     end = utcnow()
     start = end - timedelta(minutes=window_minutes)
 
@@ -51,50 +50,116 @@ async def fetch_events(
         params.append(tag)
         p += 1
 
+    return " AND ".join(where), params
+
+async def fetch_events(
+    conn,
+    limit: int = 500,
+    window_minutes: int = 1440,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> list[Any]:
+    """
+    Geeft de asyncpg Records zelf terug (geen dict-kopie per rij).
+    Records ondersteunen r["veld"] en r.get("veld"), dus aggregate_summary /
+    derive_patterns werken er direct op.
+    """
+    where_sql, params = events_where(window_minutes, user_id, session_id, event_type, tag)
+
     sql = f"""
-        SELECT id, created_at, user_id, session_id, event_type, source, confidence, tags, payload
+        SELECT id, created_at, user_id, session_id, event_type, source, confidence, tags, payload,
+               payload->>'action' AS action
         FROM learning_events
-        WHERE {" AND ".join(where)}
+        WHERE {where_sql}
         ORDER BY created_at DESC
         LIMIT {int(limit)}
     """
-    rows = await conn.fetch(sql, *params)
-    return [
-        {
-            "id": int(r["id"]),
-            "created_at": r["created_at"],
-            "user_id": r["user_id"],
-            "session_id": r["session_id"],
-            "event_type": r["event_type"],
-            "source": r["source"],
-            "confidence": float(r["confidence"]) if r["confidence"] is not None else None,
-            "tags": list(r["tags"] or []),
-            "payload": r["payload"] or {},
-        }
-        for r in rows
-    ]
-
-def aggregate_summary(events: list[dict[str, Any]]) -> dict[str, Any]:
-    by_type: dict[str, int] = {}
-    by_tag: dict[str, int] = {}
-    last_ts: Optional[datetime] = None
+    return await conn.fetch(sql, *params)
 
-    for e in events:
-        et = e.get("event_type") or "unknown"
-        by_type[et] = by_type.get(et, 0) + 1
+async def aggregate_summary_sql(
+    conn,
+    limit: int = 500,
+    window_minutes: int = 1440,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> dict[str, Any]:
+    """
+    Zelfde output als aggregate_summary(fetch_events(...)), maar de telling
+    gebeurt in Postgres: één query, alleen de top-lijsten komen terug.
+    Alleen event_type/tags/created_at worden gelezen (index-only met
+    idx_learning_events_created_at, zie api/db/migrations).
+    """
+    where_sql, params = events_where(window_minutes, user_id, session_id, event_type, tag)
+
+    # Gelijke counts: volgorde van eerste voorkomen (nieuwste event eerst, tags
+    # in array-volgorde), zoals Counter.most_common in aggregate_summary.
+    sql = f"""
+        WITH ev AS (
+            SELECT event_type, tags, created_at,
+                   row_number() OVER (ORDER BY created_at DESC) AS rn
+            FROM learning_events
+            WHERE {where_sql}
+            ORDER BY created_at DESC
+            LIMIT {int(limit)}
+        ),
+        ev_tags AS (
+            SELECT btrim(u.t) AS k, row_number() OVER (ORDER BY ev.rn, u.pos) AS seq
+            FROM ev, unnest(ev.tags) WITH ORDINALITY AS u(t, pos)
+            WHERE btrim(u.t) <> ''
+        ),
+        by_type AS (
+            SELECT COALESCE(NULLIF(event_type, ''), 'unknown') AS k, count(*) AS n, min(rn) AS first
+            FROM ev
+            GROUP BY 1
+            ORDER BY n DESC, first
+            LIMIT 10
+        ),
+        by_tag AS (
+            SELECT k, count(*) AS n, min(seq) AS first
+            FROM ev_tags
+            GROUP BY k
+            ORDER BY n DESC, first
+            LIMIT 15
+        )
+        SELECT
+            (SELECT count(*) FROM ev) AS total,
+            (SELECT max(created_at) FROM ev) AS last_created_at,
+            ARRAY(SELECT k FROM by_type ORDER BY n DESC, first) AS type_keys,
+            ARRAY(SELECT n FROM by_type ORDER BY n DESC, first) AS type_counts,
+            ARRAY(SELECT k FROM by_tag ORDER BY n DESC, first) AS tag_keys,
+            ARRAY(SELECT n FROM by_tag ORDER BY n DESC, first) AS tag_counts
+    """
+    row = await conn.fetchrow(sql, *params)
+    last_ts = row["last_created_at"]
 
-        for t in (e.get("tags") or []):
-            t = (t or "").strip()
-            if not t:
-                continue
-            by_tag[t] = by_tag.get(t, 0) + 1
+    return {
+        "total": int(row["total"]),
+        "last_created_at": last_ts.isoformat() if last_ts else None,
+        "top_event_types": [
+            {"event_type": k, "count": n} for k, n in zip(row["type_keys"], row["type_counts"])
+        ],
+        "top_tags": [
+            {"tag": k, "count": n} for k, n in zip(row["tag_keys"], row["tag_counts"])
+        ],
+    }
 
-        ts = e.get("created_at")
-        if ts and (last_ts is None or ts > last_ts):
-            last_ts = ts
+def aggregate_summary(events: Sequence[Mapping[str, Any]]) -> dict[str, Any]:
+    by_type = Counter(e["event_type"] or "unknown" for e in events)
+    by_tag = Counter(
+        t
+        for t in (raw.strip() for e in events for raw in (e["tags"] or ()) if raw)
+        if t
+    )
+    last_ts: Optional[datetime] = max(
+        (e["created_at"] for e in events if e["created_at"]), default=None
+    )
 
-    top_types = sorted(by_type.items(), key=lambda x: x[1], reverse=True)[:10]
-    top_tags = sorted(by_tag.items(), key=lambda x: x[1], reverse=True)[:15]
+    top_types = by_type.most_common(10)
+    top_tags = by_tag.most_common(15)
 
     return {
         "total": len(events),
@@ -103,7 +168,7 @@ def aggregate_summary(events: list[dict[str, Any]]) -> dict[str, Any]:
         "top_tags": [{"tag": k, "count": v} for k, v in top_tags],
     }
 
-def derive_patterns(events: list[dict[str, Any]]) -> list[Pattern]:
+def derive_patterns(events: Sequence[Mapping[str, Any]]) -> list[Pattern]:
     """
     Deterministische regels:
     - explain_level preference: veel ask_explain events
@@ -112,15 +177,24 @@ def derive_patterns(events: list[dict[str, Any]]) -> list[Pattern]:
     """
     now = utcnow()
 
-    def has_tag(e: dict[str, Any], wanted: str) -> bool:
-        return wanted in (e.get("tags") or [])
+    # één pass over de events voor alle drie de tellers
+    ask_explain = search_use = friction = 0
+    for e in events:
+        et = e.get("event_type") or ""
+        tags = e.get("tags") or ()
+        # payload->>'action' uit fetch_events (payload zelf is jsonb-tekst)
+        action = e.get("action")
 
-    def is_type(e: dict[str, Any], wanted: str) -> bool:
-        return (e.get("event_type") or "") == wanted
+        if et == "ask_explain" or "ask_explain" in tags:
+            ask_explain += 1
+        if "tool:search" in tags or action == "search":
+            search_use += 1
+        if (et == "correction" or et == "frustration"
+                or "correction" in tags or "frustration" in tags):
+            friction += 1
 
     patterns: list[Pattern] = []
 
-    ask_explain = sum(1 for e in events if is_type(e, "ask_explain") or has_tag(e, "ask_explain"))
     if ask_explain >= 4:
         conf = min(0.95, 0.55 + (ask_explain - 4) * 0.08)
         patterns.append(Pattern(
@@ -133,12 +207,6 @@ def derive_patterns(events: list[dict[str, Any]]) -> list[Pattern]:
             last_seen=now,
         ))
 
-    search_use = 0
-    for e in events:
-        payload = e.get("payload") or {}
-        action = payload.get("action") if isinstance(payload, dict) else None
-        if has_tag(e, "tool:search") or action == "search":
-            search_use += 1
     if search_use >= 5:
         conf = min(0.92, 0.50 + (search_use - 5) * 0.07)
         patterns.append(Pattern(
@@ -151,8 +219,6 @@ def derive_patterns(events: list[dict[str, Any]]) -> list[Pattern]:
             last_seen=now,
         ))
 
-    friction = sum(1 for e in events if is_type(e, "correction") or is_type(e, "frustration")
-                   or has_tag(e, "correction") or has_tag(e, "frustration"))
     if friction >= 6:
         conf = min(0.90, 0.60 + (friction - 6) * 0.05)
         patterns.append(Pattern(
@@ -167,32 +233,43 @@ def derive_patterns(events: list[dict[str, Any]]) -> list[Pattern]:
 
     return patterns
 
-async def upsert_patterns(conn, patterns: list[Pattern]) -> int:
-    if not patterns:
-        return 0
-
-    sql = """
+# Eén statement voor alle patterns: parallelle arrays -> UNNEST -> upsert.
+# (derive_patterns levert per call unieke keys, dus geen dubbele conflict-rij)
+UPSERT_PATTERNS_SQL = """
     INSERT INTO learning_patterns (subject, pattern_type, key, value, confidence, evidence, last_seen)
-    VALUES ($1, $2, $3, $4::jsonb, $5, $6::jsonb, $7)
+    SELECT s, pt, k, v::jsonb, c, e::jsonb, ls
+    FROM UNNEST($1::text[], $2::text[], $3::text[], $4::text[], $5::float8[], $6::text[], $7::timestamptz[])
+        AS t(s, pt, k, v, c, e, ls)
     ON CONFLICT (subject, pattern_type, key)
     DO UPDATE SET
         value = EXCLUDED.value,
         confidence = EXCLUDED.confidence,
         evidence = EXCLUDED.evidence,
         last_seen = EXCLUDED.last_seen
-    """
+"""
 
-    n = 0
+async def upsert_patterns(conn, patterns: list[Pattern]) -> int:
+    if not patterns:
+        return 0
+
+    subjects: list[str] = []
+    types: list[str] = []
+    keys: list[str] = []
+    values_json: list[str] = []
+    confs: list[float] = []
+    evidence_json: list[str] = []
+    last_seens: list[datetime] = []
     for p in patterns:
-        await conn.execute(
-            sql,
-            p.subject,
-            p.pattern_type,
-            p.key,
-            json.dumps(p.value, ensure_ascii=False),
-            float(p.confidence),
-            json.dumps(p.evidence, ensure_ascii=False),
-            p.last_seen,
-        )
-        n += 1
-    return n
+        subjects.append(p.subject)
+        types.append(p.pattern_type)
+        keys.append(p.key)
+        values_json.append(orjson.dumps(p.value).decode())
+        confs.append(float(p.confidence))
+        evidence_json.append(orjson.dumps(p.evidence).decode())
+        last_seens.append(p.last_seen)
+
+    await conn.execute(
+        UPSERT_PATTERNS_SQL,
+        subjects, types, keys, values_json, confs, evidence_json, last_seens,
+    )
+    return len(subjects)
@@ -1,6 +1,8 @@
 # api/main.py
 import logging
+import logging.handlers
 import os
+import queue
 from pathlib import Path
 from typing import List
 
@@ -18,11 +20,24 @@ LOG_DIR = Path(os.getenv("LOG_DIR", "/data/logs"))
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE = LOG_DIR / "loesoe.log"
 
+# Request-pad zet alleen LogRecords in een queue; de listener-thread
+# doet de echte writes naar file + stdout.
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_log_format = logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+
+_file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+_file_handler.setFormatter(_log_format)
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(_log_format)
+
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-    handlers=[logging.FileHandler(LOG_FILE, encoding="utf-8"), logging.StreamHandler()],
+    handlers=[logging.handlers.QueueHandler(_log_queue)],
+)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, _file_handler, _stream_handler, respect_handler_level=True
 )
+_log_listener.start()
 logger = logging.getLogger("loesoe")
 
 
@@ -94,18 +109,32 @@ async def startup():
     loaded = []
     failed = []
 
+    # Imports serieel: module-imports delen de import-lock en top-level state
+    # (pools, os.getenv, mkdir), parallel importeren is niet veilig.
+    # Eerst alle routers verzamelen, dan in één sweep registreren
+    imported = []
     for mod in routers:
         try:
             module = __import__(mod, fromlist=["router"])
             if not hasattr(module, "router"):
                 raise RuntimeError("module has no attribute 'router'")
-            app.include_router(module.router)
+            imported.append((mod, module.router))
+        except Exception as e:
+            failed.append((mod, str(e)))
+            logger.error(fail(f"router {mod} faalde: {e}"))
+
+    for mod, router in imported:
+        try:
+            app.include_router(router)
             loaded.append(mod)
             logger.info(ok(f"geladen: {mod}"))
         except Exception as e:
             failed.append((mod, str(e)))
             logger.error(fail(f"router {mod} faalde: {e}"))
 
+    # OpenAPI-schema één keer (lazy) opnieuw laten opbouwen met alle routes
+    app.openapi_schema = None
+
     logger.info("[routers] geladen totaal: %s", ", ".join(loaded) if loaded else "(none)")
     if failed:
         logger.warning("[routers] failures: %s", "; ".join(f"{m} -> {err}" for m, err in failed))
@@ -113,6 +142,30 @@ async def startup():
 
 @app.on_event("shutdown")
 async def shutdown():
+    # chat_history writer-queue leeg schrijven
+    try:
+        from api.chat_logger import close_chat_log
+
+        await close_chat_log()
+    except Exception as e:
+        logger.warning(f"[shutdown] chat log flush failed: {e}")
+
+    # dashboard last_session (write-behind) wegschrijven
+    try:
+        from api.dashboard import flush_last_session
+
+        flush_last_session()
+    except Exception as e:
+        logger.warning(f"[shutdown] last_session flush failed: {e}")
+
+    # zelfleren.json (write-behind) wegschrijven
+    try:
+        from api.memory.behavior import flush_selflearning
+
+        flush_selflearning()
+    except Exception as e:
+        logger.warning(f"[shutdown] zelfleren flush failed: {e}")
+
     # ✅ 1 waarheid: close_database sluit pool
     try:
         from api.db.database import close_database
@@ -122,6 +175,9 @@ async def shutdown():
     except Exception as e:
         logger.warning(f"[shutdown] db close failed: {e}")
 
+    # als laatste: wachtende log-regels wegschrijven en listener stoppen
+    _log_listener.stop()
+
 
 # ============================================================
 # HEALTHZ (enige waarheid)
@@ -1,16 +1,36 @@
 from fastapi import APIRouter, Header, HTTPException
 from typing import Optional, Dict, List, Any
 from datetime import datetime
+import time
 from pathlib import Path
-import json
 import os
 import logging
+from collections import deque
 
 from pydantic import BaseModel
 import jwt  # PyJWT
-
-# Postgres (Fase 22.1)
-import asyncpg
+import orjson
+
+# zstd is optioneel: zonder package blijven snapshots gewone .json
+try:
+    import zstandard  # type: ignore
+    _ZSTD = zstandard.ZstdCompressor(level=3)
+except Exception:
+    zstandard = None  # type: ignore
+    _ZSTD = None
+
+# Postgres (Fase 22.1): gedeelde pool
+from api.db.database import get_pool
+from api.memory.behavior import (
+    ZELFLEREN_PATH,
+    apply_scores_to_user_block,
+    current_selflearn,
+    default_user_block,
+    flush_selflearning,
+    on_selflearn_write,
+    queue_selflearn_update,
+    replace_selflearn,
+)
 
 logger = logging.getLogger("loesoe.memory")
 
@@ -23,7 +43,6 @@ router = APIRouter(tags=["memory"])  # main hangt routes direct
 MEM_DIR = Path("data") / "memory"
 MEM_DIR.mkdir(parents=True, exist_ok=True)
 
-ZELFLEREN_PATH = MEM_DIR / "zelfleren.json"
 LAST_SESSION_PATH = MEM_DIR / "last_session.json"
 SNAPSHOTS_DIR = MEM_DIR / "snapshots"
 SNAPSHOTS_DIR.mkdir(parents=True, exist_ok=True)
@@ -32,6 +51,13 @@ SNAPSHOTS_DIR.mkdir(parents=True, exist_ok=True)
 # =========================
 # JWT helper
 # =========================
+# Secret + decoder eenmalig bij import; ontbreekt de secret dan blijft het
+# een 500 op request-tijd (zoals voorheen).
+_AUTH_SECRET = os.getenv("AUTH_SECRET")
+_JWT = jwt.PyJWT(options={"verify_signature": True})
+_JWT_ALGOS = ("HS256",)
+
+
 def _get_user_from_header(authorization: Optional[str]) -> Dict[str, Any]:
     """
     Decodeert de JWT direct uit de Authorization-header.
@@ -46,12 +72,11 @@ def _get_user_from_header(authorization: Optional[str]) -> Dict[str, Any]:
         raise HTTPException(status_code=401, detail="Invalid Authorization header")
 
     token = parts[1]
-    secret = os.getenv("AUTH_SECRET")
-    if not secret:
+    if not _AUTH_SECRET:
         raise HTTPException(status_code=500, detail="Server misconfigured: AUTH_SECRET missing")
 
     try:
-        payload = jwt.decode(token, secret, algorithms=["HS256"])
+        payload = _JWT.decode(token, _AUTH_SECRET, algorithms=_JWT_ALGOS)
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
@@ -80,51 +105,107 @@ class SnapshotRestoreRequest(BaseModel):
 # =========================
 # JSON helpers (legacy)
 # =========================
-def _load_json(path: Path, default: Any) -> Any:
-    if not path.exists():
-        return default
-    try:
-        return json.loads(path.read_text(encoding="utf-8"))
-    except Exception:
-        logger.warning(f"[memory] JSON load failed: {path}", exc_info=True)
-        return default
+def _dump_json(data: Any) -> bytes:
+    # orjson: datetime als ...Z, int-keys (user ids) als string
+    return orjson.dumps(data, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
 
 
-def _save_json(path: Path, data: Any) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+def _write_bytes_atomic(path: Path, raw: bytes) -> None:
+    """raw naar <path>.tmp, dan os.replace (nooit een half bestand)."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(raw)
+    os.replace(tmp, path)
 
 
 def _utc_stamp() -> str:
-    return datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    return time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+
+
+_SNAPSHOT_SUFFIXES = (".json", ".json.zst")
+
+
+def _snapshot_files(label: str) -> List[Path]:
+    """Alle snapshots voor label (plain + zstd), oud -> nieuw op bestandsnaam."""
+    return sorted(
+        f for suffix in _SNAPSHOT_SUFFIXES for f in SNAPSHOTS_DIR.glob(f"{label}_*{suffix}")
+    )
+
+
+def _read_snapshot(path: Path) -> Any:
+    if path.name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard niet geïnstalleerd")
+        return orjson.loads(zstandard.ZstdDecompressor().decompress(path.read_bytes()))
+    return orjson.loads(path.read_bytes())
 
 
-def _create_snapshot(label: str, data: Dict[str, Any], keep_last: int = 20) -> None:
+# Per label de bestaande snapshots (oud -> nieuw). Eenmalig gevuld met een
+# glob, daarna roteren we in-memory i.p.v. per write de map te scannen.
+_SNAPSHOT_RING: Dict[str, "deque[Path]"] = {}
+
+
+def _snapshot_ring(label: str, keep_last: int) -> "deque[Path]":
+    ring = _SNAPSHOT_RING.get(label)
+    if ring is not None and ring.maxlen == keep_last:
+        return ring
+
+    files = _snapshot_files(label)
+    for f in files[: max(0, len(files) - keep_last)]:
+        try:
+            f.unlink()
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.warning(f"[memory] snapshot cleanup failed: {f}", exc_info=True)
+
+    ring = deque(files[-keep_last:] if keep_last > 0 else [], maxlen=keep_last)
+    _SNAPSHOT_RING[label] = ring
+    return ring
+
+
+def _create_snapshot(
+    label: str,
+    data: Optional[Dict[str, Any]] = None,
+    keep_last: int = 20,
+    raw: Optional[bytes] = None,
+) -> None:
     """
     Maakt een snapshot van de volledige structuur (legacy safety-net).
     - keep_last: behoud alleen de laatste N snapshots per label
+    - raw: al geserialiseerde bytes (dan wordt data genegeerd)
     """
     SNAPSHOTS_DIR.mkdir(parents=True, exist_ok=True)
-    filename = f"{label}_{_utc_stamp()}.json"
-    (SNAPSHOTS_DIR / filename).write_text(
-        json.dumps(data, ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
-
-    # Rotatie
-    files = sorted(SNAPSHOTS_DIR.glob(f"{label}_*.json"))
-    if len(files) > keep_last:
-        for f in files[: len(files) - keep_last]:
-            try:
-                f.unlink()
-            except Exception:
-                logger.warning(f"[memory] snapshot cleanup failed: {f}", exc_info=True)
+    ring = _snapshot_ring(label, keep_last)
+
+    if raw is None:
+        raw = _dump_json(data)
+    # zstd level 3: JSON met herhaalde keys wordt typisch 4-10x kleiner
+    if _ZSTD is not None:
+        filename = f"{label}_{_utc_stamp()}.json.zst"
+        raw = _ZSTD.compress(raw)
+    else:
+        filename = f"{label}_{_utc_stamp()}.json"
+    path = SNAPSHOTS_DIR / filename
+    _write_bytes_atomic(path, raw)
+
+    # Rotatie (O(1)): zelfde seconde = zelfde bestand, dan niets te doen
+    if path in ring:
+        return
+    if ring.maxlen and len(ring) == ring.maxlen:
+        oldest = ring[0]
+        try:
+            oldest.unlink()
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.warning(f"[memory] snapshot cleanup failed: {oldest}", exc_info=True)
+    ring.append(path)
 
 
 def _list_snapshots(label: str) -> List[Dict[str, Any]]:
     SNAPSHOTS_DIR.mkdir(parents=True, exist_ok=True)
     out: List[Dict[str, Any]] = []
-    for f in sorted(SNAPSHOTS_DIR.glob(f"{label}_*.json"), reverse=True):
+    for f in reversed(_snapshot_files(label)):
         try:
             stat = f.stat()
             out.append(
@@ -140,128 +221,102 @@ def _list_snapshots(label: str) -> List[Dict[str, Any]]:
 
 
 # =========================
-# Default data
+# zelfleren.json
 # =========================
-def _default_selflearn() -> Dict[str, Any]:
-    return {"users": {}}
-
-
-def _default_user_block() -> Dict[str, Any]:
-    return {
-        "profile": {},
-        "preferences": {},
-        "habits": {},
-        "topics_counters": {},
-        "modules_usage": {},
-        "documents": [],
-        "images": [],
-        "charts": [],
-        "behavior_log": [],
-        "emotion_summary": {"current": None, "history": []},
-        "last_updated": datetime.utcnow().isoformat() + "Z",
-    }
-
-
-def _get_or_create_selflearn_user(data: Dict[str, Any], user_id: int) -> Dict[str, Any]:
-    users = data.setdefault("users", {})
-    key = str(user_id)
-    if key not in users:
-        users[key] = _default_user_block()
-    return users[key]
-
-
-def _apply_scores_to_user_block(user_block: Dict[str, Any], scores: Dict[str, Any]) -> None:
-    """
-    Simpele score-logging (Fase 20C compat).
-    """
-    try:
-        log = user_block.setdefault("behavior_log", [])
-        log.append({"timestamp": datetime.utcnow().isoformat() + "Z", "scores": scores})
-        if len(log) > 200:
-            del log[:-200]
-    except Exception:
-        logger.warning("[memory] apply_scores failed", exc_info=True)
+# De write-behind zelf staat in api.memory.behavior (één schrijver per proces,
+# ook voor de behavior-scores van api.chat); hier alleen de MemoryUpdate-
+# mutatie en een snapshot na elke write (legacy safety-net).
+def _apply_update(user_block: Dict[str, Any], payload: "MemoryUpdate") -> None:
+    if payload.profile:
+        user_block.setdefault("profile", {}).update(payload.profile)
+
+    if payload.preferences:
+        user_block.setdefault("preferences", {}).update(payload.preferences)
+
+    if payload.habits:
+        habits = user_block.setdefault("habits", {})
+        for k, v in payload.habits.items():
+            habits[k] = habits.get(k, 0) + int(v)
+
+    if payload.topics_counters:
+        topics = user_block.setdefault("topics_counters", {})
+        for k, v in payload.topics_counters.items():
+            topics[k] = topics.get(k, 0) + int(v)
+
+    if payload.modules_usage:
+        mods = user_block.setdefault("modules_usage", {})
+        for k, v in payload.modules_usage.items():
+            mods[k] = mods.get(k, 0) + int(v)
+
+    if payload.scores:
+        apply_scores_to_user_block(user_block, payload.scores)
+
+
+def _snapshot_selflearn(raw: bytes) -> None:
+    _create_snapshot("selflearning", raw=raw)
+
+
+on_selflearn_write(_snapshot_selflearn)
+
+
+@router.on_event("shutdown")
+def _shutdown_flush_selflearning() -> None:
+    flush_selflearning()
 
 
 # =========================
 # Postgres helpers (Fase 22.1)
 # =========================
-def _normalize_for_asyncpg(url: str) -> str:
-    """
-    asyncpg snapt geen 'postgresql+asyncpg://'.
-    SQLAlchemy async gebruikt dat schema wel.
-    Dus: strip '+asyncpg' voor asyncpg.
-    """
-    if url.startswith("postgresql+asyncpg://"):
-        return "postgresql://" + url.split("://", 1)[1]
-    if url.startswith("postgres+asyncpg://"):
-        return "postgresql://" + url.split("://", 1)[1]
-    return url
-
-
-def _pg_dsn() -> Optional[str]:
+def _shared_pool():
     """
-    Probeert DATABASE_URL, anders bouwt hij DSN uit env vars.
-    Returned DSN is altijd asyncpg-compatibel.
+    Gedeelde asyncpg-pool uit api.db.database (geen connect per call).
+    None als de DB (nog) niet geïnitialiseerd is -> JSON blijft leidend.
     """
-    url = os.getenv("DATABASE_URL")
-    if url:
-        return _normalize_for_asyncpg(url)
-
-    host = os.getenv("POSTGRES_HOST") or os.getenv("DB_HOST") or "db"
-    port = int(os.getenv("POSTGRES_PORT") or os.getenv("DB_PORT") or "5432")
-    user = os.getenv("POSTGRES_USER") or os.getenv("DB_USER") or "loesoe"
-    password = os.getenv("POSTGRES_PASSWORD") or os.getenv("DB_PASSWORD") or "loesoe"
-    database = os.getenv("POSTGRES_DB") or os.getenv("DB_NAME") or "loesoe"
-
-    return f"postgresql://{user}:{password}@{host}:{port}/{database}"
+    try:
+        return get_pool()
+    except RuntimeError:
+        return None
 
 
 async def _db_upsert_selflearning(user_id: int, user_block: Dict[str, Any]) -> None:
-    dsn = _pg_dsn()
-    if not dsn:
+    pool = _shared_pool()
+    if pool is None:
         return
 
     try:
-        conn = await asyncpg.connect(dsn)
-        try:
+        async with pool.acquire() as conn:
             await conn.execute(
                 """
                 INSERT INTO memory_selflearning (user_id, data, updated_at)
-                VALUES ($1, $2::jsonb, NOW())
+                VALUES ($1, $2, NOW())
                 ON CONFLICT (user_id)
                 DO UPDATE SET data = EXCLUDED.data, updated_at = NOW()
                 """,
                 user_id,
-                json.dumps(user_block, ensure_ascii=False),
+                user_block,  # jsonb-codec van de pool encodeert
             )
-        finally:
-            await conn.close()
     except Exception:
         logger.warning("[memory] DB upsert failed (fallback blijft JSON)", exc_info=True)
 
 
 async def _db_get_selflearning(user_id: int) -> Optional[Dict[str, Any]]:
-    dsn = _pg_dsn()
-    if not dsn:
+    pool = _shared_pool()
+    if pool is None:
         return None
 
     try:
-        conn = await asyncpg.connect(dsn)
-        try:
+        async with pool.acquire() as conn:
             row = await conn.fetchrow(
                 "SELECT data FROM memory_selflearning WHERE user_id = $1",
                 user_id,
             )
-            if not row:
-                return None
-
-            data = row["data"]
-            if isinstance(data, str):
-                return json.loads(data)
-            return dict(data)
-        finally:
-            await conn.close()
+        if not row:
+            return None
+
+        data = row["data"]
+        if isinstance(data, str):
+            return orjson.loads(data)
+        return dict(data)
     except Exception:
         logger.warning("[memory] DB get failed (fallback naar JSON)", exc_info=True)
         return None
@@ -287,9 +342,8 @@ async def get_selflearning(authorization: Optional[str] = Header(None)) -> Dict[
     if db_block is not None:
         return {"user_id": user_id, "name": user_name, "memory": db_block, "source": "db"}
 
-    # 2) fallback JSON
-    data = _load_json(ZELFLEREN_PATH, _default_selflearn())
-    user_block = _get_or_create_selflearn_user(data, user_id)
+    # 2) fallback JSON (in-memory kopie: ook nog niet weggeschreven updates)
+    user_block = current_selflearn().get("users", {}).get(str(user_id)) or default_user_block()
     return {"user_id": user_id, "name": user_name, "memory": user_block, "source": "json"}
 
 
@@ -307,38 +361,8 @@ async def update_selflearning(
     user_id = int(user_payload["id"])
 
     # JSON legacy struct bijhouden (meerdere users in 1 file)
-    data = _load_json(ZELFLEREN_PATH, _default_selflearn())
-    user_block = _get_or_create_selflearn_user(data, user_id)
-
-    if payload.profile:
-        user_block.setdefault("profile", {}).update(payload.profile)
-
-    if payload.preferences:
-        user_block.setdefault("preferences", {}).update(payload.preferences)
-
-    if payload.habits:
-        habits = user_block.setdefault("habits", {})
-        for k, v in payload.habits.items():
-            habits[k] = habits.get(k, 0) + int(v)
-
-    if payload.topics_counters:
-        topics = user_block.setdefault("topics_counters", {})
-        for k, v in payload.topics_counters.items():
-            topics[k] = topics.get(k, 0) + int(v)
-
-    if payload.modules_usage:
-        mods = user_block.setdefault("modules_usage", {})
-        for k, v in payload.modules_usage.items():
-            mods[k] = mods.get(k, 0) + int(v)
-
-    if payload.scores:
-        _apply_scores_to_user_block(user_block, payload.scores)
-
-    user_block["last_updated"] = datetime.utcnow().isoformat() + "Z"
-
-    # 1) JSON save + snapshot (blijft werken zoals jij gewend bent)
-    _save_json(ZELFLEREN_PATH, data)
-    _create_snapshot("selflearning", data)
+    # 1) JSON save + snapshot: write-behind (gebundeld, in de achtergrond)
+    user_block = queue_selflearn_update(user_id, lambda block: _apply_update(block, payload))
 
     # 2) DB upsert (Fase 22.1)
     await _db_upsert_selflearning(user_id, user_block)
@@ -361,16 +385,21 @@ def restore_selflearning_snapshot(
     _get_user_from_header(authorization)
 
     filename = payload.filename
-    if not filename.startswith("selflearning_") or not filename.endswith(".json"):
+    if not filename.startswith("selflearning_") or not filename.endswith(_SNAPSHOT_SUFFIXES):
         raise HTTPException(status_code=400, detail="Ongeldige snapshot-naam")
 
     snap_path = SNAPSHOTS_DIR / filename
     if not snap_path.exists():
         raise HTTPException(status_code=404, detail="Snapshot niet gevonden")
 
-    data = _load_json(snap_path, None)
+    try:
+        data = _read_snapshot(snap_path)
+    except Exception:
+        logger.warning(f"[memory] snapshot read failed: {snap_path}", exc_info=True)
+        data = None
     if not isinstance(data, dict):
         raise HTTPException(status_code=400, detail="Snapshot inhoud ongeldig")
 
-    _save_json(ZELFLEREN_PATH, data)
+    # restore wint van nog niet weggeschreven updates
+    replace_selflearn(data)
     return {"status": "ok", "restored": filename}
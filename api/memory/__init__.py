@@ -1,13 +1,17 @@
 from __future__ import annotations
 
-import os
+import asyncio
 import logging
-from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional
 
 import asyncpg
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+
+from api.db.database import get_pool
 
 logger = logging.getLogger("loesoe.memory")
 
@@ -17,37 +21,25 @@ router = APIRouter(tags=["memory"])
 # Helpers: DB / pool
 # -------------------------
 
-_pool: Optional[asyncpg.Pool] = None
-
-
-def _dsn_for_asyncpg() -> str:
-    """
-    Jouw app gebruikt DATABASE_URL met postgresql+asyncpg:// ...
-    asyncpg wil postgresql:// (zonder +asyncpg).
-    """
-    dsn = os.getenv("DATABASE_URL", "").strip()
-    if not dsn:
-        raise RuntimeError("DATABASE_URL not set")
-
-    # strip driver suffix for asyncpg
-    if dsn.startswith("postgresql+asyncpg://"):
-        dsn = "postgresql://" + dsn.split("postgresql+asyncpg://", 1)[1]
-    return dsn
+_schema_ready = False
+# Schema-check één keer, onder lock: een burst eerste requests doet hem anders parallel
+_schema_lock = asyncio.Lock()
 
 
 async def _get_pool() -> asyncpg.Pool:
-    global _pool
-    if _pool is None:
-        dsn = _dsn_for_asyncpg()
-        _pool = await asyncpg.create_pool(
-            dsn=dsn,
-            min_size=1,
-            max_size=5,
-            command_timeout=30,
-        )
-        logger.info("[memory] asyncpg pool created")
-        await _ensure_schema(_pool)
-    return _pool
+    """Gedeelde pool uit api.db.database; memory_kv-schema bij eerste gebruik."""
+    global _schema_ready
+    pool = get_pool()
+    if pool is None:
+        raise RuntimeError("DB pool not initialized")
+    if _schema_ready:
+        return pool
+
+    async with _schema_lock:
+        if not _schema_ready:
+            await _ensure_schema(pool)
+            _schema_ready = True
+    return pool
 
 
 async def _ensure_schema(pool: asyncpg.Pool) -> None:
@@ -64,10 +56,6 @@ async def _ensure_schema(pool: asyncpg.Pool) -> None:
     logger.info("[memory] schema ensured")
 
 
-def _utc_now() -> str:
-    return datetime.now(timezone.utc).isoformat()
-
-
 # -------------------------
 # Schemas
 # -------------------------
@@ -100,78 +88,148 @@ class MemoryAllOut(BaseModel):
     items: Dict[str, MemoryItem]
 
 
+# -------------------------
+# SQL (module-constanten: zelfde string -> asyncpg statement-cache hit)
+# -------------------------
+
+# updated_at als ISO-tekst uit Postgres (to_char in C): geen datetime-object
+# + isoformat() per row in Python. updated_at is NOT NULL, dus geen fallback.
+_UPDATED_AT_ISO = """to_char(updated_at AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"') AS updated_at_iso"""
+
+SELECT_ALL_SQL = f"""
+SELECT key, value, source, {_UPDATED_AT_ISO} FROM memory_kv
+ORDER BY updated_at DESC
+LIMIT $1 OFFSET $2
+"""
+SELECT_ONE_SQL = f"SELECT key, value, source, {_UPDATED_AT_ISO} FROM memory_kv WHERE key=$1"
+UPSERT_SQL = """
+INSERT INTO memory_kv(key, value, source, updated_at)
+VALUES ($1, $2, COALESCE($3,'api'), NOW())
+ON CONFLICT (key) DO UPDATE
+SET value=EXCLUDED.value,
+    source=EXCLUDED.source,
+    updated_at=NOW()
+"""
+DELETE_SQL = "DELETE FROM memory_kv WHERE key=$1"
+STREAM_ALL_SQL = f"SELECT key, value, source, {_UPDATED_AT_ISO} FROM memory_kv ORDER BY updated_at DESC"
+STREAM_PREFETCH = 500
+
+
 # -------------------------
 # Routes
 # -------------------------
 
-@router.get("/memory/all", response_model=MemoryAllOut)
-async def memory_all() -> MemoryAllOut:
+async def _fetch_all(limit: Optional[int], offset: int):
+    # LIMIT NULL == geen limiet in Postgres
     pool = await _get_pool()
     async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT key, value, source, updated_at FROM memory_kv ORDER BY updated_at DESC"
-        )
-
-    items: Dict[str, MemoryItem] = {}
-    for r in rows:
-        items[r["key"]] = MemoryItem(
-            key=r["key"],
-            value=r["value"],
-            source=r["source"],
-            updated_at=r["updated_at"].isoformat() if r["updated_at"] else _utc_now(),
-        )
-
-    return MemoryAllOut(count=len(items), items=items)
+        return await conn.fetch(SELECT_ALL_SQL, limit, offset)
 
 
+@router.get("/memory/all", response_model=MemoryAllOut)
+async def memory_all(
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+) -> ORJSONResponse:
+    """
+    Zelfde vorm als MemoryAllOut, maar zonder per-row Pydantic-validatie:
+    rows direct naar dicts, orjson serialiseert. Standaard alle rows (zoals
+    voorheen); limit/offset zijn optioneel voor paginering.
+    """
+    rows = await _fetch_all(limit, offset)
+    items = {
+        r["key"]: {
+            "key": r["key"],
+            "value": r["value"],
+            "source": r["source"],
+            "updated_at": r["updated_at_iso"],
+        }
+        for r in rows
+    }
+    return ORJSONResponse({"count": len(items), "items": items})
+
+
+async def _stream_all() -> AsyncIterator[bytes]:
+    # Cursor in een transactie: hooguit STREAM_PREFETCH rows tegelijk in geheugen
+    pool = await _get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            async for r in conn.cursor(STREAM_ALL_SQL, prefetch=STREAM_PREFETCH):
+                yield orjson.dumps(
+                    {
+                        "key": r["key"],
+                        "value": r["value"],
+                        "source": r["source"],
+                        "updated_at": r["updated_at_iso"],
+                    },
+                    option=orjson.OPT_APPEND_NEWLINE,
+                )
+
+
+@router.get("/memory/all/stream")
+async def memory_all_stream() -> StreamingResponse:
+    """Volledige export als NDJSON (één MemoryItem per regel), zonder alles te bufferen."""
+    return StreamingResponse(_stream_all(), media_type="application/x-ndjson")
+
+
+# Hot-path routes: response_model blijft staan voor OpenAPI, maar we geven een
+# ORJSONResponse terug -> FastAPI slaat de response-validatie over.
 @router.get("/memory/get/{key}", response_model=MemoryItem)
-async def memory_get(key: str) -> MemoryItem:
+async def memory_get(key: str) -> ORJSONResponse:
     pool = await _get_pool()
     async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT key, value, source, updated_at FROM memory_kv WHERE key=$1",
-            key,
-        )
+        row = await conn.fetchrow(SELECT_ONE_SQL, key)
 
     if not row:
         raise HTTPException(status_code=404, detail="Key not found")
 
-    return MemoryItem(
-        key=row["key"],
-        value=row["value"],
-        source=row["source"],
-        updated_at=row["updated_at"].isoformat() if row["updated_at"] else _utc_now(),
+    return ORJSONResponse(
+        {
+            "key": row["key"],
+            "value": row["value"],
+            "source": row["source"],
+            "updated_at": row["updated_at_iso"],
+        }
     )
 
 
-@router.post("/memory/set", response_model=MemorySetOut)
-async def memory_set(payload: MemorySetIn) -> MemorySetOut:
-    # ⚠️ Belangrijk: FastAPI/Pydantic parseert JSON als UTF-8 → emoji blijft heel.
+@router.post(
+    "/memory/set",
+    response_model=MemorySetOut,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": MemorySetIn.model_json_schema()}},
+        }
+    },
+)
+async def memory_set(request: Request) -> ORJSONResponse:
+    # Body in één stap: raw bytes -> pydantic-core (Rust) parse + validatie,
+    # i.p.v. json.loads + validatie van de dict door FastAPI.
+    # ⚠️ Belangrijk: JSON wordt als UTF-8 geparsed → emoji blijft heel.
+    try:
+        payload = MemorySetIn.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+
     pool = await _get_pool()
     async with pool.acquire() as conn:
         await conn.execute(
-            """
-            INSERT INTO memory_kv(key, value, source, updated_at)
-            VALUES ($1, $2, COALESCE($3,'api'), NOW())
-            ON CONFLICT (key) DO UPDATE
-            SET value=EXCLUDED.value,
-                source=EXCLUDED.source,
-                updated_at=NOW()
-            """,
+            UPSERT_SQL,
             payload.key,
             payload.value,
             payload.source,
         )
 
-    return MemorySetOut(ok=True, key=payload.key)
+    return ORJSONResponse({"ok": True, "key": payload.key})
 
 
 @router.delete("/memory/delete/{key}", response_model=MemoryDeleteOut)
-async def memory_delete(key: str) -> MemoryDeleteOut:
+async def memory_delete(key: str) -> ORJSONResponse:
     pool = await _get_pool()
     async with pool.acquire() as conn:
-        res = await conn.execute("DELETE FROM memory_kv WHERE key=$1", key)
+        res = await conn.execute(DELETE_SQL, key)
 
     # asyncpg returns like: "DELETE 1"
     ok = res.endswith("1")
-    return MemoryDeleteOut(ok=ok, key=key)
+    return ORJSONResponse({"ok": ok, "key": key})
@@ -0,0 +1,216 @@
+# api/memory/behavior.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from api.timeutil import now_iso
+
+logger = logging.getLogger("loesoe.memory.behavior")
+
+# =========================
+# zelfleren.json (write-behind, één schrijver per proces)
+# =========================
+# api.chat (behavior-scores) en api/memory.py (/selflearning/update) zetten
+# hun wijziging hier in de wachtrij. Updates gaan eerst in een in-memory
+# kopie; een achtergrond-task schrijft hooguit 1x per SELFLEARN_FLUSH_SECONDS
+# (in een thread, de response wacht niet op disk). Wijzigt het bestand buiten
+# ons om (restore, hand-edit), dan herladen we op mtime en passen we nog niet
+# weggeschreven updates opnieuw toe.
+#
+# Let op: api/memory.py wordt overschaduwd door deze package (import api.memory
+# geeft api/memory/__init__.py), daarom staat de writer hier.
+MEM_DIR = Path("data") / "memory"
+ZELFLEREN_PATH = MEM_DIR / "zelfleren.json"
+SELFLEARN_FLUSH_SECONDS = 0.5
+
+# Eén wijziging = functie die een user-block muteert
+UserBlockChange = Callable[[Dict[str, Any]], None]
+
+_selflearn_state: Optional[Dict[str, Any]] = None
+_selflearn_mtime_ns: Optional[int] = None
+_pending_updates: List[Tuple[int, UserBlockChange, str]] = []
+_last_selflearn_flush: float = 0.0
+_selflearn_flush_task: Optional[asyncio.Task] = None
+# Na elke geslaagde write aangeroepen met de bytes (bijv. snapshots)
+_after_write: List[Callable[[bytes], None]] = []
+
+
+def default_user_block() -> Dict[str, Any]:
+    return {
+        "profile": {},
+        "preferences": {},
+        "habits": {},
+        "topics_counters": {},
+        "modules_usage": {},
+        "documents": [],
+        "images": [],
+        "charts": [],
+        "behavior_log": [],
+        "emotion_summary": {"current": None, "history": []},
+        "last_updated": now_iso(),
+    }
+
+
+def apply_scores_to_user_block(user_block: Dict[str, Any], scores: Dict[str, Any]) -> None:
+    """
+    Simpele score-logging (Fase 20C compat).
+    """
+    try:
+        log = user_block.setdefault("behavior_log", [])
+        log.append({"timestamp": now_iso(), "scores": scores})
+        if len(log) > 200:
+            del log[:-200]
+    except Exception:
+        logger.warning("[memory] apply_scores failed", exc_info=True)
+
+
+def _dump_json(data: Any) -> bytes:
+    # orjson: datetime als ...Z, int-keys (user ids) als string
+    return orjson.dumps(data, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+def _load_selflearn() -> Dict[str, Any]:
+    try:
+        return orjson.loads(ZELFLEREN_PATH.read_bytes())
+    except FileNotFoundError:
+        return {"users": {}}
+    except Exception:
+        logger.warning(f"[memory] JSON load failed: {ZELFLEREN_PATH}", exc_info=True)
+        return {"users": {}}
+
+
+def _apply(data: Dict[str, Any], user_id: int, change: UserBlockChange, ts: str) -> Dict[str, Any]:
+    users = data.setdefault("users", {})
+    key = str(user_id)
+    if key not in users:
+        users[key] = default_user_block()
+    user_block = users[key]
+    change(user_block)
+    user_block["last_updated"] = ts
+    return user_block
+
+
+def current_selflearn() -> Dict[str, Any]:
+    """In-memory zelfleren-state, incl. nog niet weggeschreven updates."""
+    global _selflearn_state, _selflearn_mtime_ns
+
+    try:
+        mtime_ns = ZELFLEREN_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = None
+
+    if _selflearn_state is None or mtime_ns != _selflearn_mtime_ns:
+        data = _load_selflearn()
+        for user_id, change, ts in _pending_updates:
+            _apply(data, user_id, change, ts)
+        _selflearn_state = data
+        _selflearn_mtime_ns = mtime_ns
+
+    return _selflearn_state
+
+
+def queue_selflearn_update(user_id: int, change: UserBlockChange) -> Dict[str, Any]:
+    """Wijziging direct in de in-memory state; disk volgt via de flush-task."""
+    ts = now_iso()
+    user_block = _apply(current_selflearn(), user_id, change, ts)
+    _pending_updates.append((user_id, change, ts))
+    _schedule_selflearning_flush()
+    return user_block
+
+
+def record_behavior_scores(user_id: int, scores: Dict[str, Any]) -> Dict[str, Any]:
+    """Behavior-scores (api.chat) in het zelfleren-geheugen."""
+    return queue_selflearn_update(user_id, lambda block: apply_scores_to_user_block(block, scores))
+
+
+def on_selflearn_write(hook: Callable[[bytes], None]) -> None:
+    """Hook na elke write (zelfde bytes als het bestand), bijv. een snapshot."""
+    if hook not in _after_write:
+        _after_write.append(hook)
+
+
+def replace_selflearn(data: Dict[str, Any]) -> None:
+    """Restore: volledige inhoud vervangen; wint van nog niet weggeschreven updates."""
+    global _selflearn_state
+    _pending_updates.clear()
+    ZELFLEREN_PATH.parent.mkdir(parents=True, exist_ok=True)
+    _write_bytes_atomic(ZELFLEREN_PATH, _dump_json(data))
+    _selflearn_state = None
+
+
+def _write_bytes_atomic(path: Path, raw: bytes) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(raw)
+    os.replace(tmp, path)
+
+
+def _take_pending() -> Optional[bytes]:
+    """Serialiseert de state (op de loop, orjson houdt de GIL) en leegt de pending-lijst."""
+    if not _pending_updates:
+        return None
+    raw = _dump_json(current_selflearn())
+    _pending_updates.clear()
+    return raw
+
+
+def _write_selflearn(raw: bytes) -> None:
+    global _selflearn_mtime_ns
+    ZELFLEREN_PATH.parent.mkdir(parents=True, exist_ok=True)
+    _write_bytes_atomic(ZELFLEREN_PATH, raw)
+    _selflearn_mtime_ns = ZELFLEREN_PATH.stat().st_mtime_ns
+    for hook in _after_write:
+        try:
+            hook(raw)
+        except Exception:
+            logger.warning("[memory] zelfleren write-hook failed", exc_info=True)
+
+
+def flush_selflearning() -> None:
+    """Openstaande updates synchroon wegschrijven (shutdown)."""
+    global _last_selflearn_flush
+    raw = _take_pending()
+    if raw is None:
+        return
+    try:
+        _write_selflearn(raw)
+    except Exception:
+        logger.warning("[memory] zelfleren flush failed", exc_info=True)
+    _last_selflearn_flush = time.monotonic()
+
+
+async def _flush_selflearning() -> None:
+    global _selflearn_flush_task, _last_selflearn_flush
+    try:
+        delay = _last_selflearn_flush + SELFLEARN_FLUSH_SECONDS - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        raw = _take_pending()
+        if raw is not None:
+            try:
+                await asyncio.to_thread(_write_selflearn, raw)
+            except Exception:
+                logger.warning("[memory] zelfleren flush failed", exc_info=True)
+            _last_selflearn_flush = time.monotonic()
+    finally:
+        _selflearn_flush_task = None
+    # updates die tijdens de write binnenkwamen
+    if _pending_updates:
+        _schedule_selflearning_flush()
+
+
+def _schedule_selflearning_flush() -> None:
+    global _selflearn_flush_task
+    if _selflearn_flush_task is not None:
+        return
+    try:
+        _selflearn_flush_task = asyncio.get_running_loop().create_task(_flush_selflearning())
+    except RuntimeError:
+        # geen event loop (scripts/tests) -> direct schrijven
+        flush_selflearning()
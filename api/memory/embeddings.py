@@ -2,8 +2,15 @@
 from __future__ import annotations
 
 import os
+import time
+import asyncio
+import hashlib
 import logging
-from typing import Optional, List
+from array import array
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, List, Tuple
+
+from asyncpg.exceptions import UndefinedTableError
 
 logger = logging.getLogger("loesoe.memory.embeddings")
 
@@ -34,10 +41,294 @@ def embeddings_enabled() -> bool:
     return bool(get_openai_api_key())
 
 
+# In-process LRU: herhaalde/herformuleerde queries geen nieuwe API-call.
+# Vectoren als array('f') (float32, 4 bytes/dim i.p.v. ~32 voor een float-list);
+# 10k x 1536 dims ~ 60 MB. Pas aan de SQL-grens terug naar list.
+_EMB_CACHE_MAX = 10_000
+_EMB_CACHE: "OrderedDict[Tuple[str, bytes], array]" = OrderedDict()
+
+
+def _cache_key(model: str, text: str) -> Tuple[str, bytes]:
+    return (model, hashlib.blake2b(text.encode(), digest_size=16).digest())
+
+
+def get_cached_embedding(model: str, text: str) -> Optional[List[float]]:
+    """Gedeelde in-process LRU (ook gebruikt door model_router / routes.chat)."""
+    key = _cache_key(model, text)
+    hit = _EMB_CACHE.get(key)
+    if hit is None:
+        return None
+    try:
+        _EMB_CACHE.move_to_end(key)
+    except KeyError:
+        pass
+    return hit.tolist()
+
+
+def put_cached_embedding(model: str, text: str, emb: List[float]) -> None:
+    _EMB_CACHE[_cache_key(model, text)] = array("f", emb)
+    while len(_EMB_CACHE) > _EMB_CACHE_MAX:
+        try:
+            _EMB_CACHE.popitem(last=False)
+        except KeyError:
+            break
+
+
+def get_embeddings(texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    Batch-variant: één OpenAI-call voor alle texts, resultaat per index.
+    Lege texts of een fout -> None op die plek(ken).
+    """
+    out: List[Optional[List[float]]] = [None] * len(texts)
+    model = get_embedding_model()
+    idx = []
+    for i, t in enumerate(texts):
+        if not t or not t.strip():
+            continue
+        out[i] = get_cached_embedding(model, t)
+        if out[i] is None:
+            idx.append(i)
+    if not idx:
+        return out
+
+    api_key = get_openai_api_key()
+    if not api_key:
+        logger.warning("OPENAI_API_KEY missing -> embeddings disabled")
+        return out
+
+    try:
+        from openai import OpenAI
+        client = OpenAI(api_key=api_key)
+        resp = client.embeddings.create(model=model, input=[texts[i] for i in idx])
+        for d in resp.data:
+            i = idx[d.index]
+            out[i] = d.embedding
+            put_cached_embedding(model, texts[i], d.embedding)
+    except Exception as e:
+        logger.warning("get_embeddings failed: %s: %s", type(e).__name__, e)
+    return out
+
+
+class EmbeddingBatcher:
+    """
+    Bundelt gelijktijdige embedding-aanvragen tot één API-call.
+    Eerste aanvraag opent een venster van max_wait_ms; alles wat binnen dat
+    venster (tot max_batch) binnenkomt gaat mee in dezelfde input=[...].
+    """
+
+    def __init__(self, max_batch: int = 64, max_wait_ms: float = 10.0):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._worker(self._queue))
+        return self._queue  # type: ignore[return-value]
+
+    async def submit(self, text: str) -> Optional[List[float]]:
+        if not text or not text.strip():
+            return None
+        # cache-hit: niet op het batch-venster wachten
+        hit = get_cached_embedding(get_embedding_model(), text)
+        if hit is not None:
+            return hit
+        fut = asyncio.get_running_loop().create_future()
+        self._ensure_worker().put_nowait((text, fut))
+        return await fut
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[Tuple[str, asyncio.Future]] = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await asyncio.to_thread(get_embeddings, [t for t, _ in batch])
+            except Exception as e:
+                logger.warning("embedding batch failed: %s: %s", type(e).__name__, e)
+                results = [None] * len(batch)
+
+            for (_, fut), emb in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(emb)
+
+
+batcher = EmbeddingBatcher()
+
+
+# Gedeelde cache in Postgres (zie migrations/*_memory_embedding_cache.sql):
+# ~1 ms index-lookup i.p.v. ~100 ms API-call, ook na een restart.
+_DB_CACHE_SELECT = """
+SELECT embedding FROM memory_embedding_cache
+WHERE text_hash = $1 AND model = $2
+"""
+_DB_CACHE_INSERT = """
+INSERT INTO memory_embedding_cache (text_hash, model, embedding)
+VALUES ($1, $2, $3)
+ON CONFLICT DO NOTHING
+"""
+
+# Retentie: rows ouder dan EMBED_CACHE_TTL_DAYS (0 = nooit) worden na een
+# insert opgeruimd, hooguit 1x per _DB_CACHE_PRUNE_SECONDS per proces.
+# Een verlopen tekst kost daarna hooguit één nieuwe API-call.
+_DB_CACHE_TTL_DAYS = int(os.getenv("EMBED_CACHE_TTL_DAYS", "30"))
+_DB_CACHE_PRUNE_SECONDS = 3600.0
+_DB_CACHE_PRUNE = """
+DELETE FROM memory_embedding_cache
+WHERE created_at < now() - make_interval(days => $1)
+"""
+
+# False zodra de tabel ontbreekt (migratie niet gedraaid): DB-cache overslaan
+# i.p.v. bij elke call een mislukte query + warning.
+_db_cache_enabled = True
+_last_db_cache_prune = 0.0
+
+
+def _db_cache_error(what: str, e: Exception) -> None:
+    global _db_cache_enabled
+    if isinstance(e, UndefinedTableError):
+        if _db_cache_enabled:
+            _db_cache_enabled = False
+            logger.warning("memory_embedding_cache ontbreekt (migratie?) -> DB-cache uitgeschakeld")
+        return
+    logger.warning("embedding cache %s failed: %s: %s", what, type(e).__name__, e)
+
+
+async def _maybe_prune_db_cache(conn: Any) -> None:
+    global _last_db_cache_prune
+    if _DB_CACHE_TTL_DAYS <= 0:
+        return
+    now = time.monotonic()
+    if _last_db_cache_prune and now - _last_db_cache_prune < _DB_CACHE_PRUNE_SECONDS:
+        return
+    _last_db_cache_prune = now
+    await conn.execute(_DB_CACHE_PRUNE, _DB_CACHE_TTL_DAYS)
+
+
+def _vector_to_list(v: Any) -> List[float]:
+    # pgvector geregistreerd -> numpy array; anders de tekstvorm "[...]"
+    if hasattr(v, "tolist"):
+        return v.tolist()
+    return [float(x) for x in str(v).strip("[]").split(",")]
+
+
+async def get_embedding_async(text: str, pool: Any) -> Optional[List[float]]:
+    """
+    Async request-pad: LRU -> memory_embedding_cache -> batcher (OpenAI).
+    De DB-cache is best-effort: elke fout daar valt terug op de API.
+    """
+    if not text or not text.strip():
+        return None
+
+    model = get_embedding_model()
+    hit = get_cached_embedding(model, text)
+    if hit is not None:
+        return hit
+
+    text_hash = _cache_key(model, text)[1]
+    if _db_cache_enabled:
+        try:
+            async with pool.acquire() as conn:
+                row = await conn.fetchval(_DB_CACHE_SELECT, text_hash, model)
+            if row is not None:
+                emb = _vector_to_list(row)
+                put_cached_embedding(model, text, emb)
+                return emb
+        except Exception as e:
+            _db_cache_error("lookup", e)
+
+    emb = await batcher.submit(text)
+    if not emb:
+        return None
+
+    if _db_cache_enabled:
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute(_DB_CACHE_INSERT, text_hash, model, emb)
+                await _maybe_prune_db_cache(conn)
+        except Exception as e:
+            _db_cache_error("insert", e)
+    return emb
+
+
+_DB_CACHE_SELECT_MANY = """
+SELECT text_hash, embedding FROM memory_embedding_cache
+WHERE model = $1 AND text_hash = ANY($2::bytea[])
+"""
+
+
+async def embed_cached(
+    texts: List[str],
+    model: str,
+    pool: Any,
+    embed_many: Callable[[List[str]], Awaitable[List[List[float]]]],
+) -> List[List[float]]:
+    """
+    Content-addressed batch-embeddings: LRU -> memory_embedding_cache
+    (één ANY()-lookup) -> embed_many() voor alleen de misses (uniek) ->
+    bulk-insert in de DB-cache. Zelfde tekst + model = zelfde vector,
+    ongeacht user/row, dus de API wordt per unieke tekst één keer betaald.
+    """
+    out: List[Optional[List[float]]] = [get_cached_embedding(model, t) for t in texts]
+
+    # misses per hash (dubbele teksten in één call -> één lookup/embedding)
+    missing: Dict[bytes, str] = {}
+    for t, e in zip(texts, out):
+        if e is None:
+            missing.setdefault(_cache_key(model, t)[1], t)
+
+    found: Dict[bytes, List[float]] = {}
+    if missing and _db_cache_enabled:
+        try:
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(_DB_CACHE_SELECT_MANY, model, list(missing))
+            for r in rows:
+                emb = _vector_to_list(r["embedding"])
+                h = bytes(r["text_hash"])
+                found[h] = emb
+                put_cached_embedding(model, missing.pop(h), emb)
+        except Exception as e:
+            _db_cache_error("lookup", e)
+
+    if missing:
+        hashes = list(missing)
+        fresh = await embed_many([missing[h] for h in hashes])
+        for h, emb in zip(hashes, fresh):
+            found[h] = emb
+            put_cached_embedding(model, missing[h], emb)
+        if _db_cache_enabled:
+            try:
+                async with pool.acquire() as conn:
+                    await conn.executemany(
+                        _DB_CACHE_INSERT, [(h, model, emb) for h, emb in zip(hashes, fresh)]
+                    )
+                    await _maybe_prune_db_cache(conn)
+            except Exception as e:
+                _db_cache_error("insert", e)
+
+    return [
+        e if e is not None else found[_cache_key(model, t)[1]]
+        for t, e in zip(texts, out)
+    ]
+
+
 def get_embedding(text: str) -> Optional[List[float]]:
     """
     Returns embedding vector for text, or None if missing key / fails.
     Sync call (OpenAI python client is sync); fine for debug/backfill.
+    Request-pad: gebruik `await batcher.submit(text)`.
     """
     if not text or not text.strip():
         return None
@@ -48,12 +339,17 @@ def get_embedding(text: str) -> Optional[List[float]]:
         return None
 
     model = get_embedding_model()
+    hit = get_cached_embedding(model, text)
+    if hit is not None:
+        return hit
 
     try:
         from openai import OpenAI
         client = OpenAI(api_key=api_key)
         resp = client.embeddings.create(model=model, input=text)
-        return resp.data[0].embedding
+        emb = resp.data[0].embedding
+        put_cached_embedding(model, text, emb)
+        return emb
     except Exception as e:
         logger.warning("get_embedding failed: %s: %s", type(e).__name__, e)
         return None
@@ -1,50 +1,72 @@
 # api/memory/retrieval.py
 from __future__ import annotations
 
-import os
+import hashlib
 import logging
-import asyncio
 from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 import asyncpg
+import orjson
+from cachetools import TTLCache
 
-from .embeddings import get_embedding, normalize_db_dsn
+from api.db.database import get_pool, vector_codec_ready
 
-logger = logging.getLogger("loesoe.memory.retrieval")
-
-_POOL: Optional[asyncpg.Pool] = None
+from .embeddings import get_embedding_async
 
+logger = logging.getLogger("loesoe.memory.retrieval")
 
-def _get_db_dsn() -> str:
-    dsn = os.getenv("DATABASE_URL", "").strip()
-    if not dsn:
-        raise RuntimeError("DATABASE_URL ontbreekt in env")
-    return normalize_db_dsn(dsn)
+# Retrieval-resultaten kort bewaren: zelfde (user, query, k, ...) binnen
+# een sessie -> geen embedding + SQL. Alleen vanuit de event loop gebruikt
+# (geen await tussen get/set), dus geen lock nodig. Nieuwe memories voor een
+# user: invalidate_retrieval_cache(user_id).
+_RESULT_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=60)
 
 
-async def _init_connection(conn: asyncpg.Connection) -> None:
-    """Per-connection init hook (pgvector type registration)."""
-    try:
-        from pgvector.asyncpg import register_vector  # type: ignore
-    except Exception:
-        # pgvector package ontbreekt → we vallen terug op string-cast embedding
+def invalidate_retrieval_cache(user_id: Any = None) -> None:
+    """Cache legen voor één user (of alles bij user_id=None)."""
+    if user_id is None:
+        _RESULT_CACHE.clear()
         return
-    try:
-        await register_vector(conn)
-    except Exception:
-        logger.exception("[memory] register_vector failed; falling back to string-cast embeddings")
-
+    uid = str(user_id)
+    for key in [k for k in list(_RESULT_CACHE.keys()) if k[0] == uid]:
+        _RESULT_CACHE.pop(key, None)
 
-async def _get_pool() -> asyncpg.Pool:
-    global _POOL
-    if _POOL is not None:
-        return _POOL
 
-    dsn = _get_db_dsn()
-    _POOL = await asyncpg.create_pool(dsn=dsn, min_size=1, max_size=5, init=_init_connection)
-    logger.info("[memory] asyncpg pool ready")
-    return _POOL
+def _get_pool() -> asyncpg.Pool:
+    """
+    Gedeelde pool uit api.db.database: pgvector-codec per connection,
+    ivfflat.probes/hnsw.ef_search als server_settings van de pool.
+    """
+    pool = get_pool()
+    if pool is None:
+        raise RuntimeError("DB pool not initialized")
+    return pool
+
+
+def _vector_literal(vec: List[float]) -> str:
+    # pgvector tekstvorm "[x,y,...]" als de binaire codec niet geregistreerd is
+    return orjson.dumps(vec).decode()
+
+
+# Cosine distance in pgvector: <=>  (0 = identiek, hoger = minder vergelijkbaar)
+# NB: kolomnaam is 'text' (aligned met debug endpoints / StoreReq.text)
+# Module-constante: zelfde string -> asyncpg statement-cache hit (geen parse/plan per call)
+RETRIEVE_SQL = """
+SELECT
+  id,
+  text,
+  COALESCE(metadata, '{}'::jsonb) AS metadata,
+  created_at,
+  (embedding <=> $2::vector) AS distance
+FROM memory_embeddings
+WHERE user_id = $1::uuid
+  AND embedding IS NOT NULL
+  AND (embedding <=> $2::vector) <= $4
+  AND ($5::boolean OR COALESCE((metadata->>'is_test')::boolean, false) = false)
+ORDER BY embedding <=> $2::vector
+LIMIT $3;
+"""
 
 
 async def retrieve_memories(
@@ -64,58 +86,36 @@ async def retrieve_memories(
     if not query or not query.strip():
         return []
 
-    # Embedding genereren (sync call) → veilig in thread
-    emb = await asyncio.to_thread(get_embedding, query)
+    cache_key = (
+        str(user_id),
+        hashlib.blake2b(query.encode(), digest_size=16).digest(),
+        int(k),
+        round(float(max_distance), 3),
+        bool(include_test),
+    )
+    hit = _RESULT_CACHE.get(cache_key)
+    if hit is not None:
+        # kopie: callers mogen de dicts aanpassen zonder de cache te raken
+        return [dict(m) for m in hit]
+
+    pool = _get_pool()
+
+    # Embedding: LRU -> DB-cache -> batcher (gelijktijdige queries delen één API-call)
+    emb = await get_embedding_async(query, pool)
     if not emb:
         logger.warning("[memory] embedding missing (OPENAI_API_KEY?) -> retrieval disabled")
         return []
 
-    # Probeer list[float] direct te sturen (werkt als pgvector type is geregistreerd).
-    # Fallback: string-cast "[...]" (werkt altijd).
-    emb_param: Any = emb
-    emb_txt = "[" + ",".join(str(x) for x in emb) + "]"
-
-    pool = await _get_pool()
-
-    # Cosine distance in pgvector: <=>  (0 = identiek, hoger = minder vergelijkbaar)
-    # NB: kolomnaam is 'text' (aligned met debug endpoints / StoreReq.text)
-    sql = """
-    SELECT
-      id,
-      text,
-      COALESCE(metadata, '{}'::jsonb) AS metadata,
-      created_at,
-      (embedding <=> $2::vector) AS distance
-    FROM memory_embeddings
-    WHERE user_id = $1::uuid
-      AND embedding IS NOT NULL
-      AND (embedding <=> $2::vector) <= $4
-      AND ($5::boolean OR COALESCE((metadata->>'is_test')::boolean, false) = false)
-    ORDER BY embedding <=> $2::vector
-    LIMIT $3;
-    """
-
     try:
         async with pool.acquire() as conn:
-            try:
-                rows = await conn.fetch(
-                    sql,
-                    str(user_id),
-                    emb_param,
-                    int(k),
-                    float(max_distance),
-                    bool(include_test),
-                )
-            except Exception:
-                logger.exception("[memory] vector param failed; retrying with string-cast embedding")
-                rows = await conn.fetch(
-                    sql,
-                    str(user_id),
-                    emb_txt,
-                    int(k),
-                    float(max_distance),
-                    bool(include_test),
-                )
+            rows = await conn.fetch(
+                RETRIEVE_SQL,
+                str(user_id),
+                emb if vector_codec_ready() else _vector_literal(emb),
+                int(k),
+                float(max_distance),
+                bool(include_test),
+            )
     except Exception:
         logger.exception("[memory] retrieval failed")
         return []
@@ -139,4 +139,5 @@ async def retrieve_memories(
     else:
         logger.info("[memory] user_id=%s found=0", user_id)
 
+    _RESULT_CACHE[cache_key] = [dict(m) for m in out]
     return out
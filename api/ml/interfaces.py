@@ -1,14 +1,15 @@
 from __future__ import annotations
 
+from collections import Counter
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Literal, Optional
+from typing import Any, Dict, List, Literal, Mapping, Optional, Tuple
 
 
 MLStatus = Literal["ok", "warn", "error"]
 MLResultKind = Literal["score", "flags", "suggestion", "summary"]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class MLInputRef:
     """
     Verwijzing naar een bron die gebruikt is voor een ML-resultaat.
@@ -20,7 +21,7 @@ class MLInputRef:
     note: Optional[str] = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class MLExplain:
     """
     Menselijke uitleg + (optioneel) technische details.
@@ -29,7 +30,7 @@ class MLExplain:
     debug: Dict[str, Any] = field(default_factory=dict)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class MLResult:
     """
     Standaard output van één ML-module.
@@ -55,7 +56,7 @@ class MLResult:
     explain: MLExplain = field(default_factory=lambda: MLExplain(text=""))
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class MLContext:
     """
     Context die aan ML-modules wordt meegegeven.
@@ -64,12 +65,40 @@ class MLContext:
     user_id: Optional[str] = None
     now_utc: Optional[str] = None
 
-    # Snapshot van patterns (bijv. uit DB opgehaald door caller)
-    patterns: List[Dict[str, Any]] = field(default_factory=list)
+    # Snapshot van patterns (bijv. uit DB opgehaald door caller);
+    # dicts of asyncpg Records -> modules gebruiken alleen p[...] / p.get(...)
+    patterns: List[Mapping[str, Any]] = field(default_factory=list)
 
     # Extra (optioneel) – caller bepaalt wat erin zit
     meta: Dict[str, Any] = field(default_factory=dict)
 
+    # Lazy index over patterns, gedeeld door alle modules die deze ctx krijgen
+    # (intern; de dict zelf wordt gevuld, de dataclass blijft frozen)
+    _index: Dict[str, Any] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def _pattern_index(self) -> Dict[str, Any]:
+        idx = self._index
+        if not idx:
+            patterns = self.patterns or []
+            types = [p.get("pattern_type") for p in patterns]
+            by_key: Dict[Tuple[Any, Any], Dict[str, Any]] = {}
+            for p, t in zip(patterns, types):
+                # eerste match wint (zelfde als een lineaire scan)
+                by_key.setdefault((t, p.get("key")), p)
+            # Counter telt in C (_count_elements) i.p.v. get+set per element
+            by_type = dict(Counter(str(t or "unknown") for t in types))
+            # in één update: modules in andere threads zien nooit een half gevulde index
+            idx.update(by_key=by_key, by_type=by_type)
+        return idx
+
+    def find_pattern(self, pattern_type: str, key: str) -> Optional[Dict[str, Any]]:
+        """Eerste pattern met (pattern_type, key); O(1) na de eerste aanroep."""
+        return self._pattern_index()["by_key"].get((pattern_type, key))
+
+    def pattern_type_counts(self) -> Dict[str, int]:
+        """Aantal patterns per pattern_type ("unknown" als die ontbreekt)."""
+        return self._pattern_index()["by_type"]
+
 
 class MLModule:
     """
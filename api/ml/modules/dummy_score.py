@@ -15,7 +15,8 @@ class DummyScoreModule(MLModule):
     version = "0.1.0"
 
     def compute(self, ctx: MLContext) -> MLResult:
-        now = datetime.now(timezone.utc).isoformat()
+        # één timestamp per evaluatie (dispatcher zet ctx.now_utc)
+        now = ctx.now_utc or datetime.now(timezone.utc).isoformat()
 
         return MLResult(
             module=self.name,
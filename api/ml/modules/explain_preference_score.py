@@ -1,48 +1,29 @@
 from __future__ import annotations
 
-import json
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
 
 from ..interfaces import MLContext, MLExplain, MLInputRef, MLModule, MLResult
 
 
-def _clamp01(x: float) -> float:
-    return max(0.0, min(1.0, x))
+_loads = orjson.loads
 
-
-def _to_float(x: Any, default: float = 0.0) -> float:
-    try:
-        if x is None:
-            return default
-        if isinstance(x, bool):
-            return float(int(x))
-        if isinstance(x, (int, float)):
-            return float(x)
-        if isinstance(x, str):
-            x = x.strip().replace(",", ".")
-            return float(x)
-        return default
-    except Exception:
-        return default
-
-
-def _normalize_confidence(conf_raw: Any) -> float:
-    c = _to_float(conf_raw, default=0.0)
-    if c > 1.0:
-        c = c / 100.0
-    return _clamp01(c)
+# level -> base score
+_LVL = {"high": 1.0, "medium": 0.6, "low": 0.2}
 
 
 def _try_parse_json_object(s: str) -> Optional[Dict[str, Any]]:
+    # alleen het eerste teken checken; orjson faalt zelf snel op rest/trailing rommel
     s = s.strip()
-    if not (s.startswith("{") and s.endswith("}")):
+    if not s or s[0] != "{":
         return None
     try:
-        obj = json.loads(s)
-        return obj if isinstance(obj, dict) else None
-    except Exception:
+        obj = _loads(s)
+    except orjson.JSONDecodeError:
         return None
+    return obj if isinstance(obj, dict) else None
 
 
 def _extract_level(value: Any) -> str:
@@ -77,20 +58,31 @@ def _extract_level(value: Any) -> str:
     return "unknown"
 
 
-def _level_to_base(level: str) -> float:
-    m = {
-        "high": 1.0,
-        "medium": 0.6,
-        "low": 0.2,
-    }
-    return float(m.get(level, 0.0))
+def _preference_score(level: str, conf_raw: Any) -> Tuple[float, float, float]:
+    """
+    (base, confidence, score) in één functie:
+    - confidence: float (ook "0,8"), >1 = procent, geclampt op 0..1; onleesbaar -> 0
+    - base: _LVL[level], onbekend -> 0
+    """
+    # EAFP: de gewone case (int/float/numeric string) is één float()-call
+    try:
+        c = float(conf_raw)
+    except (TypeError, ValueError):
+        try:
+            c = float(conf_raw.strip().replace(",", "."))
+        except Exception:
+            c = 0.0
+    if c > 1.0:
+        c = c / 100.0
+    c = max(0.0, min(1.0, c))
 
+    base = _LVL.get(level, 0.0)
+    score = round(max(0.0, min(1.0, base * c)), 4)
+    return base, c, score
 
-def _find_explain_level_pattern(patterns: list[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
-    for p in patterns:
-        if p.get("pattern_type") == "preference" and p.get("key") == "explain_level":
-            return p
-    return None
+
+def _find_explain_level_pattern(ctx: MLContext) -> Optional[Dict[str, Any]]:
+    return ctx.find_pattern("preference", "explain_level")
 
 
 class ExplainPreferenceScore(MLModule):
@@ -98,10 +90,10 @@ class ExplainPreferenceScore(MLModule):
     version = "0.2.1"
 
     def compute(self, ctx: MLContext) -> MLResult:
-        now = datetime.now(timezone.utc).isoformat()
-        patterns = ctx.patterns or []
+        # één timestamp per evaluatie (dispatcher zet ctx.now_utc)
+        now = ctx.now_utc or datetime.now(timezone.utc).isoformat()
 
-        p = _find_explain_level_pattern(patterns)
+        p = _find_explain_level_pattern(ctx)
 
         if not p:
             return MLResult(
@@ -127,13 +119,9 @@ class ExplainPreferenceScore(MLModule):
             )
 
         conf_raw = p.get("confidence", 0)
-        conf = _normalize_confidence(conf_raw)
-
         raw_value = p.get("value")
         level = _extract_level(raw_value)
-        base = _level_to_base(level)
-
-        score = round(_clamp01(base * conf), 4)
+        base, conf, score = _preference_score(level, conf_raw)
 
         return MLResult(
             module=self.name,
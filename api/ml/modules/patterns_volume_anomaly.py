@@ -20,16 +20,14 @@ class PatternsVolumeAnomaly(MLModule):
     HIGH_VOLUME = 100
 
     def compute(self, ctx: MLContext) -> MLResult:
-        now = datetime.now(timezone.utc).isoformat()
+        # één timestamp per evaluatie (dispatcher zet ctx.now_utc)
+        now = ctx.now_utc or datetime.now(timezone.utc).isoformat()
 
         patterns = ctx.patterns or []
         total = len(patterns)
 
-        # Type breakdown (transparant)
-        by_type: Dict[str, int] = {}
-        for p in patterns:
-            t = str(p.get("pattern_type") or "unknown")
-            by_type[t] = by_type.get(t, 0) + 1
+        # Type breakdown (transparant); uit de gedeelde ctx-index
+        by_type: Dict[str, int] = ctx.pattern_type_counts()
 
         low = total < self.MIN_EXPECTED
         high = total >= self.HIGH_VOLUME
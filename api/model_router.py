@@ -7,17 +7,27 @@
 # ✅ History caps (tokens onder controle)
 # ✅ GPT-5 temperature guard
 
+import bisect
+import functools
+import itertools
 import os
+import random
+import re
 import json
 import logging
 import asyncio
-from typing import List, Dict, Optional, Any, Tuple
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 from uuid import UUID
 
 import asyncpg
+import orjson
 from fastapi import APIRouter, Body
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, RateLimitError
+
+from api.db.database import get_pool, vector_codec_ready
+from api.memory.embeddings import get_cached_embedding, put_cached_embedding
 
 logger = logging.getLogger("loesoe.model_router")
 router = APIRouter()
@@ -53,15 +63,34 @@ MEMORY_DISTANCE_METRIC = os.getenv("MEMORY_DISTANCE_METRIC", "l2").strip().lower
 if MEMORY_DISTANCE_METRIC not in ("l2", "cosine"):
     MEMORY_DISTANCE_METRIC = "l2"
 
+# halfvec (fp16) kolom + index gebruiken (zie migrations/*_memory_embeddings_halfvec.sql)
+MEMORY_HALFVEC = os.getenv("MEMORY_HALFVEC", "false").lower() in ("1", "true", "yes", "y", "on")
+
 # history caps
 HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "12"))
 HISTORY_MAX_CHARS = int(os.getenv("HISTORY_MAX_CHARS", "6000"))
 
-DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
-
 # model params
 MODEL_TEMPERATURE = float(os.getenv("MODEL_TEMPERATURE", "0.3"))
 
+# Max gelijktijdige OpenAI-calls (chat + embeddings) vanuit dit proces;
+# bij een burst wachten requests hier i.p.v. allemaal een 429 te krijgen.
+OPENAI_MAX_INFLIGHT = int(os.getenv("OPENAI_MAX_INFLIGHT", "10"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))
+
+
+# ✅ System rules (leidend) — constant, één keer bij import opgebouwd.
+# SYSTEM_PROMPT_MSG wordt gedeeld door alle requests: niet muteren.
+SYSTEM_PROMPT = (
+    "Je bent Loesoe. Antwoord kort en duidelijk in het Nederlands.\n"
+    "Kernregels (leidend):\n"
+    "- /healthz is de enige waarheid over status.\n"
+    "- .env is de enige bron van waarheid voor configuratie.\n"
+    "- Geen hardcoded secrets.\n"
+)
+SYSTEM_PROMPT_MSG: Dict[str, str] = {"role": "system", "content": SYSTEM_PROMPT}
+
 
 # ==============================
 # REQUEST MODEL
@@ -94,6 +123,9 @@ def _as_metadata_dict(md: Any) -> Dict[str, Any]:
     return {}
 
 
+# Pure functies van korte strings die per request/history-item terugkomen
+# -> memoizen (UUID is immutable, dus delen is veilig)
+@functools.lru_cache(maxsize=4096)
 def _parse_uuid(value: Optional[str]) -> Optional[UUID]:
     try:
         return UUID(value) if value else None
@@ -101,13 +133,19 @@ def _parse_uuid(value: Optional[str]) -> Optional[UUID]:
         return None
 
 
-def _safe_role(role: Any) -> Optional[str]:
-    r = str(role or "").strip().lower()
+@functools.lru_cache(maxsize=256)
+def _role_from_str(role: str) -> Optional[str]:
+    r = role.strip().lower()
     if r in ("system", "user", "assistant"):
         return r
     return None
 
 
+def _safe_role(role: Any) -> Optional[str]:
+    # role kan uit de frontend van alles zijn (ook unhashable) -> eerst str()
+    return _role_from_str(role if type(role) is str else str(role or ""))
+
+
 def _normalize_history(history: Optional[List[Dict[str, Any]]]) -> List[Dict[str, str]]:
     """
     Accepteert frontend history als [{role, content}, ...]
@@ -141,87 +179,123 @@ def _normalize_history(history: Optional[List[Dict[str, Any]]]) -> List[Dict[str
     return normalized
 
 
+# Enkele tekens via één translate-pass, de "â€x" mojibake-reeksen via één regex.
+_ENCODING_TABLE = str.maketrans({"\u2011": "-", "\u2013": "-", "\u2014": "-"})
+_MOJIBAKE_MAP = {
+    "â€‘": "-",
+    "â€“": "-",
+    "â€”": "-",
+    "â€™": "'",
+    "â€œ": '"',
+    "â€\u009d": '"',
+    "â€\u0098": "'",
+    "â€\u0099": "'",
+}
+_MOJIBAKE_RE = re.compile("|".join(map(re.escape, _MOJIBAKE_MAP)))
+
+
 def _normalize_encoding(text: str) -> str:
     """
     Fix voor Windows/UTF-8 artifacts zoals: "â€‘" / "â€™" / rare dashes.
     Houdt output/logs/UI schoon.
     """
-    return (
-        text.replace("\u2011", "-")
-        .replace("\u2013", "-")
-        .replace("\u2014", "-")
-        .replace("â€‘", "-")
-        .replace("â€“", "-")
-        .replace("â€”", "-")
-        .replace("â€™", "'")
-        .replace("â€œ", '"')
-        .replace("â€\u009d", '"')
-        .replace("â€\u0098", "'")
-        .replace("â€\u0099", "'")
-    )
+    text = text.translate(_ENCODING_TABLE)
+    if "â€" not in text:
+        return text
+    return _MOJIBAKE_RE.sub(lambda m: _MOJIBAKE_MAP[m.group()], text)
 
 
 # ==============================
 # DB
 # ==============================
-_db_pool: Optional[asyncpg.Pool] = None
+def _db() -> asyncpg.Pool:
+    """
+    Gedeelde pool uit api.db.database (jsonb-codec en pgvector per connection,
+    hnsw.ef_search als server_setting). Geen eigen pool meer naast die van de rest van de app.
+    """
+    pool = get_pool()
+    if pool is None:
+        raise RuntimeError("DB pool not initialized")
+    return pool
 
 
-async def _db() -> asyncpg.Pool:
-    global _db_pool
-    if _db_pool is not None:
-        return _db_pool
+# ==============================
+# OPENAI (concurrency cap + 429-retry)
+# ==============================
+_OAI_SEM = asyncio.Semaphore(OPENAI_MAX_INFLIGHT)
 
-    if not DATABASE_URL:
-        raise RuntimeError("DATABASE_URL is empty")
+_T = TypeVar("_T")
 
-    # normalize for asyncpg pool
-    dsn = DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
-    _db_pool = await asyncpg.create_pool(dsn=dsn, min_size=1, max_size=5)
-    return _db_pool
+
+async def _openai(call: Callable[[], Awaitable[_T]]) -> _T:
+    """
+    Eén OpenAI-call onder _OAI_SEM. RateLimitError -> exponentiële backoff met
+    full jitter (max MODEL_MAX_RETRIES extra pogingen); de slot wordt tijdens
+    het wachten vrijgegeven. Andere fouten gaan direct door naar de caller
+    (die kiest dan het fallback-model).
+    """
+    attempt = 0
+    while True:
+        try:
+            async with _OAI_SEM:
+                return await call()
+        except RateLimitError:
+            if attempt >= MODEL_MAX_RETRIES:
+                raise
+            delay = random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2**attempt))
+            attempt += 1
+            logger.info("openai rate limited, retry %s in %.2fs", attempt, delay)
+            await asyncio.sleep(delay)
 
 
 # ==============================
 # EMBEDDINGS / RETRIEVAL
 # ==============================
 async def _embed(text: str) -> List[float]:
-    res = await client.embeddings.create(model=EMBEDDING_MODEL, input=text)
-    return res.data[0].embedding
+    # herhaalde queries ("hi", "status", ...) -> gedeelde LRU, geen API-call
+    hit = get_cached_embedding(EMBEDDING_MODEL, text)
+    if hit is not None:
+        return hit
+    res = await _openai(lambda: client.embeddings.create(model=EMBEDDING_MODEL, input=text))
+    emb = res.data[0].embedding
+    put_cached_embedding(EMBEDDING_MODEL, text, emb)
+    return emb
 
 
 def _vec(v: List[float]) -> str:
-    return "[" + ",".join(str(x) for x in v) + "]"
+    # orjson: "[x,y,...]" in één C-call (pgvector tekstvorm)
+    return orjson.dumps(v).decode()
 
 
-def _distance_operator() -> str:
+def _memory_sql(op: str, halfvec: bool) -> str:
     # pgvector operators:
     # <->  : L2 distance
     # <=>  : cosine distance
-    return "<=>" if MEMORY_DISTANCE_METRIC == "cosine" else "<->"
-
-
-async def _fetch_memories(user_id: str, query: str) -> Tuple[List[Dict[str, Any]], Optional[float]]:
-    uid = _parse_uuid(user_id)
-    if not uid:
-        return [], None
-
-    vec = await _embed(query)
-    pool = await _db()
-    op = _distance_operator()
-
-    sql = f"""
-        SELECT content, metadata, (embedding {op} $2::vector) AS distance
+    col, cast = ("embedding_h", "halfvec") if halfvec else ("embedding", "vector")
+    return f"""
+        SELECT content, metadata, ({col} {op} $2::{cast}) AS distance
         FROM public.memory_embeddings
-        WHERE user_id = $1
-          AND (embedding {op} $2::vector) <= $3
+        WHERE user_id = $1::uuid
+          AND ({col} {op} $2::{cast}) <= $3
         ORDER BY distance ASC
         LIMIT $4
     """
 
+
+# Metric/halfvec liggen vast bij import -> één vaste SQL-tekst, dus asyncpg's
+# statement-cache hit (geen parse/plan per request).
+_SQL_L2 = _memory_sql("<->", MEMORY_HALFVEC)
+_SQL_COSINE = _memory_sql("<=>", MEMORY_HALFVEC)
+_MEMORY_SQL = _SQL_COSINE if MEMORY_DISTANCE_METRIC == "cosine" else _SQL_L2
+
+
+async def _fetch_memories_by_vec(
+    pool: asyncpg.Pool, uid: UUID, vec: List[float]
+) -> Tuple[List[Dict[str, Any]], Optional[float]]:
     rows = await pool.fetch(
-        sql,
-        str(uid),
-        _vec(vec),
+        _MEMORY_SQL,
+        uid,  # uuid.UUID -> binair als uuid, geen tekst-parse server-side
+        vec if vector_codec_ready() else _vec(vec),
         MEMORY_MAX_DISTANCE,
         MEMORY_TOP_K,
     )
@@ -253,31 +327,28 @@ def _build_memory_block(memories: List[Dict[str, Any]]) -> Optional[str]:
     if not memories:
         return None
 
-    total = 0
-    lines = []
-    for m in memories:
-        tag = m["metadata"].get("tag")
-        line = f"- [{tag}] {m['content']}" if tag else f"- {m['content']}"
-        if total + len(line) > MEMORY_MAX_CHARS:
-            break
-        lines.append(line)
-        total += len(line)
+    lines = [
+        f"- [{tag}] {content}" if tag else f"- {content}"
+        for content, tag in ((m["content"], m["metadata"].get("tag")) for m in memories)
+    ]
+    # cumulatieve lengte is oplopend -> bisect vindt de eerste regel die
+    # MEMORY_MAX_CHARS overschrijdt (zelfde cutoff als de oude break-loop)
+    cut = bisect.bisect_right(list(itertools.accumulate(map(len, lines))), MEMORY_MAX_CHARS)
 
-    return "Relevante herinneringen (ter verificatie):\n" + "\n".join(lines)
+    return "Relevante herinneringen (ter verificatie):\n" + "\n".join(lines[:cut])
 
 
 # ==============================
 # CORE
 # ==============================
-async def generate_reply(
+async def _prepare_messages(
     message: str,
     history: Optional[List[Dict[str, Any]]],
     user_id: Optional[str],
-) -> Tuple[str, Dict[str, Any]]:
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
     """
-    Return:
-      reply_text (clean)
-      debug_info dict (altijd gevuld, maar route stuurt 'm alleen terug bij debug=true)
+    Retrieval + history -> messages voor de model-call.
+    Gedeeld door generate_reply (volledige tekst) en generate_reply_stream (SSE).
     """
     debug_info: Dict[str, Any] = {
         "model": None,
@@ -295,15 +366,21 @@ async def generate_reply(
     best_distance: Optional[float] = None
     memory_block: Optional[str] = None
 
+    uid = _parse_uuid(user_id)
+    debug_info["user_id_valid"] = uid is not None
+
+    # Embedding meteen starten; history normaliseren overlapt ermee
+    retrieval = None
+    if MEMORY_RETRIEVAL_ENABLED and uid is not None:
+        retrieval = asyncio.ensure_future(_embed(message))
+
     normalized_history = _normalize_history(history)
     debug_info["history_used"] = len(normalized_history)
 
-    if user_id and _parse_uuid(user_id):
-        debug_info["user_id_valid"] = True
-
-    if MEMORY_RETRIEVAL_ENABLED and user_id and debug_info["user_id_valid"]:
+    if retrieval is not None:
         try:
-            memories, best_distance = await _fetch_memories(user_id, message)
+            vec = await retrieval
+            memories, best_distance = await _fetch_memories_by_vec(_db(), uid, vec)
             memory_block = _build_memory_block(memories)
 
             debug_info["memory_hits"] = len(memories)
@@ -326,28 +403,39 @@ async def generate_reply(
             logger.warning("memory retrieval failed: %s", e)
             debug_info["memory_error"] = str(e)
 
-    # ✅ System rules (leidend)
-    system_prompt = (
-        "Je bent Loesoe. Antwoord kort en duidelijk in het Nederlands.\n"
-        "Kernregels (leidend):\n"
-        "- /healthz is de enige waarheid over status.\n"
-        "- .env is de enige bron van waarheid voor configuratie.\n"
-        "- Geen hardcoded secrets.\n"
-    )
+    messages: List[Dict[str, str]] = [
+        SYSTEM_PROMPT_MSG,
+        *([{"role": "system", "content": memory_block}] if memory_block else ()),
+        *normalized_history,
+        {"role": "user", "content": message},
+    ]
+
+    return messages, debug_info
+
 
-    messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
-    if memory_block:
-        messages.append({"role": "system", "content": memory_block})
+def _model_kwargs(model: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {"model": model, "messages": messages}
+    # guard: gpt-5* accepteert geen temperature
+    if not model.startswith("gpt-5"):
+        kwargs["temperature"] = MODEL_TEMPERATURE
+    return kwargs
 
-    messages.extend(normalized_history)
-    messages.append({"role": "user", "content": message})
+
+async def generate_reply(
+    message: str,
+    history: Optional[List[Dict[str, Any]]],
+    user_id: Optional[str],
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Return:
+      reply_text (clean)
+      debug_info dict (altijd gevuld, maar route stuurt 'm alleen terug bij debug=true)
+    """
+    messages, debug_info = await _prepare_messages(message, history, user_id)
 
     async def _call(model: str) -> str:
-        kwargs: Dict[str, Any] = {"model": model, "messages": messages}
-        # guard: gpt-5* accepteert geen temperature
-        if not model.startswith("gpt-5"):
-            kwargs["temperature"] = MODEL_TEMPERATURE
-        r = await client.chat.completions.create(**kwargs)
+        kwargs = _model_kwargs(model, messages)
+        r = await _openai(lambda: client.chat.completions.create(**kwargs))
         return r.choices[0].message.content or ""
 
     attempt = 0
@@ -376,11 +464,108 @@ async def generate_reply(
             return "Ik liep even vast bij de AI-call. Probeer het nog een keer.", debug_info
 
 
+
+# Mojibake-reeksen ("â€x") zijn 3 tekens; een chunk die eindigt op een
+# begonnen reeks houden we vast tot de volgende chunk er is.
+_MOJIBAKE_HOLD = 2
+
+
+async def _normalized_chunks(stream: Any):
+    """
+    Delta-tekst uit een OpenAI-stream, per stuk door _normalize_encoding.
+    Net als _clean() bij /chat: geen witruimte aan begin of eind. Witruimte aan
+    het eind van een stuk houden we vast tot er weer tekst komt.
+    """
+    carry = ""
+    ws = ""
+    started = False
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        piece = chunk.choices[0].delta.content
+        if not piece:
+            continue
+
+        text = carry + piece
+        cut = text.find("â", len(text) - _MOJIBAKE_HOLD)
+        if cut < 0:
+            cut = len(text)
+        carry = text[cut:]
+        text = text[:cut]
+
+        if not started:
+            text = text.lstrip()
+        body = text.rstrip()
+        if body:
+            started = True
+            yield _normalize_encoding(ws + body)
+            ws = text[len(body):]
+        else:
+            ws += text
+
+    tail = carry.strip() if not started else carry.rstrip()
+    if tail:
+        yield _normalize_encoding(ws + tail)
+
+
+async def generate_reply_stream(
+    message: str,
+    history: Optional[List[Dict[str, Any]]],
+    user_id: Optional[str],
+    debug_info: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    """
+    Zelfde als generate_reply, maar yieldt de reply in stukken zodra het model
+    ze levert (time-to-first-token i.p.v. wachten op de volledige completion).
+    Fallback-model alleen zolang er nog niets naar de client is gestuurd.
+    debug_info (optioneel) wordt in-place gevuld.
+    """
+    messages, info = await _prepare_messages(message, history, user_id)
+    if debug_info is not None:
+        debug_info.update(info)
+        info = debug_info
+
+    attempt = 0
+    model_try = DEFAULT_MODEL
+    sent = False
+
+    while True:
+        attempt += 1
+        try:
+            stream = await asyncio.wait_for(
+                _openai(
+                    lambda: client.chat.completions.create(
+                        **_model_kwargs(model_try, messages), stream=True
+                    )
+                ),
+                timeout=MODEL_TIMEOUT_SECONDS,
+            )
+            info["model"] = model_try
+            async for text in _normalized_chunks(stream):
+                sent = True
+                yield text
+            return
+
+        except Exception as e:
+            logger.warning("model stream failed (%s, attempt %s): %s", model_try, attempt, e)
+            info["model_error"] = str(e)
+
+            if not sent and attempt <= MODEL_MAX_RETRIES and model_try != FALLBACK_MODEL:
+                model_try = FALLBACK_MODEL
+                continue
+
+            logger.exception("model stream failed definitief")
+            info["model"] = model_try
+            if not sent:
+                yield "Ik liep even vast bij de AI-call. Probeer het nog een keer."
+            return
+
+
 # ==============================
 # ROUTES
 # ==============================
 @router.post("/chat")
-async def chat(req: ChatRequest = Body(...)):
+async def chat(req: ChatRequest = Body(...)) -> ORJSONResponse:
     reply_text, debug_info = await generate_reply(
         req.message,
         req.history,
@@ -390,7 +575,8 @@ async def chat(req: ChatRequest = Body(...)):
     payload: Dict[str, Any] = {"ok": True, "reply": reply_text}
     if req.debug:
         payload["debug"] = debug_info
-    return payload
+    # orjson direct i.p.v. jsonable_encoder + stdlib json (debug kan groot zijn)
+    return ORJSONResponse(payload)
 
 
 @router.post("/model/chat")
@@ -401,3 +587,29 @@ async def model_chat(req: ChatRequest = Body(...)):
 @router.post("/chat/send")
 async def chat_send(req: ChatRequest = Body(...)):
     return await chat(req)
+
+
+def _sse(payload: Dict[str, Any]) -> bytes:
+    # zelfde framing als api/streaming.py: één JSON-event per "data:"-regel
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest = Body(...)):
+    """
+    SSE-variant van /chat: 'chat_chunk' events met tekst, afgesloten met
+    'chat_done' (met debug als req.debug). /chat blijft de volledige JSON-reply.
+    """
+    debug_info: Dict[str, Any] = {}
+
+    async def _events():
+        async for text in generate_reply_stream(
+            req.message, req.history, req.user_id, debug_info
+        ):
+            yield _sse({"type": "chat_chunk", "content": text})
+        done: Dict[str, Any] = {"type": "chat_done"}
+        if req.debug:
+            done["debug"] = debug_info
+        yield _sse(done)
+
+    return StreamingResponse(_events(), media_type="text/event-stream")
@@ -2,7 +2,8 @@ from __future__ import annotations
 
 from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Callable, Tuple
+import asyncio
 import uuid
 import base64
 import json
@@ -11,8 +12,11 @@ import os
 import importlib
 
 import asyncpg
+import orjson
 
 from api.auth.dependencies import get_current_user
+from api.db.database import get_pool, vector_codec_ready
+from api.memory.embeddings import get_cached_embedding, get_embedding_model, put_cached_embedding
 from api.model_router import generate_reply
 
 logger = logging.getLogger("loesoe.chat")
@@ -28,8 +32,30 @@ MEMORY_MAX_DISTANCE = float(os.getenv("MEMORY_MAX_DISTANCE", "1.15"))
 MEMORY_MAX_CHARS = int(os.getenv("MEMORY_MAX_CHARS", "1600"))
 ALLOW_TEST_MEMORIES = os.getenv("ALLOW_TEST_MEMORIES", "0").lower() in ("1", "true", "yes", "on")
 
-_DATABASE_URL = os.getenv("DATABASE_URL")
-_pool: Optional[asyncpg.Pool] = None
+
+# Filter debug/test memories als ALLOW_TEST_MEMORIES=0
+# (metadata is jsonb; we filter source=debug)
+_TEST_FILTER_SQL = "" if ALLOW_TEST_MEMORIES else "AND COALESCE(metadata->>'source','') <> 'debug'"
+
+# Vaste SQL-tekst (env ligt vast bij import) -> asyncpg statement-cache hit.
+# Binnen: ORDER BY + LIMIT op de index (ANN-scan); buiten: distance-cutoff
+# op de al berekende kolom, zodat afgewezen rijen niet over de lijn gaan.
+_MEMORY_SQL = f"""
+    SELECT content, metadata, distance
+    FROM (
+        SELECT
+            content,
+            metadata::text AS metadata,
+            (embedding <-> $1::vector) AS distance
+        FROM memory_embeddings
+        WHERE user_id = $2::uuid
+          AND embedding IS NOT NULL
+          {_TEST_FILTER_SQL}
+        ORDER BY embedding <-> $1::vector
+        LIMIT $3
+    ) AS nearest
+    WHERE distance <= $4
+"""
 
 
 class ChatRequest(BaseModel):
@@ -69,48 +95,73 @@ def _extract_user_id_from_jwt(request: Request) -> Optional[int]:
         return None
 
 
-async def _get_pool() -> asyncpg.Pool:
-    global _pool
-    if _pool is not None:
-        return _pool
-
-    if not _DATABASE_URL:
-        raise RuntimeError("DATABASE_URL ontbreekt (env).")
-
-    _pool = await asyncpg.create_pool(dsn=_DATABASE_URL, min_size=1, max_size=5)
-    return _pool
+def _get_pool() -> asyncpg.Pool:
+    """Gedeelde pool uit api.db.database (pgvector-codec in zijn init)."""
+    pool = get_pool()
+    if pool is None:
+        raise RuntimeError("DB pool not initialized")
+    return pool
 
 
 def _vector_literal(vec: List[float]) -> str:
-    # pgvector literal: [0.1,0.2,...]
-    return "[" + ",".join(f"{x:.6f}" for x in vec) + "]"
+    # pgvector literal: [0.1,0.2,...] in één orjson C-call (zoals model_router._vec)
+    return orjson.dumps(vec).decode()
+
+
+# Kandidaat embed-functies; één keer opgezocht (eerste call), daarna hergebruikt
+_EMBED_CANDIDATES: Tuple[Tuple[str, str], ...] = (
+    ("api.routes.embeddings_debug", "embed_text"),
+    ("api.routes.embeddings_debug", "create_embedding"),
+    ("api.model_router", "embed_text"),
+)
+_EMBED_FNS: Optional[List[Callable[..., Any]]] = None
+_EMBED_FN_LOCK = asyncio.Lock()
+
+
+async def _resolve_embed_fns() -> List[Callable[..., Any]]:
+    global _EMBED_FNS
+    if _EMBED_FNS is not None:
+        return _EMBED_FNS
+    async with _EMBED_FN_LOCK:
+        if _EMBED_FNS is None:
+            fns: List[Callable[..., Any]] = []
+            for mod_name, fn_name in _EMBED_CANDIDATES:
+                try:
+                    fn = getattr(importlib.import_module(mod_name), fn_name, None)
+                except Exception:
+                    continue
+                if fn is not None:
+                    fns.append(fn)
+            _EMBED_FNS = fns
+    return _EMBED_FNS
 
 
 async def _embed_query(text: str) -> Optional[List[float]]:
     """
     Best-effort: probeer een bestaande embed-functie in je codebase te gebruiken.
     Zo crasht Loesoe niet als helpers verplaatst zijn.
+    Resultaten gaan in de gedeelde embedding-LRU (key: model + tekst).
     """
-    candidates: List[Tuple[str, str]] = [
-        ("api.routes.embeddings_debug", "embed_text"),
-        ("api.routes.embeddings_debug", "create_embedding"),
-        ("api.model_router", "embed_text"),
-    ]
+    model = get_embedding_model()
+    hit = get_cached_embedding(model, text)
+    if hit is not None:
+        return hit
 
-    for mod_name, fn_name in candidates:
+    for fn in await _resolve_embed_fns():
         try:
-            mod = importlib.import_module(mod_name)
-            fn = getattr(mod, fn_name, None)
-            if fn is None:
-                continue
-
-            res = fn(text)  # kan sync/async zijn
-            if hasattr(res, "__await__"):
-                res = await res
+            # kan sync/async zijn; sync draait in een thread (blokkeert de loop niet)
+            if asyncio.iscoroutinefunction(fn):
+                res = await fn(text)
+            else:
+                res = await asyncio.to_thread(fn, text)
+                if hasattr(res, "__await__"):
+                    res = await res
 
             # verwacht list[float]
             if isinstance(res, list) and res and isinstance(res[0], (float, int)):
-                return [float(x) for x in res]
+                emb = [float(x) for x in res]
+                put_cached_embedding(model, text, emb)
+                return emb
         except Exception:
             continue
 
@@ -124,47 +175,28 @@ async def _retrieve_memory_context(user_uuid: str, user_message: str) -> Tuple[s
     if not MEMORY_RETRIEVAL_ENABLED:
         return "", {"enabled": False}
 
-    pool = await _get_pool()
+    pool = _get_pool()
 
     qvec = await _embed_query(user_message)
     if not qvec:
         return "", {"enabled": True, "error": "No embedding function available"}
 
-    vec_lit = _vector_literal(qvec)
-
-    # Filter debug/test memories als ALLOW_TEST_MEMORIES=0
-    test_filter_sql = ""
-    if not ALLOW_TEST_MEMORIES:
-        # metadata is jsonb; we filter source=debug
-        test_filter_sql = "AND COALESCE(metadata->>'source','') <> 'debug'"
-
-    sql = f"""
-        SELECT
-            content,
-            metadata::text AS metadata,
-            (embedding <-> $1::vector) AS distance
-        FROM memory_embeddings
-        WHERE user_id = $2::uuid
-          AND embedding IS NOT NULL
-          {test_filter_sql}
-        ORDER BY embedding <-> $1::vector
-        LIMIT $3
-    """
+    vec_param = qvec if vector_codec_ready() else _vector_literal(qvec)
 
     async with pool.acquire() as conn:
-        rows = await conn.fetch(sql, vec_lit, user_uuid, MEMORY_TOP_K)
-
-    kept: List[Dict[str, Any]] = []
-    for r in rows:
-        dist = float(r["distance"]) if r["distance"] is not None else 999.0
-        if dist <= MEMORY_MAX_DISTANCE:
-            kept.append(
-                {
-                    "content": (r["content"] or "").strip(),
-                    "distance": dist,
-                    "metadata": r["metadata"] or "{}",
-                }
-            )
+        rows = await conn.fetch(
+            _MEMORY_SQL, vec_param, user_uuid, MEMORY_TOP_K, MEMORY_MAX_DISTANCE
+        )
+
+    # cutoff zit al in de SQL: elke rij is een hit
+    kept: List[Dict[str, Any]] = [
+        {
+            "content": (r["content"] or "").strip(),
+            "distance": float(r["distance"]),
+            "metadata": r["metadata"] or "{}",
+        }
+        for r in rows
+    ]
 
     debug = {
         "enabled": True,
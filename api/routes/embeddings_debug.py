@@ -1,23 +1,30 @@
 # api/routes/embeddings_debug.py
 from __future__ import annotations
 
+import asyncio
 import os
-import json
 import hashlib
 import logging
+import random
 from typing import Any, Dict, Optional
 from uuid import UUID
 
 import asyncpg
+import orjson
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 
+from api.db.database import get_pool, vector_codec_ready
+from api.memory.embeddings import embed_cached
+from api.memory.retrieval import invalidate_retrieval_cache
+
 logger = logging.getLogger("loesoe.routes.embeddings_debug")
 
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI, RateLimitError
 except Exception:
-    OpenAI = None  # type: ignore
+    AsyncOpenAI = None  # type: ignore
+    RateLimitError = None  # type: ignore
 
 
 router = APIRouter(prefix="/debug/embeddings", tags=["debug-embeddings"])
@@ -49,69 +56,121 @@ def _hash_text(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
-def _pg_dsn_from_env() -> str:
-    """
-    Bouwt een geldige Postgres DSN uit env.
-    Let op: dit gebruikt POSTGRES_* zodat het consistent blijft met compose/.env.
-    """
-    # Prefer DATABASE_URL if present (we only need host/port/db; credentials from POSTGRES_*)
-    # NOTE: asyncpg.connect expects 'postgresql://', not 'postgresql+asyncpg://'
-    _db_url = os.getenv("DATABASE_URL") or ""
-    if _db_url.startswith("postgresql+asyncpg://"):
-        _db_url = _db_url.replace("postgresql+asyncpg://", "postgresql://", 1)
-    if _db_url.startswith("postgresql://") and "@" in _db_url:
-        # If DATABASE_URL includes creds, use it directly
-        return _db_url
-
-    host = os.getenv("DB_HOST", "db")
-    port = int(os.getenv("DB_PORT", "5432"))
-    dbname = os.getenv("POSTGRES_DB", "loesoe")
-    user = os.getenv("POSTGRES_USER", "loesoe")
-    pwd = os.getenv("POSTGRES_PASSWORD") or os.getenv("POSTGRES_PASS") or ""
-
-    if not pwd:
-        raise RuntimeError("POSTGRES_PASSWORD ontbreekt in env (api container).")
+# Backfill: inputs per embeddings-call en max gelijktijdige calls (rate limits)
+BACKFILL_BATCH = int(os.getenv("EMBED_BACKFILL_BATCH", "96"))
+BACKFILL_CONCURRENCY = int(os.getenv("EMBED_BACKFILL_CONCURRENCY", "4"))
+BACKFILL_MAX_RETRIES = 4
 
-    return f"postgresql://{user}:{pwd}@{host}:{port}/{dbname}"
+_embed_sem = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+_client: Optional["AsyncOpenAI"] = None
 
 
-def _get_openai_client() -> "OpenAI":
-    if OpenAI is None:
+def _get_openai_client() -> "AsyncOpenAI":
+    global _client
+    if AsyncOpenAI is None:
         raise RuntimeError("openai package ontbreekt in container.")
     key = os.getenv("OPENAI_API_KEY") or ""
     if not key:
         raise RuntimeError("OPENAI_API_KEY ontbreekt in env (api container).")
-    return OpenAI(api_key=key)
+    # async client (blokkeert de event loop niet), één keer per key aangemaakt
+    if _client is None or _client.api_key != key:
+        _client = AsyncOpenAI(api_key=key)
+    return _client
+
+
+async def _embed_batch(client: "AsyncOpenAI", model: str, texts: list[str]) -> list[list[float]]:
+    """
+    Eén embeddings-call voor een hele batch, onder _embed_sem.
+    429 -> exponentiële backoff met jitter (slot vrij tijdens het wachten).
+    """
+    attempt = 0
+    while True:
+        try:
+            async with _embed_sem:
+                resp = await client.embeddings.create(model=model, input=texts)
+            return [d.embedding for d in resp.data]
+        except RateLimitError:
+            if attempt >= BACKFILL_MAX_RETRIES:
+                raise
+            attempt += 1
+            await asyncio.sleep(random.uniform(0, min(8.0, 0.5 * 2**attempt)))
+
+
+async def _embed(pool: asyncpg.Pool, model: str, texts: list[str]) -> list[list[float]]:
+    """
+    Embeddings via de content-addressed cache (memory_embedding_cache);
+    alleen misses gaan naar OpenAI, in batches van BACKFILL_BATCH (parallel).
+    """
+
+    async def _embed_many(misses: list[str]) -> list[list[float]]:
+        client = _get_openai_client()
+        batches = [misses[i : i + BACKFILL_BATCH] for i in range(0, len(misses), BACKFILL_BATCH)]
+        results = await asyncio.gather(*(_embed_batch(client, model, b) for b in batches))
+        return [emb for embs in results for emb in embs]
+
+    return await embed_cached(texts, model, pool, _embed_many)
 
 
 def _get_embedding_model(req_model: Optional[str] = None) -> str:
     return req_model or os.getenv("EMBEDDING_MODEL") or "text-embedding-3-small"
 
 
-async def _try_register_pgvector(conn: asyncpg.Connection) -> None:
+def _db() -> asyncpg.Pool:
     """
-    Probeert pgvector type te registreren voor asyncpg.
-    Niet verplicht, want we casten '[..]'::vector in SQL.
+    Gedeelde pool uit api.db.database: geen connect()/TLS/auth per request,
+    jsonb-codec (dicts schrijven) en pgvector zijn al per connection geregistreerd.
+    Achter pgbouncer (transaction-mode): DB_STATEMENT_CACHE_SIZE=0 zetten.
     """
-    try:
-        from pgvector.asyncpg import register_vector  # type: ignore
+    pool = get_pool()
+    if pool is None:
+        raise RuntimeError("DB pool not initialized")
+    return pool
+
 
-        await register_vector(conn)
-    except Exception:
-        # Niet fatal; we gebruiken string-cast naar vector
-        return
+def _vector_param(vector: list[float]) -> Any:
+    # met pgvector-codec: list direct (binair); anders de '[..]'-tekstvorm
+    return vector if vector_codec_ready() else orjson.dumps(vector).decode()
 
 
 async def _set_embedding(conn: asyncpg.Connection, row_id: int, vector: list[float]) -> None:
-    # pgvector accepteert '[1,2,3]'::vector
-    emb_txt = "[" + ",".join(str(x) for x in vector) + "]"
     await conn.execute(
         "UPDATE public.memory_embeddings SET embedding = $1::vector WHERE id = $2",
-        emb_txt,
+        _vector_param(vector),
         row_id,
     )
 
 
+# ANN eerst: de binnenste ORDER BY is de kale "embedding <-> $2", zodat de
+# HNSW/ivfflat-index de kandidaten levert (top k*QUERY_OVERFETCH); cutoff en
+# tag-prioriteit daarna op die kleine set. Houd k*QUERY_OVERFETCH <= hnsw.ef_search
+# (MEMORY_HNSW_EF_SEARCH, sessie-default via server_settings van de pool),
+# anders levert de index minder kandidaten.
+QUERY_OVERFETCH = 4
+
+QUERY_SQL = """
+WITH cand AS (
+    SELECT content, metadata, (embedding <-> $2::vector) AS distance
+    FROM public.memory_embeddings
+    WHERE user_id = $1
+      AND embedding IS NOT NULL
+      AND ( $5::bool OR COALESCE(metadata->>'tag','') NOT IN ('smoketest','api') )
+    ORDER BY embedding <-> $2::vector
+    LIMIT $6
+)
+SELECT content, metadata::text AS metadata, distance
+FROM cand
+WHERE distance <= $3
+ORDER BY
+  CASE
+    WHEN COALESCE(metadata->>'tag','') IN ('prefs','prefs2','prefs3','profile','goals') THEN 0
+    WHEN COALESCE(metadata->>'tag','') IN ('memory','notes') THEN 1
+    ELSE 2
+  END,
+  distance ASC
+LIMIT $4
+"""
+
+
 def _require_debug_enabled() -> None:
     """
     Extra safety: debug endpoints alleen als REQUIRE_EMBEDDINGS_DEBUG=1.
@@ -128,7 +187,6 @@ async def store(req: StoreReq):
     """
     _require_debug_enabled()
 
-    dsn = _pg_dsn_from_env()
     content_hash = _hash_text(req.text)
 
     sql_upsert = """
@@ -140,45 +198,47 @@ async def store(req: StoreReq):
     """
 
     try:
-        conn = await asyncpg.connect(dsn)
-        try:
-            await _try_register_pgvector(conn)
-
+        pool = _db()
+        async with pool.acquire() as conn:
+            # jsonb-codec van de pool: dict direct, geen json.dumps
             row = await conn.fetchrow(
                 sql_upsert,
                 str(req.user_id),
                 req.text,
                 content_hash,
-                json.dumps(req.metadata),
+                req.metadata,
             )
-            if not row:
-                raise RuntimeError("Upsert gaf geen row terug.")
+        if not row:
+            raise RuntimeError("Upsert gaf geen row terug.")
 
-            row_id = int(row["id"])
-            has_vec = bool(row["has_vec"])
+        row_id = int(row["id"])
+        has_vec = bool(row["has_vec"])
 
-            embedded = False
-            used_model = None
+        embedded = False
+        used_model = None
 
-            if req.embed and (not has_vec):
-                client = _get_openai_client()
-                model = _get_embedding_model()
-                used_model = model
+        if req.embed and (not has_vec):
+            model = _get_embedding_model()
+            used_model = model
 
-                emb = client.embeddings.create(model=model, input=req.text).data[0].embedding
+            # geen connection vasthouden tijdens de OpenAI-call: _embed pakt
+            # zelf een connection voor de cache, daarna één korte voor de UPDATE
+            (emb,) = await _embed(pool, model, [req.text])
+            async with pool.acquire() as conn:
                 await _set_embedding(conn, row_id, emb)
-                embedded = True
-
-            return {
-                "ok": True,
-                "id": row_id,
-                "content_hash": content_hash,
-                "had_embedding": has_vec,
-                "embedded_now": embedded,
-                "embedding_model": used_model,
-            }
-        finally:
-            await conn.close()
+            embedded = True
+
+        # content/metadata kan gewijzigd zijn -> gecachte retrieval voor deze user weg
+        invalidate_retrieval_cache(req.user_id)
+
+        return {
+            "ok": True,
+            "id": row_id,
+            "content_hash": content_hash,
+            "had_embedding": has_vec,
+            "embedded_now": embedded,
+            "embedding_model": used_model,
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -193,36 +253,37 @@ async def backfill(req: BackfillReq):
     """
     _require_debug_enabled()
 
-    dsn = _pg_dsn_from_env()
     model = _get_embedding_model(req.model)
 
     try:
-        client = _get_openai_client()
-        conn = await asyncpg.connect(dsn)
-        try:
-            await _try_register_pgvector(conn)
-
-            rows = await conn.fetch(
-                """
-                SELECT id, content
-                FROM public.memory_embeddings
-                WHERE user_id = $1 AND embedding IS NULL
-                ORDER BY id
-                LIMIT $2
-                """,
-                str(req.user_id),
-                int(req.limit),
-            )
-
-            done = 0
-            for r in rows:
-                emb = client.embeddings.create(model=model, input=r["content"]).data[0].embedding
-                await _set_embedding(conn, int(r["id"]), emb)
-                done += 1
-
-            return {"ok": True, "user_id": str(req.user_id), "model": model, "updated": done}
-        finally:
-            await conn.close()
+        pool = _db()
+        rows = await pool.fetch(
+            """
+            SELECT id, content
+            FROM public.memory_embeddings
+            WHERE user_id = $1 AND embedding IS NULL
+            ORDER BY id
+            LIMIT $2
+            """,
+            str(req.user_id),
+            int(req.limit),
+        )
+
+        # cache eerst; misses in ⌈N/BACKFILL_BATCH⌉ embeddings-calls (parallel, begrensd)
+        embedded = await _embed(pool, model, [r["content"] for r in rows])
+
+        # alle updates in één executemany + één commit
+        args = [(_vector_param(emb), int(r["id"])) for r, emb in zip(rows, embedded)]
+        if args:
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.executemany(
+                        "UPDATE public.memory_embeddings SET embedding = $1::vector WHERE id = $2",
+                        args,
+                    )
+            invalidate_retrieval_cache(req.user_id)
+
+        return {"ok": True, "user_id": str(req.user_id), "model": model, "updated": len(args)}
     except HTTPException:
         raise
     except Exception as e:
@@ -238,39 +299,21 @@ async def query(req: QueryReq):
     """
     _require_debug_enabled()
 
-    dsn = _pg_dsn_from_env()
     model = _get_embedding_model(req.model)
 
     try:
-        client = _get_openai_client()
-        emb_vec = client.embeddings.create(model=model, input=req.query).data[0].embedding
-        emb_txt = "[" + ",".join(str(x) for x in emb_vec) + "]"
+        (emb_vec,) = await _embed(_db(), model, [req.query])
 
-        conn = await asyncpg.connect(dsn)
-        try:
-            await _try_register_pgvector(conn)
+        async with _db().acquire() as conn:
+            # metadata::text (in QUERY_SQL): response blijft de JSON-string zoals voorheen
             rows = await conn.fetch(
-                """
-                SELECT content, metadata, (embedding <-> $2::vector) AS distance
-                FROM public.memory_embeddings
-                WHERE user_id = $1
-                  AND embedding IS NOT NULL
-                  AND (embedding <-> $2::vector) <= $3
-                  AND ( $5::bool OR COALESCE(metadata->>'tag','') NOT IN ('smoketest','api') )
-                ORDER BY
-                  CASE
-                    WHEN COALESCE(metadata->>'tag','') IN ('prefs','prefs2','prefs3','profile','goals') THEN 0
-                    WHEN COALESCE(metadata->>'tag','') IN ('memory','notes') THEN 1
-                    ELSE 2
-                  END,
-                  distance ASC
-                LIMIT $4
-                """,
+                QUERY_SQL,
                 str(req.user_id),
-                emb_txt,
+                _vector_param(emb_vec),
                 float(req.max_distance),
                 int(req.k),
                 bool(req.include_test),
+                int(req.k) * QUERY_OVERFETCH,
             )
 
             items = []
@@ -291,8 +334,6 @@ async def query(req: QueryReq):
                 "model": model,
                 "results": items,
             }
-        finally:
-            await conn.close()
     except HTTPException:
         raise
     except Exception as e:
@@ -1,14 +1,14 @@
 from __future__ import annotations
 
-import json
-from dataclasses import dataclass
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from typing import Any, Optional
 
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
 
 from api.db.database import get_pool
+from api.events.logger import log_events
+from api.learning.aggregator import Pattern, events_where, aggregate_summary_sql, upsert_patterns
 
 router = APIRouter(prefix="/events", tags=["events"])
 
@@ -35,13 +35,11 @@ async def log_event(e: EventIn) -> dict[str, Any]:
     if len(tags) > 50:
         tags = tags[:50]
 
-    payload_json = json.dumps(e.payload or {}, ensure_ascii=False)
-
     async with pool.acquire() as conn:
         row = await conn.fetchrow(
             """
             INSERT INTO learning_events (user_id, session_id, event_type, source, confidence, tags, payload)
-            VALUES ($1, $2, $3, $4, $5, $6::text[], $7::jsonb)
+            VALUES ($1, $2, $3, $4, $5, $6::text[], $7)
             RETURNING id, created_at
             """,
             e.user_id,
@@ -50,7 +48,7 @@ async def log_event(e: EventIn) -> dict[str, Any]:
             e.source,
             e.confidence,
             tags,
-            payload_json,
+            e.payload or {},  # jsonb-codec van de pool encodeert
         )
 
     return {
@@ -60,6 +58,20 @@ async def log_event(e: EventIn) -> dict[str, Any]:
     }
 
 
+class EventBatchIn(BaseModel):
+    events: list[EventIn] = Field(..., min_length=1, max_length=1000)
+
+
+@router.post("/log/batch")
+async def log_event_batch(batch: EventBatchIn) -> dict[str, Any]:
+    """Burst van events in één binary COPY (log_events); geen ids terug."""
+    if get_pool() is None:
+        raise HTTPException(status_code=503, detail="DB pool not ready")
+
+    count = await log_events(e.model_dump() for e in batch.events)
+    return {"ok": True, "count": count}
+
+
 @router.get("/recent")
 async def recent_events(limit: int = 25, event_type: Optional[str] = None) -> dict[str, Any]:
     limit = max(1, min(200, limit))
@@ -106,110 +118,30 @@ async def recent_events(limit: int = 25, event_type: Optional[str] = None) -> di
 # FASE 23.1 / 23.2 — Learning aggregation + pattern store
 # =========================================================
 
-@dataclass
-class Pattern:
-    subject: str               # "user" | "system"
-    pattern_type: str          # "preference" | "habit" | "anomaly"
-    key: str
-    value: dict[str, Any]
-    confidence: float
-    evidence: dict[str, Any]
-    last_seen: datetime
-
-
 def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
-async def _fetch_events(
+async def _fetch_events_derive(
     conn,
     limit: int,
     window_minutes: int,
     user_id: Optional[str] = None,
     session_id: Optional[str] = None,
-    event_type: Optional[str] = None,
-    tag: Optional[str] = None,
-) -> list[dict[str, Any]]:
-    end = _utcnow()
-    start = end - timedelta(minutes=window_minutes)
-
-    where = ["created_at >= $1", "created_at <= $2"]
-    params: list[Any] = [start, end]
-    p = 3
-
-    if user_id:
-        where.append(f"user_id = ${p}")
-        params.append(user_id)
-        p += 1
-    if session_id:
-        where.append(f"session_id = ${p}")
-        params.append(session_id)
-        p += 1
-    if event_type:
-        where.append(f"event_type = ${p}")
-        params.append(event_type)
-        p += 1
-    if tag:
-        # tags is TEXT[]
-        where.append(f"${p} = ANY(tags)")
-        params.append(tag)
-        p += 1
-
+) -> list[Any]:
+    """
+    Wat _derive_patterns leest; payload.action server-side geprojecteerd
+    (kleine text i.p.v. de volledige jsonb over de lijn + decoderen).
+    """
+    where_sql, params = events_where(window_minutes, user_id, session_id)
     sql = f"""
-        SELECT id, created_at, user_id, session_id, event_type, source, confidence, tags, payload
+        SELECT event_type, tags, created_at, payload->>'action' AS action
         FROM learning_events
-        WHERE {" AND ".join(where)}
+        WHERE {where_sql}
         ORDER BY created_at DESC
         LIMIT {int(limit)}
     """
-
-    rows = await conn.fetch(sql, *params)
-    out: list[dict[str, Any]] = []
-    for r in rows:
-        out.append(
-            {
-                "id": int(r["id"]),
-                "created_at": r["created_at"],
-                "user_id": r["user_id"],
-                "session_id": r["session_id"],
-                "event_type": r["event_type"],
-                "source": r["source"],
-                "confidence": float(r["confidence"]) if r["confidence"] is not None else None,
-                "tags": list(r["tags"] or []),
-                "payload": r["payload"] or {},
-            }
-        )
-    return out
-
-
-def _aggregate_summary(events: list[dict[str, Any]]) -> dict[str, Any]:
-    by_type: dict[str, int] = {}
-    by_tag: dict[str, int] = {}
-    last_ts: Optional[datetime] = None
-
-    for e in events:
-        et = e.get("event_type") or "unknown"
-        by_type[et] = by_type.get(et, 0) + 1
-
-        for t in (e.get("tags") or []):
-            t = (t or "").strip()
-            if not t:
-                continue
-            by_tag[t] = by_tag.get(t, 0) + 1
-
-        ts = e.get("created_at")
-        if ts and (last_ts is None or ts > last_ts):
-            last_ts = ts
-
-    top_types = sorted(by_type.items(), key=lambda x: x[1], reverse=True)[:10]
-    top_tags = sorted(by_tag.items(), key=lambda x: x[1], reverse=True)[:15]
-
-    return {
-        "total": len(events),
-        "last_created_at": last_ts.isoformat() if last_ts else None,
-        "top_event_types": [{"event_type": k, "count": v} for k, v in top_types],
-        "top_tags": [{"tag": k, "count": v} for k, v in top_tags],
-    }
+    return await conn.fetch(sql, *params)
 
 
 def _derive_patterns(events: list[dict[str, Any]]) -> list[Pattern]:
@@ -253,10 +185,7 @@ def _derive_patterns(events: list[dict[str, Any]]) -> list[Pattern]:
     search_use = 0
     last_seen = None
     for e in events:
-        payload = e.get("payload") or {}
-        action = payload.get("action") if isinstance(payload, dict) else None
-
-        if has_tag(e, "tool:search") or action == "search":
+        if has_tag(e, "tool:search") or e["action"] == "search":
             search_use += 1
             ts = e.get("created_at")
             if ts and (last_seen is None or ts > last_seen):
@@ -304,34 +233,8 @@ def _derive_patterns(events: list[dict[str, Any]]) -> list[Pattern]:
 
 
 async def _upsert_patterns(conn, patterns: list[Pattern]) -> int:
-    if not patterns:
-        return 0
-
-    sql = """
-    INSERT INTO learning_patterns (subject, pattern_type, key, value, confidence, evidence, last_seen)
-    VALUES ($1, $2, $3, $4::jsonb, $5, $6::jsonb, $7)
-    ON CONFLICT (subject, pattern_type, key)
-    DO UPDATE SET
-        value = EXCLUDED.value,
-        confidence = EXCLUDED.confidence,
-        evidence = EXCLUDED.evidence,
-        last_seen = EXCLUDED.last_seen
-    """
-
-    n = 0
-    for p in patterns:
-        await conn.execute(
-            sql,
-            p.subject,
-            p.pattern_type,
-            p.key,
-            json.dumps(p.value, ensure_ascii=False),
-            float(p.confidence),
-            json.dumps(p.evidence, ensure_ascii=False),
-            p.last_seen,
-        )
-        n += 1
-    return n
+    # één UNNEST-upsert voor alle patterns (één round-trip i.p.v. één per pattern)
+    return await upsert_patterns(conn, patterns)
 
 
 @router.get("/learning/summary")
@@ -348,7 +251,9 @@ async def learning_summary(
         raise HTTPException(status_code=503, detail="DB pool not ready")
 
     async with pool.acquire() as conn:
-        events = await _fetch_events(
+        # telling in Postgres (GROUP BY over de laatste `limit` events):
+        # alleen de top-lijsten komen over de lijn, geen event-rijen
+        summary = await aggregate_summary_sql(
             conn,
             limit=limit,
             window_minutes=window_minutes,
@@ -368,7 +273,7 @@ async def learning_summary(
             "event_type": event_type,
             "tag": tag,
         },
-        "summary": _aggregate_summary(events),
+        "summary": summary,
     }
 
 
@@ -384,7 +289,7 @@ async def learning_derive(
         raise HTTPException(status_code=503, detail="DB pool not ready")
 
     async with pool.acquire() as conn:
-        events = await _fetch_events(
+        events = await _fetch_events_derive(
             conn,
             limit=limit,
             window_minutes=window_minutes,
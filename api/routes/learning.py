@@ -7,7 +7,7 @@ from typing import Any, Optional, Literal
 from api.db.database import get_pool
 from api.learning.aggregator import (
     fetch_events,
-    aggregate_summary,
+    aggregate_summary_sql,
     derive_patterns,
     upsert_patterns,
 )
@@ -39,7 +39,7 @@ async def learning_summary(
     tag: Optional[str] = None,
 ) -> dict[str, Any]:
     """
-    Read-only: haalt events op en geeft een samenvatting terug.
+    Read-only: samenvatting van de events (telling in Postgres).
     Geen opslag, geen learning-derive.
     """
     pool = get_pool()
@@ -47,7 +47,7 @@ async def learning_summary(
         raise HTTPException(status_code=503, detail="DB pool not ready")
 
     async with pool.acquire() as conn:
-        events = await fetch_events(
+        summary = await aggregate_summary_sql(
             conn,
             limit=limit,
             window_minutes=window_minutes,
@@ -67,7 +67,7 @@ async def learning_summary(
             "event_type": event_type,
             "tag": tag,
         },
-        "summary": aggregate_summary(events),
+        "summary": summary,
     }
 
 
@@ -0,0 +1,12 @@
+# api/timeutil.py
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+
+def now_iso() -> str:
+    """
+    UTC-timestamp als 'YYYY-MM-DDTHH:MM:SS.ffffffZ' (zelfde formaat als
+    datetime.utcnow().isoformat() + "Z", zonder de deprecated utcnow()).
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None).isoformat() + "Z"
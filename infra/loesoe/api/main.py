@@ -28,8 +28,7 @@ app.add_middleware(
 
 # 🔐 Auth
 from api.auth.routes import router as auth_router
-from api.dependencies.user import get_current_user  # <-- gebruikt JWT access token
-from api.auth.models import User                    # alleen voor type hints / .safe()
+from api.dependencies.user import CurrentUser, get_current_user  # <-- gebruikt JWT access token
 app.include_router(auth_router)
 
 def _mask(v: Optional[str]) -> Optional[str]:
@@ -72,8 +71,8 @@ def get_model():
 
 # 🔐 Ingelogde gebruiker (vereist geldige Bearer access token)
 @app.get("/me")
-async def me(user: User = Depends(get_current_user)):
-    # user.safe komt uit het User-model en verbergt gevoelige velden
+async def me(user: CurrentUser = Depends(get_current_user)):
+    # user.safe: alleen id/email/role, geen gevoelige velden
     return {"user": user.safe}
 
 @app.post("/chat")
@@ -18,7 +18,8 @@ Belangrijk:
 - Alle scores zijn JSON-vriendelijk (floats, ints, strings, lists, dicts)
 
 Hoofdentry:
-    score_message(message: str, history: list[str] | None = None) -> dict
+    score_message(message: str, history: list[str] | None = None,
+                  features: dict | None = None) -> dict
 """
 
 from __future__ import annotations
@@ -93,6 +94,20 @@ def _to_words(text: str) -> List[str]:
     return re.findall(r"\w+", text.lower(), flags=re.UNICODE)
 
 
+def message_features(message: str) -> Dict[str, Any]:
+    """
+    Eén keer per bericht: lengte, lowercase en woorden.
+    Alle detectors hieronder hergebruiken dit i.p.v. zelf te splitten.
+    """
+    text = message or ""
+    lower = text.lower()
+    return {
+        "length": len(text),
+        "lower": lower,
+        "words": re.findall(r"\w+", lower, flags=re.UNICODE),
+    }
+
+
 # --------- Emotion detection --------- #
 
 
@@ -120,9 +135,9 @@ _HIGH_ENERGY_MARKERS = {
 }
 
 
-def _detect_emotion(message: str) -> EmotionScore:
+def _detect_emotion(message: str, features: Optional[Dict[str, Any]] = None) -> EmotionScore:
     text = message.strip()
-    words = _to_words(text)
+    words = (features or message_features(text))["words"]
 
     pos_hits = sum(w in _POSITIVE_WORDS for w in words)
     neg_hits = sum(w in _NEGATIVE_WORDS for w in words)
@@ -193,9 +208,8 @@ _INTENT_KEYWORDS = {
 }
 
 
-def _detect_intent(message: str) -> IntentScore:
-    text = message.lower()
-    words = _to_words(text)
+def _detect_intent(message: str, features: Optional[Dict[str, Any]] = None) -> IntentScore:
+    text = (features or message_features(message))["lower"]
 
     scores: Dict[str, int] = {k: 0 for k in _INTENT_KEYWORDS.keys()}
     hits_tags: List[str] = []
@@ -254,11 +268,11 @@ _TIME_WORDS = [
 ]
 
 
-def _extract_raw_stats(message: str) -> RawStats:
+def _extract_raw_stats(message: str, features: Optional[Dict[str, Any]] = None) -> RawStats:
     text = message or ""
-    words = _to_words(text)
-    length = len(text)
-    word_count = len(words)
+    features = features or message_features(text)
+    length = features["length"]
+    word_count = len(features["words"])
 
     exclamations = text.count("!")
     question_marks = text.count("?")
@@ -267,7 +281,7 @@ def _extract_raw_stats(message: str) -> RawStats:
     total_chars = length or 1
     uppercase_ratio = upper_chars / total_chars
 
-    lw = text.lower()
+    lw = features["lower"]
     contains_crypto = any(kw in lw for kw in _INTENT_KEYWORDS["crypto"])
     contains_money = any(kw in lw for kw in _MONEY_WORDS)
     contains_time = any(kw in lw for kw in _TIME_WORDS)
@@ -379,12 +393,13 @@ def _estimate_novelty(message: str, history: Optional[List[str]]) -> float:
     if total == 0:
         return 1.0
 
+    # woorden van het bericht zelf maar één keer, niet per history-item
+    w1 = set(_to_words(text))
     similar = 0
     for h in history_lw:
         if not h:
             continue
         # simpele overlap: gedeelde woorden
-        w1 = set(_to_words(text))
         w2 = set(_to_words(h))
         if not w1 or not w2:
             continue
@@ -450,11 +465,18 @@ def _estimate_risk(
 # --------- Publieke entrypoint --------- #
 
 
-def score_message(message: str, history: Optional[List[str]] = None) -> Dict[str, Any]:
+def score_message(
+    message: str,
+    history: Optional[List[str]] = None,
+    features: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     """
     Hoofdfunctie: geef een message (en optioneel history) en ontvang
     een volledig scoring-profiel terug.
 
+    features: optioneel resultaat van message_features(message), zodat
+    de caller (chat) dezelfde split/lower kan hergebruiken.
+
     Voorbeeld output:
     {
         "version": 1,
@@ -466,9 +488,11 @@ def score_message(message: str, history: Optional[List[str]] = None) -> Dict[str
     """
     history = history or []
 
-    raw = _extract_raw_stats(message)
-    emotion = _detect_emotion(message)
-    intent = _detect_intent(message)
+    features = features or message_features(message)
+
+    raw = _extract_raw_stats(message, features)
+    emotion = _detect_emotion(message, features)
+    intent = _detect_intent(message, features)
 
     habit_strength = _detect_habit_strength(message, history)
     importance = _estimate_importance(message, intent, emotion, raw)
@@ -5,7 +5,8 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import jwt, JWTError
+import jwt  # PyJWT
+from jwt import InvalidTokenError as JWTError
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
 from sqlalchemy import String, select
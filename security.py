@@ -3,7 +3,8 @@ from __future__ import annotations
 import os, time
 from typing import Any, Dict
 from dotenv import load_dotenv
-from jose import jwt, JWTError
+import jwt  # PyJWT
+from jwt import InvalidTokenError as JWTError
 from passlib.context import CryptContext
 
 load_dotenv(override=True)
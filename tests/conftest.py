@@ -0,0 +1,83 @@
+import importlib.util
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# api.* wordt absoluut geïmporteerd (zoals in main.py) -> repo-root op sys.path
+sys.path.insert(0, _ROOT)
+
+# Oudere tests importeren de repo als package "loesoe" (loesoe.search...).
+# Staat de checkout niet in een map "loesoe", dan de root onder die naam registreren.
+if importlib.util.find_spec("loesoe") is None:
+    _spec = importlib.util.spec_from_file_location(
+        "loesoe", os.path.join(_ROOT, "__init__.py"), submodule_search_locations=[_ROOT]
+    )
+    sys.modules["loesoe"] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules["loesoe"])
+
+
+class FakeConn:
+    """Minimale asyncpg-connection: legt elke call vast, geeft vaste resultaten."""
+
+    def __init__(self, fetch_result=None, fetchrow_result=None, fetchval_result=None):
+        self.calls = []
+        self.fetch_result = fetch_result if fetch_result is not None else []
+        self.fetchrow_result = fetchrow_result
+        self.fetchval_result = fetchval_result
+
+    async def execute(self, sql, *args):
+        self.calls.append(("execute", sql, args))
+        return "OK"
+
+    async def executemany(self, sql, args):
+        self.calls.append(("executemany", sql, list(args)))
+
+    async def fetch(self, sql, *args):
+        self.calls.append(("fetch", sql, args))
+        return self.fetch_result
+
+    async def fetchrow(self, sql, *args):
+        self.calls.append(("fetchrow", sql, args))
+        return self.fetchrow_result
+
+    async def fetchval(self, sql, *args):
+        self.calls.append(("fetchval", sql, args))
+        return self.fetchval_result
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.calls.append(("copy", table, list(records), columns))
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class FakePool:
+    def __init__(self, conn=None):
+        self.conn = conn or FakeConn()
+        self.acquired = 0
+        self.in_use = 0
+        self.max_in_use = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.acquired += 1
+        self.in_use += 1
+        self.max_in_use = max(self.max_in_use, self.in_use)
+        try:
+            yield self.conn
+        finally:
+            self.in_use -= 1
+
+    async def fetch(self, sql, *args):
+        async with self.acquire() as conn:
+            return await conn.fetch(sql, *args)
+
+
+@pytest.fixture
+def fake_pool():
+    return FakePool()
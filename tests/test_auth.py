@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.auth import routes as auth
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(auth.router)
+    return TestClient(app)
+
+
+def test_demo_hash_is_lazy():
+    # bij import geen bcrypt: seed-users hebben nog geen hash
+    assert all(u["pwd_hash"] is None for u in list(auth._users.values())[:2])
+
+
+def test_login_json_ok_and_wrong_password(client):
+    r = client.post("/login", json={"email": "richard@test.com", "password": "Test1234!"})
+    assert r.status_code == 200
+    assert auth.decode_token(r.json()["access_token"])["email"] == "richard@test.com"
+
+    r = client.post("/login", json={"email": "richard@test.com", "password": "nope"})
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Invalid credentials"
+
+
+def test_login_unknown_user(client):
+    r = client.post("/auth/login", json={"email": "nobody@test.com", "password": "x"})
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Invalid credentials"
+
+
+def test_bcrypt_does_not_block_event_loop():
+    class Req:
+        headers = {"content-type": "application/json"}
+
+        async def json(self):
+            return {"email": "richard@test.com", "password": "Test1234!"}
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        t = asyncio.create_task(ticker())
+        out = await auth._login_core(Req())
+        t.cancel()
+        return out, ticks
+
+    out, ticks = asyncio.run(main())
+    assert out.access_token
+    # bcrypt (12 rounds) duurt >50 ms; de loop moet intussen doorlopen
+    assert ticks >= 3
+
+
+def test_create_token_is_standard_pyjwt():
+    import jwt
+
+    token = auth.create_token({"email": "richard@test.com", "id": 1})
+    header = jwt.get_unverified_header(token)
+    assert header["alg"] == "HS256"
+    claims = jwt.decode(token, auth.AUTH_SECRET, algorithms=["HS256"])
+    assert claims["email"] == "richard@test.com" and "exp" in claims
+
+
+def test_form_login_decodes_utf8(client):
+    from urllib.parse import urlencode
+
+    pwd = "pässwörd-€"
+    assert client.post(
+        "/register", json={"name": "U", "email": "utf8@test.com", "password": pwd}
+    ).status_code == 200
+
+    # percent-encoded (standaard) én raw UTF-8 in de body
+    for body in (
+        urlencode({"username": "utf8@test.com", "password": pwd}),
+        f"username=utf8@test.com&password={pwd}".encode("utf-8"),
+    ):
+        r = client.post(
+            "/login",
+            content=body,
+            headers={"content-type": "application/x-www-form-urlencoded"},
+        )
+        assert r.status_code == 200, r.text
+
+
+def test_token_without_email_is_invalid_payload(client):
+    token = auth.create_token({"id": 1})
+    r = client.get("/me", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Invalid token payload"
+
+
+def test_garbage_token_is_invalid_token(client):
+    r = client.get("/me", headers={"Authorization": "Bearer not.a.jwt"})
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Invalid token"
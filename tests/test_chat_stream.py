@@ -0,0 +1,119 @@
+import os
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# AsyncOpenAI() wordt bij import gemaakt en wil een key (er gaat geen call uit)
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import api.model_router as mr  # noqa: E402
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeStream:
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for p in self.pieces:
+            yield _chunk(p)
+
+
+class FakeCompletions:
+    def __init__(self, script):
+        # per model: lijst stukken of een exception
+        self.script = script
+        self.models = []
+
+    async def create(self, **kwargs):
+        assert kwargs["stream"] is True
+        self.models.append(kwargs["model"])
+        result = self.script[kwargs["model"]]
+        if isinstance(result, Exception):
+            raise result
+        return FakeStream(result)
+
+
+@pytest.fixture
+def stream_client(monkeypatch):
+    async def fake_prepare(message, history, user_id):
+        return [{"role": "user", "content": message}], {"memory_hits": 0}
+
+    monkeypatch.setattr(mr, "_prepare_messages", fake_prepare)
+
+    def make(script):
+        completions = FakeCompletions(script)
+        monkeypatch.setattr(mr, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+        app = FastAPI()
+        app.include_router(mr.router)
+        return TestClient(app), completions
+
+    return make
+
+
+def _events(res):
+    assert res.headers["content-type"].startswith("text/event-stream")
+    frames = [f for f in res.text.split("\n\n") if f]
+    assert all(f.startswith("data: ") for f in frames)
+    return [orjson.loads(f[len("data: "):]) for f in frames]
+
+
+def test_stream_sends_chunks_then_done(stream_client):
+    client, completions = stream_client({mr.DEFAULT_MODEL: ["  Hallo", " wereld", "!"]})
+    res = client.post("/chat/stream", json={"message": "hoi"})
+
+    events = _events(res)
+    assert events[-1] == {"type": "chat_done"}
+    chunks = [e["content"] for e in events[:-1]]
+    assert all(e["type"] == "chat_chunk" for e in events[:-1])
+    assert "".join(chunks) == "Hallo wereld!"  # leidende spaties eraf
+    assert completions.models == [mr.DEFAULT_MODEL]
+
+
+def test_stream_strips_like_the_non_stream_reply(stream_client):
+    pieces = ["\n Hallo ", " ", "wereld\n", "\n"]
+    client, _ = stream_client({mr.DEFAULT_MODEL: pieces})
+    events = _events(client.post("/chat/stream", json={"message": "hoi"}))
+
+    chunks = [e["content"] for e in events if e["type"] == "chat_chunk"]
+    assert "".join(chunks) == mr._clean("".join(pieces)) == "Hallo  wereld"
+    assert all(chunks)
+
+
+def test_stream_done_carries_debug_when_asked(stream_client):
+    client, _ = stream_client({mr.DEFAULT_MODEL: ["ok"]})
+    events = _events(client.post("/chat/stream", json={"message": "hoi", "debug": True}))
+
+    assert events[-1]["type"] == "chat_done"
+    assert events[-1]["debug"]["model"] == mr.DEFAULT_MODEL
+    assert events[-1]["debug"]["memory_hits"] == 0
+
+
+def test_stream_falls_back_before_first_chunk(stream_client):
+    client, completions = stream_client(
+        {mr.DEFAULT_MODEL: RuntimeError("down"), mr.FALLBACK_MODEL: ["van fallback"]}
+    )
+    events = _events(client.post("/chat/stream", json={"message": "hoi", "debug": True}))
+
+    assert [e["content"] for e in events if e["type"] == "chat_chunk"] == ["van fallback"]
+    assert completions.models == [mr.DEFAULT_MODEL, mr.FALLBACK_MODEL]
+    assert events[-1]["debug"]["model"] == mr.FALLBACK_MODEL
+
+
+def test_stream_reports_failure_as_text(stream_client):
+    boom = RuntimeError("down")
+    client, _ = stream_client({mr.DEFAULT_MODEL: boom, mr.FALLBACK_MODEL: boom})
+    events = _events(client.post("/chat/stream", json={"message": "hoi"}))
+
+    assert events[0]["type"] == "chat_chunk"
+    assert "vast" in events[0]["content"]
+    assert events[-1] == {"type": "chat_done"}
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from api.db import database
+
+
+@pytest.fixture
+def created(monkeypatch):
+    calls = []
+
+    class Pool:
+        async def close(self):
+            pass
+
+    async def fake_create_pool(**kwargs):
+        calls.append(kwargs)
+        return Pool()
+
+    monkeypatch.setattr(database.asyncpg, "create_pool", fake_create_pool)
+    monkeypatch.setattr(database, "_db", None)
+    return calls
+
+
+def _init_and_close():
+    async def run():
+        await database.init_database()
+        await database.close_database()
+
+    asyncio.run(run())
+
+
+def test_init_database_reads_env_on_every_call(created, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgresql+asyncpg://u@h1/db")
+    monkeypatch.setenv("DB_POOL_MIN", "2")
+    monkeypatch.setenv("DB_POOL_MAX", "4")
+    monkeypatch.delenv("DB_STATEMENT_CACHE_SIZE", raising=False)
+    _init_and_close()
+
+    monkeypatch.setenv("DATABASE_URL", "postgresql://u@h2/db")
+    monkeypatch.setenv("DB_POOL_MAX", "8")
+    monkeypatch.setenv("DB_STATEMENT_CACHE_SIZE", "0")
+    _init_and_close()
+
+    first, second = created
+    assert (first["dsn"], first["min_size"], first["max_size"]) == ("postgresql://u@h1/db", 2, 4)
+    assert first["statement_cache_size"] == database.DEFAULT_STATEMENT_CACHE_SIZE
+    assert (second["dsn"], second["max_size"], second["statement_cache_size"]) == ("postgresql://u@h2/db", 8, 0)
+    assert second["init"] is database._init_conn
+
+
+def test_explicit_arguments_win_over_env(created, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgresql://env/db")
+    monkeypatch.setenv("DB_POOL_MIN", "3")
+
+    async def run():
+        await database.init_database(dsn="postgresql://arg/db", min_size=1, statement_cache_size=5)
+        await database.close_database()
+
+    asyncio.run(run())
+    (kw,) = created
+    assert (kw["dsn"], kw["min_size"], kw["statement_cache_size"]) == ("postgresql://arg/db", 1, 5)
+
+
+def test_empty_dsn_is_rejected(created, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "")
+    with pytest.raises(RuntimeError, match="empty"):
+        asyncio.run(database.init_database())
+    assert created == []
+
+
+def test_vector_search_settings_survive_pool_reset(created, monkeypatch):
+    # asyncpg doet RESET ALL bij elke release: de waarden moeten als
+    # startup-parameter mee, niet als SET in de init-hook
+    monkeypatch.setenv("DATABASE_URL", "postgresql://u@h/db")
+    monkeypatch.setattr(database, "MEMORY_IVFFLAT_PROBES", 12)
+    monkeypatch.setattr(database, "MEMORY_HNSW_EF_SEARCH", 64)
+    _init_and_close()
+
+    (kw,) = created
+    assert kw["server_settings"] == {"hnsw.ef_search": "64", "ivfflat.probes": "12"}
+
+
+def test_init_conn_does_not_set_session_gucs(monkeypatch):
+    async def fake_register_vector(conn):
+        pass
+
+    monkeypatch.setattr(database, "_PGVECTOR_OK", True)
+    monkeypatch.setattr(database, "register_vector", fake_register_vector)
+
+    class Conn:
+        def __init__(self):
+            self.sql = []
+
+        async def set_type_codec(self, *args, **kwargs):
+            pass
+
+        async def execute(self, sql, *args):
+            self.sql.append(sql)
+
+    conn = Conn()
+    asyncio.run(database._init_conn(conn))
+    assert not [s for s in conn.sql if s.lstrip().upper().startswith("SET")]
+
+
+def test_pool_min_is_clamped_to_max(created, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgresql://u@h/db")
+    monkeypatch.setenv("DB_POOL_MIN", "8")
+    monkeypatch.setenv("DB_POOL_MAX", "4")
+    _init_and_close()
+
+    (kw,) = created
+    assert (kw["min_size"], kw["max_size"]) == (4, 4)
+
+
+def test_default_pool_min_is_small_and_fixed(created, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgresql://u@h/db")
+    monkeypatch.delenv("DB_POOL_MIN", raising=False)
+    monkeypatch.setenv("DB_POOL_MAX", "1")
+    _init_and_close()
+
+    (kw,) = created
+    assert database.DEFAULT_POOL_MIN == 2
+    assert (kw["min_size"], kw["max_size"]) == (1, 1)
@@ -0,0 +1,24 @@
+import json
+
+from api.db.database import _jsonb_decode, _jsonb_encode
+
+
+def test_encode_dict_uses_binary_jsonb_format():
+    data = _jsonb_encode({"a": 1, "b": [1, 2]})
+    assert data[:1] == b"\x01"
+    assert json.loads(data[1:]) == {"a": 1, "b": [1, 2]}
+
+
+def test_encode_passes_serialized_json_through():
+    assert _jsonb_encode('{"a": 1}') == b'\x01{"a": 1}'
+
+
+def test_decode_returns_json_text_like_asyncpg_default():
+    value = _jsonb_decode(b'\x01{"action": "x", "n": 2}')
+    assert isinstance(value, str)
+    assert json.loads(value) == {"action": "x", "n": 2}
+
+
+def test_roundtrip_keeps_non_ascii():
+    value = _jsonb_decode(_jsonb_encode({"tekst": "café"}))
+    assert json.loads(value) == {"tekst": "café"}
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from asyncpg.exceptions import UndefinedTableError
+
+import api.memory.embeddings as emb
+from tests.conftest import FakeConn, FakePool
+
+MODEL = "test-model"
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(emb, "_EMB_CACHE", emb.OrderedDict())
+    monkeypatch.setattr(emb, "_db_cache_enabled", True)
+    monkeypatch.setattr(emb, "_last_db_cache_prune", 0.0)
+
+
+def test_lru_roundtrip_and_eviction(monkeypatch):
+    monkeypatch.setattr(emb, "_EMB_CACHE_MAX", 2)
+    emb.put_cached_embedding(MODEL, "a", [0.5, 1.0])
+    emb.put_cached_embedding(MODEL, "b", [1.5])
+    assert emb.get_cached_embedding(MODEL, "a") == [0.5, 1.0]  # a wordt recent
+    emb.put_cached_embedding(MODEL, "c", [2.0])
+
+    assert emb.get_cached_embedding(MODEL, "b") is None
+    assert emb.get_cached_embedding(MODEL, "a") == [0.5, 1.0]
+    assert emb.get_cached_embedding("ander-model", "a") is None
+
+
+def test_embed_cached_only_embeds_unique_misses():
+    hit_hash = emb._cache_key(MODEL, "db")[1]
+    conn = FakeConn(fetch_result=[{"text_hash": hit_hash, "embedding": "[0.25,0.5]"}])
+    emb.put_cached_embedding(MODEL, "lru", [1.0])
+    asked = []
+
+    async def embed_many(texts):
+        asked.append(texts)
+        return [[float(len(t))] for t in texts]
+
+    out = asyncio.run(emb.embed_cached(["lru", "db", "nieuw", "nieuw"], MODEL, FakePool(conn), embed_many))
+
+    assert out == [[1.0], [0.25, 0.5], [5.0], [5.0]]
+    assert asked == [["nieuw"]]
+    inserts = [c for c in conn.calls if c[0] == "executemany"]
+    assert [(model, e) for _, model, e in inserts[0][2]] == [(MODEL, [5.0])]
+    # tweede keer: alles uit de LRU, geen DB/API
+    n_calls = len(conn.calls)
+    assert asyncio.run(emb.embed_cached(["nieuw"], MODEL, FakePool(conn), embed_many)) == [[5.0]]
+    assert len(conn.calls) == n_calls and len(asked) == 1
+
+
+class MissingTableConn(FakeConn):
+    async def fetch(self, sql, *args):
+        self.calls.append(("fetch", sql, args))
+        raise UndefinedTableError('relation "memory_embedding_cache" does not exist')
+
+
+def test_missing_table_disables_db_cache_once(caplog):
+    conn = MissingTableConn()
+
+    async def embed_many(texts):
+        return [[1.0] for _ in texts]
+
+    asyncio.run(emb.embed_cached(["x"], MODEL, FakePool(conn), embed_many))
+    asyncio.run(emb.embed_cached(["y"], MODEL, FakePool(conn), embed_many))
+
+    assert emb._db_cache_enabled is False
+    assert len(conn.calls) == 1  # alleen de eerste lookup, geen insert/volgende lookups
+    assert caplog.text.count("DB-cache uitgeschakeld") == 1
+
+
+def test_prune_runs_at_most_once_per_interval(monkeypatch):
+    monkeypatch.setattr(emb, "_DB_CACHE_TTL_DAYS", 30)
+    conn = FakeConn()
+
+    async def embed_many(texts):
+        return [[1.0] for _ in texts]
+
+    asyncio.run(emb.embed_cached(["a"], MODEL, FakePool(conn), embed_many))
+    asyncio.run(emb.embed_cached(["b"], MODEL, FakePool(conn), embed_many))
+
+    prunes = [c for c in conn.calls if c[0] == "execute" and "DELETE FROM memory_embedding_cache" in c[1]]
+    assert prunes == [("execute", emb._DB_CACHE_PRUNE, (30,))]
+
+
+def test_prune_disabled_with_zero_ttl(monkeypatch):
+    monkeypatch.setattr(emb, "_DB_CACHE_TTL_DAYS", 0)
+    conn = FakeConn()
+
+    async def embed_many(texts):
+        return [[1.0] for _ in texts]
+
+    asyncio.run(emb.embed_cached(["a"], MODEL, FakePool(conn), embed_many))
+    assert not [c for c in conn.calls if c[0] == "execute"]
+
+
+def test_batcher_coalesces_concurrent_requests(monkeypatch):
+    monkeypatch.setattr(emb, "get_embedding_model", lambda: MODEL)
+    batches = []
+
+    def fake_get_embeddings(texts):
+        batches.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    monkeypatch.setattr(emb, "get_embeddings", fake_get_embeddings)
+    batcher = emb.EmbeddingBatcher(max_batch=10, max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(t) for t in ["a", "bb", "ccc"]))
+
+    assert asyncio.run(run()) == [[1.0], [2.0], [3.0]]
+    assert batches == [["a", "bb", "ccc"]]
+
+
+def test_batcher_skips_empty_and_cached(monkeypatch):
+    monkeypatch.setattr(emb, "get_embedding_model", lambda: MODEL)
+    monkeypatch.setattr(emb, "get_embeddings", lambda texts: pytest.fail("geen API-call verwacht"))
+    emb.put_cached_embedding(MODEL, "bekend", [9.0])
+    batcher = emb.EmbeddingBatcher()
+
+    async def run():
+        return await batcher.submit("  "), await batcher.submit("bekend")
+
+    assert asyncio.run(run()) == (None, [9.0])
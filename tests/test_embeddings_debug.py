@@ -0,0 +1,52 @@
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import api.routes.embeddings_debug as dbg
+from tests.conftest import FakeConn, FakePool
+
+
+@pytest.fixture
+def setup(monkeypatch):
+    monkeypatch.setenv("REQUIRE_EMBEDDINGS_DEBUG", "1")
+    pool = FakePool(FakeConn(fetchrow_result={"id": 42, "has_vec": False}))
+    monkeypatch.setattr(dbg, "_db", lambda: pool)
+    monkeypatch.setattr(dbg, "vector_codec_ready", lambda: True)
+
+    seen = {}
+
+    async def fake_embed(p, model, texts):
+        seen["in_use"] = p.in_use
+        seen["texts"] = texts
+        return [[0.1, 0.2]]
+
+    monkeypatch.setattr(dbg, "_embed", fake_embed)
+    app = FastAPI()
+    app.include_router(dbg.router)
+    return TestClient(app), pool, seen
+
+
+def test_store_releases_connection_before_embedding(setup):
+    client, pool, seen = setup
+    res = client.post("/debug/embeddings/store", json={"user_id": str(uuid.uuid4()), "text": "hoi"})
+
+    assert res.status_code == 200, res.text
+    assert res.json()["embedded_now"] is True
+    assert seen == {"in_use": 0, "texts": ["hoi"]}
+    assert pool.max_in_use == 1
+    assert pool.acquired == 2  # upsert, daarna de UPDATE
+    update = pool.conn.calls[-1]
+    assert update[0] == "execute" and "SET embedding" in update[1]
+    assert update[2] == ([0.1, 0.2], 42)
+
+
+def test_store_skips_embedding_when_vector_exists(setup):
+    client, pool, seen = setup
+    pool.conn.fetchrow_result = {"id": 7, "has_vec": True}
+    res = client.post("/debug/embeddings/store", json={"user_id": str(uuid.uuid4()), "text": "hoi"})
+
+    assert res.json()["embedded_now"] is False
+    assert seen == {}
+    assert pool.acquired == 1
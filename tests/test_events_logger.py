@@ -0,0 +1,107 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.events import logger as events_logger
+from api.routes import events as events_routes
+
+
+def test_log_event_writes_before_returning(monkeypatch, fake_pool):
+    monkeypatch.setattr(events_logger, "get_pool", lambda: fake_pool)
+
+    asyncio.run(
+        events_logger.log_event("ask_explain", tags=[" a ", "", "b"], payload={"action": "x"})
+    )
+
+    # geen queue: de INSERT is al gedaan als log_event terugkeert
+    (kind, sql, args), = fake_pool.conn.calls
+    assert kind == "execute"
+    assert sql == events_logger.INSERT_EVENT_SQL
+    assert args == (None, None, "ask_explain", "api", None, ["a", "b"], {"action": "x"})
+
+
+def test_log_event_caps_tags_at_50(monkeypatch, fake_pool):
+    monkeypatch.setattr(events_logger, "get_pool", lambda: fake_pool)
+
+    asyncio.run(events_logger.log_event("x", tags=[f"t{i}" for i in range(80)]))
+
+    tags = fake_pool.conn.calls[0][2][5]
+    assert tags == [f"t{i}" for i in range(50)]
+
+
+def test_log_event_without_pool_is_noop(monkeypatch):
+    monkeypatch.setattr(events_logger, "get_pool", lambda: None)
+    assert asyncio.run(events_logger.log_event("x")) is None
+
+
+def test_log_events_uses_one_copy(monkeypatch, fake_pool):
+    monkeypatch.setattr(events_logger, "get_pool", lambda: fake_pool)
+
+    n = asyncio.run(
+        events_logger.log_events(
+            [
+                {"event_type": "a", "user_id": "u1"},
+                {"event_type": "b", "confidence": 0.5, "tags": ["t"]},
+            ]
+        )
+    )
+
+    assert n == 2
+    (kind, table, records, columns), = fake_pool.conn.calls
+    assert kind == "copy" and table == "learning_events"
+    assert columns == events_logger._COLUMNS
+    assert records == [
+        ("u1", None, "a", "api", None, [], {}),
+        (None, None, "b", "api", 0.5, ["t"], {}),
+    ]
+
+
+def test_log_events_propagates_copy_errors(monkeypatch, fake_pool):
+    async def boom(*a, **k):
+        raise RuntimeError("copy failed")
+
+    fake_pool.conn.copy_records_to_table = boom
+    monkeypatch.setattr(events_logger, "get_pool", lambda: fake_pool)
+
+    try:
+        asyncio.run(events_logger.log_events([{"event_type": "a"}]))
+    except RuntimeError as e:
+        assert "copy failed" in str(e)
+    else:
+        raise AssertionError("COPY-fout moet naar de caller")
+
+
+def test_log_events_empty(monkeypatch, fake_pool):
+    monkeypatch.setattr(events_logger, "get_pool", lambda: fake_pool)
+    assert asyncio.run(events_logger.log_events([])) == 0
+    assert fake_pool.conn.calls == []
+
+
+def test_log_batch_route_writes_one_copy(monkeypatch, fake_pool):
+    monkeypatch.setattr(events_logger, "get_pool", lambda: fake_pool)
+    monkeypatch.setattr(events_routes, "get_pool", lambda: fake_pool)
+    app = FastAPI()
+    app.include_router(events_routes.router)
+
+    res = TestClient(app).post(
+        "/events/log/batch",
+        json={"events": [{"event_type": "aa", "tags": [" t "]}, {"event_type": "bb", "user_id": "u1"}]},
+    )
+
+    assert res.status_code == 200
+    assert res.json() == {"ok": True, "count": 2}
+    (kind, _, records, _), = fake_pool.conn.calls
+    assert kind == "copy"
+    assert records == [
+        (None, None, "aa", "api", None, ["t"], {}),
+        ("u1", None, "bb", "api", None, [], {}),
+    ]
+
+
+def test_log_batch_route_rejects_empty_batch(monkeypatch, fake_pool):
+    monkeypatch.setattr(events_routes, "get_pool", lambda: fake_pool)
+    app = FastAPI()
+    app.include_router(events_routes.router)
+
+    assert TestClient(app).post("/events/log/batch", json={"events": []}).status_code == 422
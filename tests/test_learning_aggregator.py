@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import orjson
+
+from api.learning import aggregator as agg
+from tests.conftest import FakeConn
+
+T0 = datetime(2026, 10, 15, 12, 0, tzinfo=timezone.utc)
+
+
+def _ev(event_type, tags=(), minutes_ago=0, action=None):
+    return {
+        "event_type": event_type,
+        "tags": list(tags),
+        "created_at": T0 - timedelta(minutes=minutes_ago),
+        "action": action,
+    }
+
+
+def test_summary_counts_and_breaks_ties_by_first_seen():
+    # events zoals fetch_events ze levert: nieuwste eerst
+    events = [
+        _ev("b", ["y", " x "], 0),
+        _ev("a", ["x"], 1),
+        _ev("", ["y", ""], 2),
+        _ev("a", [], 3),
+        _ev("b", [], 4),
+    ]
+    out = agg.aggregate_summary(events)
+
+    assert out["total"] == 5
+    assert out["last_created_at"] == T0.isoformat()
+    # a en b beide 2x: b kwam eerst voor
+    assert out["top_event_types"] == [
+        {"event_type": "b", "count": 2},
+        {"event_type": "a", "count": 2},
+        {"event_type": "unknown", "count": 1},
+    ]
+    assert out["top_tags"] == [{"tag": "y", "count": 2}, {"tag": "x", "count": 2}]
+
+
+def test_summary_of_no_events():
+    assert agg.aggregate_summary([]) == {
+        "total": 0,
+        "last_created_at": None,
+        "top_event_types": [],
+        "top_tags": [],
+    }
+
+
+def test_summary_sql_maps_row_and_orders_ties_by_first_seen():
+    conn = FakeConn(
+        fetchrow_result={
+            "total": 5,
+            "last_created_at": T0,
+            "type_keys": ["b", "a"],
+            "type_counts": [2, 2],
+            "tag_keys": ["y"],
+            "tag_counts": [2],
+        }
+    )
+    out = asyncio.run(agg.aggregate_summary_sql(conn, limit=50, window_minutes=60, user_id="u1", tag="y"))
+
+    assert out == {
+        "total": 5,
+        "last_created_at": T0.isoformat(),
+        "top_event_types": [{"event_type": "b", "count": 2}, {"event_type": "a", "count": 2}],
+        "top_tags": [{"tag": "y", "count": 2}],
+    }
+    _, sql, params = conn.calls[0]
+    assert "LIMIT 50" in sql
+    assert "user_id = $3" in sql and "$4 = ANY(tags)" in sql
+    assert params[2:] == ("u1", "y")
+    assert params[1] - params[0] == timedelta(minutes=60)
+    # tie-break = eerste voorkomen in recency-volgorde, niet alfabetisch
+    assert "ORDER BY n DESC, first" in sql
+    assert "ORDER BY n DESC, k" not in sql
+    assert "row_number() OVER (ORDER BY created_at DESC)" in sql
+
+
+def test_events_where_only_adds_given_filters():
+    where, params = agg.events_where(30, session_id="s", event_type="e")
+    assert where == "created_at >= $1 AND created_at <= $2 AND session_id = $3 AND event_type = $4"
+    assert params[2:] == ["s", "e"]
+
+
+def test_derive_patterns_uses_projected_action():
+    events = [_ev("chat", action="search") for _ in range(5)] + [_ev("ask_explain") for _ in range(4)]
+    keys = {p.key: p for p in agg.derive_patterns(events)}
+
+    assert set(keys) == {"tool_usage:search", "explain_level"}
+    assert keys["tool_usage:search"].value == {"count": 5}
+    assert keys["explain_level"].confidence == 0.55
+
+
+def test_upsert_patterns_sends_one_statement():
+    conn = FakeConn()
+    patterns = agg.derive_patterns([_ev("correction") for _ in range(6)])
+    assert asyncio.run(agg.upsert_patterns(conn, patterns)) == 1
+
+    (call,) = conn.calls
+    assert call[1] == agg.UPSERT_PATTERNS_SQL
+    subjects, types, keys, values, confs, evidence, _ = call[2]
+    assert keys == ["interaction:high_friction"]
+    assert orjson.loads(values[0]) == {"count": 6}
+    assert asyncio.run(agg.upsert_patterns(conn, [])) == 0
@@ -0,0 +1,75 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import api.memory as memory_kv
+from tests.conftest import FakeConn, FakePool
+
+
+def _row(key, value="v"):
+    return {"key": key, "value": value, "source": "api", "updated_at_iso": "2026-10-15T00:00:00.000000Z"}
+
+
+@pytest.fixture
+def client_and_conn(monkeypatch):
+    conn = FakeConn(fetch_result=[_row("b"), _row("a", "😀")])
+    pool = FakePool(conn)
+
+    async def _get_pool():
+        return pool
+
+    monkeypatch.setattr(memory_kv, "_get_pool", _get_pool)
+    app = FastAPI()
+    app.include_router(memory_kv.router)
+    return TestClient(app), conn
+
+
+def test_memory_all_is_unlimited_by_default(client_and_conn):
+    client, conn = client_and_conn
+    res = client.get("/memory/all")
+
+    assert res.status_code == 200
+    body = res.json()
+    assert body["count"] == 2
+    assert list(body["items"]) == ["b", "a"]
+    assert body["items"]["a"] == {
+        "key": "a",
+        "value": "😀",
+        "source": "api",
+        "updated_at": "2026-10-15T00:00:00.000000Z",
+    }
+    _, sql, args = conn.calls[-1]
+    assert sql == memory_kv.SELECT_ALL_SQL
+    assert args == (None, 0)  # LIMIT NULL -> alle rows
+
+
+def test_memory_all_passes_limit_and_offset(client_and_conn):
+    client, conn = client_and_conn
+    assert client.get("/memory/all", params={"limit": 5, "offset": 10}).status_code == 200
+    assert conn.calls[-1][2] == (5, 10)
+
+
+def test_memory_all_rejects_invalid_paging(client_and_conn):
+    client, _ = client_and_conn
+    assert client.get("/memory/all", params={"limit": 0}).status_code == 422
+    assert client.get("/memory/all", params={"offset": -1}).status_code == 422
+
+
+def test_validated_variant_is_gone(client_and_conn):
+    client, _ = client_and_conn
+    assert client.get("/memory/all/validated").status_code == 404
+
+
+def test_uses_shared_pool_and_ensures_schema_once(monkeypatch):
+    import asyncio
+
+    pool = FakePool()
+    monkeypatch.setattr(memory_kv, "get_pool", lambda: pool)
+    monkeypatch.setattr(memory_kv, "_schema_ready", False)
+
+    async def run():
+        return await asyncio.gather(*(memory_kv._get_pool() for _ in range(5)))
+
+    assert asyncio.run(run()) == [pool] * 5
+    ddl = [c for c in pool.conn.calls if c[0] == "execute" and "CREATE TABLE" in c[1]]
+    assert len(ddl) == 1
@@ -0,0 +1,107 @@
+import asyncio
+import importlib.util
+import json
+from pathlib import Path
+
+import pytest
+
+import api.chat
+from api.memory import behavior
+
+# api/memory.py wordt overschaduwd door de package api/memory/, dus laden via het pad
+_MEMORY_PY = Path(__file__).resolve().parents[1] / "api" / "memory.py"
+
+
+@pytest.fixture(autouse=True)
+def fresh_writer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(behavior, "_selflearn_state", None)
+    monkeypatch.setattr(behavior, "_selflearn_mtime_ns", None)
+    monkeypatch.setattr(behavior, "_pending_updates", [])
+    monkeypatch.setattr(behavior, "_last_selflearn_flush", 0.0)
+    monkeypatch.setattr(behavior, "_selflearn_flush_task", None)
+    monkeypatch.setattr(behavior, "_after_write", [])
+    return behavior
+
+
+@pytest.fixture
+def memory():
+    spec = importlib.util.spec_from_file_location("api_memory_file", _MEMORY_PY)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _read():
+    return json.loads(behavior.ZELFLEREN_PATH.read_bytes())
+
+
+def test_chat_has_the_behavior_writer():
+    assert api.chat.record_behavior_scores is not None
+    assert api.chat.record_behavior_scores is behavior.record_behavior_scores
+
+
+def test_chat_update_behavior_memory_reaches_disk():
+    api.chat._update_behavior_memory(3, {"emotion": "rustig"})
+
+    assert _read()["users"]["3"]["behavior_log"][-1]["scores"] == {"emotion": "rustig"}
+
+
+def test_without_event_loop_scores_are_written_directly():
+    behavior.record_behavior_scores(7, {"emotion": "blij"})
+
+    block = _read()["users"]["7"]
+    assert block["behavior_log"][-1]["scores"] == {"emotion": "blij"}
+    assert behavior._pending_updates == []
+
+
+def test_chat_scores_and_memory_updates_share_one_flush(memory, monkeypatch):
+    monkeypatch.setattr(behavior, "SELFLEARN_FLUSH_SECONDS", 0.01)
+    payload = memory.MemoryUpdate(habits={"lezen": 2})
+
+    async def run():
+        behavior.record_behavior_scores(1, {"n": 1})
+        behavior.queue_selflearn_update(1, lambda block: memory._apply_update(block, payload))
+        behavior.record_behavior_scores(1, {"n": 2})
+        assert not behavior.ZELFLEREN_PATH.exists()  # nog niets op disk
+        await behavior._selflearn_flush_task
+
+    asyncio.run(run())
+
+    block = _read()["users"]["1"]
+    assert [e["scores"] for e in block["behavior_log"]] == [{"n": 1}, {"n": 2}]
+    assert block["habits"] == {"lezen": 2}
+    assert behavior._pending_updates == []
+    assert memory._list_snapshots("selflearning")
+
+
+def test_external_change_is_reloaded_with_pending_updates_on_top():
+    behavior.record_behavior_scores(1, {"n": 1})
+    behavior.ZELFLEREN_PATH.write_text(json.dumps({"users": {"2": {"profile": {"x": 1}}}}))
+
+    behavior._pending_updates.append(
+        (1, lambda block: behavior.apply_scores_to_user_block(block, {"n": 2}), "ts")
+    )
+    data = behavior.current_selflearn()
+
+    assert data["users"]["2"] == {"profile": {"x": 1}}
+    assert data["users"]["1"]["behavior_log"][-1]["scores"] == {"n": 2}
+
+
+def test_replace_drops_pending_updates():
+    behavior._pending_updates.append((1, lambda block: None, "ts"))
+    behavior.replace_selflearn({"users": {"5": {"profile": {}}}})
+
+    assert behavior._pending_updates == []
+    assert behavior.current_selflearn() == {"users": {"5": {"profile": {}}}}
+
+
+def test_flush_errors_are_logged(monkeypatch, caplog):
+    def boom(raw):
+        raise OSError("disk vol")
+
+    monkeypatch.setattr(behavior, "_write_selflearn", boom)
+    behavior._pending_updates.append((1, lambda block: None, "ts"))
+    behavior.flush_selflearning()
+
+    assert "zelfleren flush failed" in caplog.text
@@ -0,0 +1,18 @@
+import time
+from datetime import datetime, timedelta
+
+from api.timeutil import now_iso
+
+
+def test_now_iso_is_naive_utc_with_z_suffix():
+    ts = now_iso()
+    assert ts.endswith("Z")
+    parsed = datetime.fromisoformat(ts[:-1])
+    assert parsed.tzinfo is None
+    assert abs(datetime.utcnow() - parsed) < timedelta(seconds=5)
+
+
+def test_now_iso_is_not_cached():
+    first = now_iso()
+    time.sleep(0.005)  # ruim onder de oude 100ms-cache
+    assert now_iso() > first
@@ -0,0 +1,107 @@
+import asyncio
+
+import orjson
+import pytest
+
+import api.chat_logger as chat_logger
+import api.dashboard as dashboard
+
+
+# ---------- dashboard last_session.json ----------
+
+@pytest.fixture
+def last_session(tmp_path, monkeypatch):
+    monkeypatch.setattr(dashboard, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(dashboard, "LAST_SESSION_PATH", tmp_path / "last_session.json")
+    monkeypatch.setattr(dashboard, "_last_session_state", None)
+    monkeypatch.setattr(dashboard, "_last_session_mtime_ns", None)
+    monkeypatch.setattr(dashboard, "_pending_actions", {})
+    monkeypatch.setattr(dashboard, "_last_flush_ts", 0.0)
+    monkeypatch.setattr(dashboard, "_flush_task", None)
+    return dashboard.LAST_SESSION_PATH
+
+
+def test_last_session_coalesces_marks_into_one_write(last_session, monkeypatch):
+    monkeypatch.setattr(dashboard, "LAST_SESSION_FLUSH_SECONDS", 0.01)
+
+    async def run():
+        for ts in ("t1", "t2", "t3"):
+            dashboard._mark_last_action("1", ts)
+            dashboard._schedule_last_session_flush()
+        assert not last_session.exists()
+        await dashboard._flush_task
+
+    asyncio.run(run())
+
+    data = orjson.loads(last_session.read_bytes())
+    assert data["users"]["1"] == {"last_login": None, "last_logout": None, "last_action": "t3"}
+    assert dashboard._pending_actions == {}
+
+
+def test_last_session_keeps_external_writes(last_session):
+    dashboard._mark_last_action("1", "t1")
+    # ander proces/helper schrijft het bestand tussendoor
+    last_session.write_bytes(orjson.dumps({"version": 1, "users": {"2": {"last_login": "x"}}}))
+    dashboard.flush_last_session()
+
+    users = orjson.loads(last_session.read_bytes())["users"]
+    assert users["2"] == {"last_login": "x"}
+    assert users["1"]["last_action"] == "t1"
+
+
+def test_last_session_flush_without_pending_is_noop(last_session):
+    dashboard.flush_last_session()
+    assert not last_session.exists()
+
+
+# ---------- chat_history.jsonl ----------
+
+@pytest.fixture
+def chat_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat_logger, "LOG_DIR", tmp_path)
+    monkeypatch.setattr(chat_logger, "LOG_FILE", tmp_path / "chat_history.jsonl")
+    monkeypatch.setattr(chat_logger, "_queue", None)
+    monkeypatch.setattr(chat_logger, "_writer_task", None)
+    monkeypatch.setattr(chat_logger, "_dropped", 0)
+    return chat_logger.LOG_FILE
+
+
+def _lines(path):
+    return [orjson.loads(line) for line in path.read_bytes().splitlines()]
+
+
+def test_chat_log_without_loop_writes_directly(chat_log):
+    chat_logger.log_chat("hoi 😀", "hallo", {"user_id": 1})
+
+    (entry,) = _lines(chat_log)
+    assert entry["message"] == "hoi 😀"
+    assert entry["meta"] == {"user_id": 1}
+    assert entry["ts"].endswith("Z")
+
+
+def test_chat_log_queue_is_drained_in_order_on_close(chat_log):
+    async def run():
+        for i in range(50):
+            chat_logger.log_chat(f"m{i}", "r")
+        await chat_logger.close_chat_log()
+
+    asyncio.run(run())
+
+    assert [e["message"] for e in _lines(chat_log)] == [f"m{i}" for i in range(50)]
+    assert chat_logger._writer_task is None
+
+
+def test_chat_log_full_queue_drops_and_counts(chat_log, monkeypatch, capsys):
+    monkeypatch.setattr(chat_logger, "_QUEUE_MAX", 1)
+
+    async def run():
+        chat_logger.log_chat("a", "r")  # in de queue
+        chat_logger.log_chat("b", "r")  # queue vol -> gedropt
+        assert chat_logger._dropped == 1
+        await chat_logger.close_chat_log()
+
+    asyncio.run(run())
+
+    assert [e["message"] for e in _lines(chat_log)] == ["a"]
+    assert chat_logger._dropped == 0
+    assert "1 chat log line(s) dropped" in capsys.readouterr().out